@@ -0,0 +1,305 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'partials/result_partial.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_warning = resolve('warning')
+    l_0_error = resolve('error')
+    l_0_busy = resolve('busy')
+    l_0_job = resolve('job')
+    l_0_position = resolve('position')
+    l_0_result = resolve('result')
+    l_0_stream_url = resolve('stream_url')
+    l_0_priced = resolve('priced')
+    l_0_cheapest = resolve('cheapest')
+    l_0_departures = resolve('departures')
+    l_0_arrivals = resolve('arrivals')
+    l_0_insight = resolve('insight')
+    l_0_freshness = resolve('freshness')
+    try:
+        t_1 = environment.filters['first']
+    except KeyError:
+        @internalcode
+        def t_1(*unused):
+            raise TemplateRuntimeError("No filter named 'first' found.")
+    try:
+        t_2 = environment.filters['format']
+    except KeyError:
+        @internalcode
+        def t_2(*unused):
+            raise TemplateRuntimeError("No filter named 'format' found.")
+    try:
+        t_3 = environment.filters['list']
+    except KeyError:
+        @internalcode
+        def t_3(*unused):
+            raise TemplateRuntimeError("No filter named 'list' found.")
+    try:
+        t_4 = environment.filters['map']
+    except KeyError:
+        @internalcode
+        def t_4(*unused):
+            raise TemplateRuntimeError("No filter named 'map' found.")
+    try:
+        t_5 = environment.filters['min']
+    except KeyError:
+        @internalcode
+        def t_5(*unused):
+            raise TemplateRuntimeError("No filter named 'min' found.")
+    try:
+        t_6 = environment.filters['safe']
+    except KeyError:
+        @internalcode
+        def t_6(*unused):
+            raise TemplateRuntimeError("No filter named 'safe' found.")
+    try:
+        t_7 = environment.filters['selectattr']
+    except KeyError:
+        @internalcode
+        def t_7(*unused):
+            raise TemplateRuntimeError("No filter named 'selectattr' found.")
+    try:
+        t_8 = environment.filters['unique']
+    except KeyError:
+        @internalcode
+        def t_8(*unused):
+            raise TemplateRuntimeError("No filter named 'unique' found.")
+    try:
+        t_9 = environment.tests['none']
+    except KeyError:
+        @internalcode
+        def t_9(*unused):
+            raise TemplateRuntimeError("No test named 'none' found.")
+    pass
+    if (undefined(name='warning') if l_0_warning is missing else l_0_warning):
+        pass
+        yield '\n<div class="card" style="border-color: var(--warning); background: rgba(245, 158, 11, 0.1); margin-bottom: 1rem;">\n    <div style="color: var(--warning); display: flex; align-items: center; gap: 0.5rem; padding: 1rem;">\n        <span>⚠️</span>\n        <span>'
+        yield escape((undefined(name='warning') if l_0_warning is missing else l_0_warning))
+        yield '</span>\n    </div>\n</div>\n'
+    yield '\n\n'
+    if (undefined(name='error') if l_0_error is missing else l_0_error):
+        pass
+        yield '\n<div class="card">\n    <div class="error">\n        <strong>エラー:</strong> '
+        yield escape((undefined(name='error') if l_0_error is missing else l_0_error))
+        yield '\n    </div>\n</div>\n'
+    elif (undefined(name='busy') if l_0_busy is missing else l_0_busy):
+        pass
+        yield '\n<div class="card" style="border-color: var(--warning);">\n    <div style="color: var(--warning); display: flex; align-items: center; gap: 0.5rem; padding: 1rem;">\n        <span>⏳</span>\n        <span>'
+        yield escape((undefined(name='busy') if l_0_busy is missing else l_0_busy))
+        yield '</span>\n    </div>\n    <!-- 入力済みのフォームをそのまま再送する -->\n    <button type="submit" hx-post="/analyze" hx-include="#analyze-form" hx-target="#result" hx-swap="innerHTML">\n        もう一度試す 🔁\n    </button>\n</div>\n'
+    elif (undefined(name='job') if l_0_job is missing else l_0_job):
+        pass
+        yield '\n<!-- 完了するまで1秒ごとに状態を取得し直し、結果が出たらこの要素ごと置き換える -->\n<div class="card" hx-get="/analyze/jobs/'
+        yield escape(environment.getattr((undefined(name='job') if l_0_job is missing else l_0_job), 'id'))
+        yield '" hx-trigger="every 1s" hx-target="this" hx-swap="outerHTML">\n    <div class="stream-status">\n        '
+        if (undefined(name='position') if l_0_position is missing else l_0_position):
+            pass
+            yield '順番待ち中です（前に '
+            yield escape((undefined(name='position') if l_0_position is missing else l_0_position))
+            yield ' 件）...'
+        elif (environment.getattr((undefined(name='job') if l_0_job is missing else l_0_job), 'status') == 'queued'):
+            pass
+            yield 'まもなく分析を開始します...'
+        else:
+            pass
+            yield 'AI が分析中...'
+        yield '\n    </div>\n</div>\n'
+    elif (undefined(name='result') if l_0_result is missing else l_0_result):
+        pass
+        yield '\n<div class="card result-container"'
+        if (undefined(name='stream_url') if l_0_stream_url is missing else l_0_stream_url):
+            pass
+            yield ' hx-ext="sse" sse-connect="'
+            yield escape((undefined(name='stream_url') if l_0_stream_url is missing else l_0_stream_url))
+            yield '" sse-close="done"'
+        yield '>\n    <div class="result-header">\n        <h2>分析結果</h2>\n        <p class="route">'
+        yield escape(environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'route'))
+        yield '</p>\n    </div>\n\n    <!-- AI による分析セクション -->\n    <div class="options-section">\n        <h3>AI が見つけた隠れたルート</h3>\n        '
+        if (undefined(name='stream_url') if l_0_stream_url is missing else l_0_stream_url):
+            pass
+            yield '\n        <div id="stream-options" sse-swap="option" hx-swap="beforeend"></div>\n        <div class="stream-status" sse-swap="done">AI が分析中...</div>\n        '
+        else:
+            pass
+            yield '\n        '
+            for l_1_option in environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'hidden_options'):
+                _loop_vars = {}
+                pass
+                yield '\n        '
+                template = environment.get_template('partials/option_card.html', 'partials/result_partial.html')
+                for event in template.root_render_func(template.new_context(context.get_all(), True, {'option': l_1_option, 'arrivals': l_0_arrivals, 'cheapest': l_0_cheapest, 'departures': l_0_departures, 'insight': l_0_insight, 'priced': l_0_priced})):
+                    yield event
+                yield '\n        '
+            l_1_option = missing
+            yield '\n        '
+        yield '\n    </div>\n\n    <!-- 日付別最安値カレンダー（柔軟日程検索時） -->\n    '
+        if environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'price_calendar'):
+            pass
+            yield '\n    '
+            l_0_priced = t_3(context.eval_ctx, t_7(context, environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'price_calendar'), 'min_price'))
+            context.vars['priced'] = l_0_priced
+            context.exported_vars.add('priced')
+            yield '\n    '
+            l_0_cheapest = (environment.getattr(t_5(environment, (undefined(name='priced') if l_0_priced is missing else l_0_priced), attribute='min_price'), 'min_price') if (undefined(name='priced') if l_0_priced is missing else l_0_priced) else None)
+            context.vars['cheapest'] = l_0_cheapest
+            context.exported_vars.add('cheapest')
+            yield '\n    <div class="calendar-section">\n        <h3>日付別の最安値</h3>\n        <div class="price-calendar">\n            '
+            for l_1_day in environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'price_calendar'):
+                _loop_vars = {}
+                pass
+                yield '\n            <div class="calendar-day'
+                if ((not t_9(environment.getattr(l_1_day, 'min_price'))) and (environment.getattr(l_1_day, 'min_price') == (undefined(name='cheapest') if l_0_cheapest is missing else l_0_cheapest))):
+                    pass
+                    yield ' cheapest'
+                yield '">\n                <div class="calendar-date">'
+                yield escape(environment.getattr(l_1_day, 'date')[5:])
+                yield '</div>\n                <div class="calendar-price">\n                    '
+                if (not t_9(environment.getattr(l_1_day, 'min_price'))):
+                    pass
+                    yield escape(context.call(environment.getattr('{:,.0f}', 'format'), environment.getattr(l_1_day, 'min_price'), _loop_vars=_loop_vars))
+                    yield ' '
+                    yield escape(environment.getattr(l_1_day, 'currency'))
+                else:
+                    pass
+                    yield '—'
+                yield '\n                </div>\n            </div>\n            '
+            l_1_day = missing
+            yield '\n        </div>\n    </div>\n    '
+        yield '\n\n    <!-- 近隣空港の組み合わせ別最安値（近隣空港検索時） -->\n    '
+        if environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'metro_matrix'):
+            pass
+            yield '\n    '
+            l_0_departures = t_3(context.eval_ctx, t_8(environment, t_4(context, environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'metro_matrix'), attribute='departure')))
+            context.vars['departures'] = l_0_departures
+            context.exported_vars.add('departures')
+            yield '\n    '
+            l_0_arrivals = t_3(context.eval_ctx, t_8(environment, t_4(context, environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'metro_matrix'), attribute='arrival')))
+            context.vars['arrivals'] = l_0_arrivals
+            context.exported_vars.add('arrivals')
+            yield '\n    '
+            l_0_priced = t_3(context.eval_ctx, t_7(context, environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'metro_matrix'), 'min_price'))
+            context.vars['priced'] = l_0_priced
+            context.exported_vars.add('priced')
+            yield '\n    '
+            l_0_cheapest = (environment.getattr(t_5(environment, (undefined(name='priced') if l_0_priced is missing else l_0_priced), attribute='min_price'), 'min_price') if (undefined(name='priced') if l_0_priced is missing else l_0_priced) else None)
+            context.vars['cheapest'] = l_0_cheapest
+            context.exported_vars.add('cheapest')
+            yield '\n    <div class="calendar-section">\n        <h3>空港の組み合わせ別の最安値</h3>\n        <table class="metro-matrix">\n            <thead>\n                <tr>\n                    <th>出発 \\ 到着</th>\n                    '
+            for l_1_arrival in (undefined(name='arrivals') if l_0_arrivals is missing else l_0_arrivals):
+                _loop_vars = {}
+                pass
+                yield '<th>'
+                yield escape(l_1_arrival)
+                yield '</th>'
+            l_1_arrival = missing
+            yield '\n                </tr>\n            </thead>\n            <tbody>\n                '
+            for l_1_departure in (undefined(name='departures') if l_0_departures is missing else l_0_departures):
+                _loop_vars = {}
+                pass
+                yield '\n                <tr>\n                    <th>'
+                yield escape(l_1_departure)
+                yield '</th>\n                    '
+                for l_2_arrival in (undefined(name='arrivals') if l_0_arrivals is missing else l_0_arrivals):
+                    l_2_cell = missing
+                    _loop_vars = {}
+                    pass
+                    yield '\n                    '
+                    l_2_cell = t_1(environment, t_7(context, t_7(context, environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'metro_matrix'), 'departure', 'equalto', l_1_departure), 'arrival', 'equalto', l_2_arrival))
+                    _loop_vars['cell'] = l_2_cell
+                    yield '\n                    <td class="metro-cell'
+                    if (((undefined(name='cell') if l_2_cell is missing else l_2_cell) and (not t_9(environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'min_price')))) and (environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'min_price') == (undefined(name='cheapest') if l_0_cheapest is missing else l_0_cheapest))):
+                        pass
+                        yield ' cheapest'
+                    yield '">\n                        '
+                    if ((undefined(name='cell') if l_2_cell is missing else l_2_cell) and (not t_9(environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'min_price')))):
+                        pass
+                        yield '\n                        <div class="calendar-price">'
+                        yield escape(context.call(environment.getattr('{:,.0f}', 'format'), environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'min_price'), _loop_vars=_loop_vars))
+                        yield ' '
+                        yield escape(environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'currency'))
+                        yield '</div>\n                        '
+                        if environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'airline'):
+                            pass
+                            yield '<div class="calendar-date">'
+                            yield escape(environment.getattr((undefined(name='cell') if l_2_cell is missing else l_2_cell), 'airline'))
+                            yield '</div>'
+                        yield '\n                        '
+                    else:
+                        pass
+                        yield '—'
+                    yield '\n                    </td>\n                    '
+                l_2_arrival = l_2_cell = missing
+                yield '\n                </tr>\n                '
+            l_1_departure = missing
+            yield '\n            </tbody>\n        </table>\n    </div>\n    '
+        yield '\n\n    <!-- 実際のフライトデータセクション -->\n    '
+        if (environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'raw_data') and environment.getattr(environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'raw_data'), 'offers')):
+            pass
+            yield '\n    <div class="real-flights-section"\n        style="margin-top: 2rem; border-top: 1px solid var(--border-color); padding-top: 1.5rem;">\n        <h3 style="color: var(--text-primary); margin-bottom: 1rem;">実際の最安値・候補フライト</h3>\n        '
+            if environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'price_insight'):
+                pass
+                yield '\n        '
+                l_0_insight = environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'price_insight')
+                context.vars['insight'] = l_0_insight
+                context.exported_vars.add('insight')
+                yield '\n        <div class="price-insight">\n            📊 最安値 '
+                yield escape(context.call(environment.getattr('{:,.0f}', 'format'), environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'price')))
+                yield ' は観測運賃の <strong>'
+                yield escape(t_2('%.0f', environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'cheaper_than_percent')))
+                yield '%</strong> より安い価格です\n            <span class="price-insight-detail">\n                （中央値 '
+                yield escape(context.call(environment.getattr('{:,.0f}', 'format'), environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'median_price')))
+                if (not t_9(environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'min_price_30d'))):
+                    pass
+                    yield ' / 30日最安 '
+                    yield escape(context.call(environment.getattr('{:,.0f}', 'format'), environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'min_price_30d')))
+                if (not t_9(environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'trend_per_day'))):
+                    pass
+                    yield ' / '
+                    yield escape(('値上がり傾向' if (environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'trend_per_day') > 0) else '値下がり傾向'))
+                yield ' · '
+                yield escape(environment.getattr((undefined(name='insight') if l_0_insight is missing else l_0_insight), 'sample_size'))
+                yield '件）\n            </span>\n        </div>\n        '
+            yield '\n        <div style="display: grid; gap: 1rem;">\n            '
+            for l_1_offer in environment.getattr(environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'raw_data'), 'offers'):
+                _loop_vars = {}
+                pass
+                yield '\n            <div\n                style="background: rgba(255, 255, 255, 0.05); padding: 1rem; border-radius: 8px; display: flex; justify-content: space-between; align-items: center;">\n                <div>\n                    <div style="font-weight: 600;">'
+                yield escape(environment.getattr(l_1_offer, 'airline'))
+                yield ' ('
+                yield escape(environment.getattr(l_1_offer, 'flight_number'))
+                yield ')</div>\n                    <div style="font-size: 0.85rem; color: var(--text-secondary);">'
+                yield escape(environment.getattr(l_1_offer, 'departure_time'))
+                yield ' → '
+                yield escape(environment.getattr(l_1_offer, 'arrival_time'))
+                yield '</div>\n                </div>\n                <div style="text-align: right;">\n                    <div style="color: var(--success); font-weight: 700;">'
+                yield escape(environment.getattr(l_1_offer, 'price'))
+                yield ' '
+                yield escape(environment.getattr(l_1_offer, 'currency'))
+                yield '</div>\n                    '
+                if environment.getattr(l_1_offer, 'booking_link'):
+                    pass
+                    yield '\n                    <a href="'
+                    yield escape(environment.getattr(l_1_offer, 'booking_link'))
+                    yield '" target="_blank"\n                        style="font-size: 0.75rem; color: var(--accent-primary); text-decoration: none; border-bottom: 1px solid var(--accent-primary);">予約サイトへ</a>\n                    '
+                yield '\n                </div>\n            </div>\n            '
+            l_1_offer = missing
+            yield '\n        </div>\n        <p style="font-size: 0.7rem; color: var(--text-secondary); margin-top: 0.8rem; font-style: italic;">Powered by\n            '
+            yield escape(environment.getattr(environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'raw_data'), 'source'))
+            if (undefined(name='freshness') if l_0_freshness is missing else l_0_freshness):
+                pass
+                yield ' · '
+                yield escape((undefined(name='freshness') if l_0_freshness is missing else l_0_freshness))
+            yield '</p>\n    </div>\n    '
+        yield '\n\n    <div class="tips-section">\n        <h3>価格操作回避のヒント</h3>\n        <div class="tips-content"'
+        if (undefined(name='stream_url') if l_0_stream_url is missing else l_0_stream_url):
+            pass
+            yield ' sse-swap="tips"'
+        yield '>\n            '
+        yield escape(t_6(environment.getattr((undefined(name='result') if l_0_result is missing else l_0_result), 'avoid_tips')))
+        yield '\n        </div>\n    </div>\n</div>\n'
+
+blocks = {}
+debug_info = '1=78&5=81&10=84&13=87&16=89&20=92&27=94&29=97&31=99&34=111&35=114&38=120&44=122&48=128&49=132&55=139&56=142&57=146&61=150&62=154&63=158&65=160&74=172&75=175&76=179&77=183&78=187&85=191&89=199&91=203&92=205&93=210&94=213&95=217&96=220&97=224&109=239&113=242&114=245&116=249&118=253&123=266&127=270&128=274&129=276&132=278&133=282&134=285&142=290&148=297&149=301'
\ No newline at end of file
@@ -0,0 +1,27 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'partials/option_card.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_option = resolve('option')
+    pass
+    yield '<div class="option-card">\n    <div class="option-route">'
+    yield escape(environment.getattr((undefined(name='option') if l_0_option is missing else l_0_option), 'route'))
+    yield '</div>\n    <div class="option-details">\n        <span class="price">'
+    yield escape(environment.getattr((undefined(name='option') if l_0_option is missing else l_0_option), 'price'))
+    yield '</span>\n        <span class="save">'
+    yield escape(environment.getattr((undefined(name='option') if l_0_option is missing else l_0_option), 'save'))
+    yield ' 節約</span>\n    </div>\n    '
+    if environment.getattr((undefined(name='option') if l_0_option is missing else l_0_option), 'tips'):
+        pass
+        yield '\n    <div class="option-tips">💡 '
+        yield escape(environment.getattr((undefined(name='option') if l_0_option is missing else l_0_option), 'tips'))
+        yield '</div>\n    '
+    yield '\n</div>'
+
+blocks = {}
+debug_info = '2=13&4=15&5=17&7=19&8=22'
\ No newline at end of file
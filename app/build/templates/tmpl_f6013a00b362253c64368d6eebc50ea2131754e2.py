@@ -0,0 +1,28 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'index.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    parent_template = None
+    pass
+    parent_template = environment.get_template('base.html', 'index.html')
+    for name, parent_block in parent_template.blocks.items():
+        context.blocks.setdefault(name, []).append(parent_block)
+    yield from parent_template.root_render_func(context)
+
+def block_content(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    pass
+    yield '\n<div class="container">\n    <header>\n        <h1>✈️ Flight Optimizer AI</h1>\n        <p class="tagline">隠れた格安航空券を見つけ出す AI ツール</p>\n    </header>\n\n    <div class="card">\n        <form id="analyze-form" hx-post="/analyze" hx-target="#result" hx-swap="innerHTML" hx-indicator=".card">\n\n            <div class="form-group">\n                <label for="departure">出発地 🛫</label>\n                <input type="text" id="departure" name="departure" placeholder="例: 東京" list="departure-list"\n                    hx-get="/search-airports" hx-trigger="keyup changed delay:300ms" hx-target="#departure-list"\n                    autocomplete="off" required>\n                <datalist id="departure-list"></datalist>\n            </div>\n\n            <div class="form-group">\n                <label for="arrival">目的地 🛬</label>\n                <input type="text" id="arrival" name="arrival" placeholder="例: ロンドン" list="arrival-list"\n                    hx-get="/search-airports" hx-trigger="keyup changed delay:300ms" hx-target="#arrival-list"\n                    autocomplete="off" required>\n                <datalist id="arrival-list"></datalist>\n            </div>\n\n            <div class="form-group">\n                <label for="date">日程（オプション）📅</label>\n                <input type="date" id="date" name="date">\n            </div>\n\n            <div class="form-group">\n                <label for="flex_days">日程の柔軟性 🗓️</label>\n                <select id="flex_days" name="flex_days">\n                    <option value="0">指定日のみ</option>\n                    <option value="1">前後1日</option>\n                    <option value="3">前後3日</option>\n                </select>\n            </div>\n\n            <div class="form-group">\n                <label>\n                    <input type="checkbox" name="metro" value="1">\n                    近隣空港もまとめて検索（羽田/成田、関空/伊丹など同じ都市の空港）🛫\n                </label>\n            </div>\n\n            <!-- 実データを先に表示し、AI 分析は SSE で順次表示 -->\n            <input type="hidden" name="stream" value="1">\n\n            <button type="submit">\n                分析を開始 🔍\n            </button>\n        </form>\n    </div>\n\n    <div id="result">\n        <!-- 分析結果がここに表示されます -->\n    </div>\n</div>\n'
+
+blocks = {'content': block_content}
+debug_info = '1=12&3=17'
\ No newline at end of file
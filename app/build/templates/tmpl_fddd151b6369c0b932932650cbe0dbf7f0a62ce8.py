@@ -0,0 +1,51 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'base.html'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_static_url = resolve('static_url')
+    pass
+    yield '<!DOCTYPE html>\n<html lang="ja">\n<head>\n    <meta charset="UTF-8">\n    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n    <title>'
+    yield from context.blocks['title'][0](context)
+    yield '</title>\n    \n    <!-- Google Fonts -->\n    <link rel="preconnect" href="https://fonts.googleapis.com">\n    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>\n    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">\n    \n    <!-- HTMX -->\n    <script src="https://unpkg.com/htmx.org@2.0.0"></script>\n    <script src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js"></script>\n    \n    <!-- CSS -->\n    <link rel="stylesheet" href="'
+    yield escape(context.call((undefined(name='static_url') if l_0_static_url is missing else l_0_static_url), 'css/style.css'))
+    yield '">\n    \n    '
+    yield from context.blocks['extra_head'][0](context)
+    yield '\n</head>\n<body>\n    '
+    yield from context.blocks['content'][0](context)
+    yield '\n</body>\n</html>'
+
+def block_title(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    pass
+    yield 'Flight Optimizer AI'
+
+def block_extra_head(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    pass
+
+def block_content(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    pass
+
+blocks = {'title': block_title, 'extra_head': block_extra_head, 'content': block_content}
+debug_info = '6=13&18=15&20=17&23=19&6=22&20=32&23=41'
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+複数プロバイダーの運賃集約
+FARE_PROVIDERS に並べたプロバイダーへ同時に問い合わせ、届いた順にオファーを
+マージする。遅いプロバイダー1つに全体のレイテンシが引きずられないよう、
+
+- 重複を除いたオファーが min_offers 件そろうか、締め切りが来たら残りを打ち切る
+- 最初の結果が届いてからは grace 秒だけ他を待つ
+- 同じ便（航空会社・便名・時刻が一致）は最安のものだけを残す
+- プロバイダーごとの「結果に使われる1回あたりの期待待ち時間」で並べ、
+  最速の slow_factor 倍より遅いものは問い合わせない（probe_every 回に1回は全件に問い合わせて成績を更新する）
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from app.clients.fare_provider import FareProvider, OfferKey, offer_key
+from app.clients.flight_data_client import FlightDataClient
+from app.clients.resilience import Deadline, DeadlineExceeded, LatencyTracker
+from app.metrics import FARE_PROVIDER_CALLS
+from app.models.schemas import FlightOffer, RawFlightData
+from app.serialization import construct
+
+
+class ProviderStats:
+    """プロバイダーごとの直近の成績（問い合わせ順の決定に使う）"""
+
+    def __init__(self, window: int = 50, min_samples: int = 3, alpha: float = 0.2):
+        self.latency = LatencyTracker(size=window, min_samples=min_samples)
+        # 結果に使われた割合の指数移動平均（失敗・空・締め切り切れは 0 として数える）
+        self.used_rate = 1.0
+        self.alpha = alpha
+
+    def observe(self, seconds: float, used: bool) -> None:
+        """
+        1回分の結果を記録する
+
+        締め切りで打ち切った呼び出しは、そこまでの経過時間をレイテンシの下限として記録する。
+        """
+        self.latency.observe(seconds)
+        self.used_rate += self.alpha * ((1.0 if used else 0.0) - self.used_rate)
+
+    def score(self) -> float:
+        """結果に使われる1回あたりの期待待ち時間（秒）。標本が少ないうちは 0（優先して試す）"""
+        median = self.latency.percentile(50)
+        if median is None:
+            return 0.0
+        return median / max(self.used_rate, 0.05)
+
+
+class FareAggregator(FareProvider):
+    """複数の運賃プロバイダーを同時に呼び出してマージする"""
+
+    name = "fares"
+
+    def __init__(
+        self,
+        providers: Sequence[FareProvider],
+        min_offers: int = 10,
+        grace: float = 0.5,
+        max_providers: int = 0,
+        slow_factor: float = 3.0,
+        probe_every: int = 20,
+    ):
+        if not providers:
+            raise ValueError("FareAggregator requires at least one provider")
+        self.providers = list(providers)
+        self.min_offers = min_offers
+        self.grace = grace
+        # 1回に問い合わせる上限（0 で無制限）
+        self.max_providers = max_providers
+        self.slow_factor = slow_factor
+        self.probe_every = probe_every
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats() for p in self.providers}
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls, providers: Sequence[FareProvider]) -> "FareAggregator":
+        """`FARE_MIN_OFFERS`, `FARE_AGGREGATE_GRACE`, `FARE_MAX_PROVIDERS`, `FARE_SLOW_FACTOR`, `FARE_PROBE_EVERY`"""
+        return cls(
+            providers,
+            min_offers=int(os.getenv("FARE_MIN_OFFERS") or 10),
+            grace=float(os.getenv("FARE_AGGREGATE_GRACE") or 0.5),
+            max_providers=int(os.getenv("FARE_MAX_PROVIDERS") or 0),
+            slow_factor=float(os.getenv("FARE_SLOW_FACTOR") or 3.0),
+            probe_every=int(os.getenv("FARE_PROBE_EVERY") or 20),
+        )
+
+    @property
+    def use_mock(self) -> bool:
+        """すべてのプロバイダーがモック（API キー未設定）"""
+        return all(p.use_mock for p in self.providers)
+
+    def admit_hedges(self, admit) -> None:
+        for provider in self.providers:
+            provider.admit_hedges(admit)
+
+    def ranked(self) -> List[FareProvider]:
+        """今回問い合わせるプロバイダー（期待待ち時間の短い順）"""
+        live = sorted(
+            (p for p in self.providers if not p.use_mock),
+            key=lambda p: self.stats[p.name].score()
+        )
+        self.calls += 1
+        if self.probe_every > 0 and self.calls % self.probe_every == 0:
+            # 除外中のプロバイダーが回復していないか、ときどき全件に問い合わせる
+            return live
+        best = next((score for score in (self.stats[p.name].score() for p in live) if score > 0), None)
+        selected = []
+        for provider in live:
+            too_slow = best is not None and self.stats[provider.name].score() > best * self.slow_factor
+            if too_slow or (self.max_providers and len(selected) >= self.max_providers):
+                FARE_PROVIDER_CALLS.inc(provider.name, "skipped")
+                continue
+            selected.append(provider)
+        return selected
+
+    async def get_flight_offers(
+        self,
+        departure: str,
+        arrival: str,
+        date: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> RawFlightData:
+        """
+        各プロバイダーに同時に問い合わせ、重複を除いてマージする
+
+        締め切りまでにどこからもオファーが届かなければ DeadlineExceeded、
+        すべて失敗した場合は最初に届いたモックデータを返す。
+        """
+        providers = self.ranked()
+        if not providers:
+            # すべてモック（API キー未設定）
+            return await self.providers[0].get_flight_offers(departure, arrival, date, deadline)
+
+        start = time.perf_counter()
+        tasks = {
+            asyncio.ensure_future(p.get_flight_offers(departure, arrival, date, deadline)): p
+            for p in providers
+        }
+        merged: Dict[OfferKey, FlightOffer] = {}
+        sources: List[str] = []
+        fetched_at: Optional[float] = None
+        fallback: Optional[RawFlightData] = None
+        error: Optional[BaseException] = None
+        grace_until: Optional[float] = None
+        pending = set(tasks)
+        # 締め切りに間に合わなかった（打ち切りを遅さとして成績に数える）
+        timed_out = False
+        try:
+            while pending:
+                timeout = deadline.remaining() if deadline is not None else None
+                if grace_until is not None:
+                    left = max(0.0, grace_until - time.perf_counter())
+                    timeout = left if timeout is None else min(timeout, left)
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    timed_out = grace_until is None or (deadline is not None and deadline.expired)
+                    break
+                elapsed = time.perf_counter() - start
+                for task in done:
+                    provider = tasks[task]
+                    stats = self.stats[provider.name]
+                    exc = task.exception()
+                    if isinstance(exc, DeadlineExceeded):
+                        stats.observe(elapsed, used=False)
+                        FARE_PROVIDER_CALLS.inc(provider.name, "cancelled")
+                        error = error or exc
+                        continue
+                    if exc is not None:
+                        print(f"Fare Provider Error ({provider.name}): {exc}")
+                        stats.observe(elapsed, used=False)
+                        FARE_PROVIDER_CALLS.inc(provider.name, "error")
+                        error = error or exc
+                        continue
+                    raw_data = task.result()
+                    if raw_data.is_mock or not raw_data.offers:
+                        stats.observe(elapsed, used=False)
+                        FARE_PROVIDER_CALLS.inc(provider.name, "empty")
+                        if raw_data.is_mock and fallback is None:
+                            fallback = raw_data
+                        continue
+                    stats.observe(elapsed, used=True)
+                    FARE_PROVIDER_CALLS.inc(provider.name, "used")
+                    if raw_data.source not in sources:
+                        sources.append(raw_data.source)
+                    if raw_data.fetched_at is not None:
+                        fetched_at = min(fetched_at or raw_data.fetched_at, raw_data.fetched_at)
+                    for offer in raw_data.offers:
+                        key = offer_key(offer)
+                        current = merged.get(key)
+                        if current is None or offer.price < current.price:
+                            merged[key] = offer
+                if len(merged) >= self.min_offers:
+                    break
+                if merged and grace_until is None:
+                    grace_until = time.perf_counter() + self.grace
+        finally:
+            elapsed = time.perf_counter() - start
+            for task in pending:
+                task.cancel()
+                # min_offers・grace で打ち切った（結果が足りた）分や呼び出し元のキャンセルは
+                # プロバイダーの遅さではないため記録しない
+                if timed_out:
+                    self.stats[tasks[task].name].observe(elapsed, used=False)
+                FARE_PROVIDER_CALLS.inc(tasks[task].name, "cancelled")
+
+        if not merged:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded("no fare provider answered within the request budget")
+            if fallback is not None:
+                return fallback
+            raise error or DeadlineExceeded("no fare provider answered")
+        return construct(RawFlightData, {
+            "source": " + ".join(sources),
+            "offers": sorted(merged.values(), key=lambda offer: offer.price),
+            "fetched_at": fetched_at or time.time(),
+        })
+
+
+def create_fare_provider(http_client: Optional[httpx.AsyncClient] = None) -> FareProvider:
+    """
+    `FARE_PROVIDERS`（カンマ区切り、既定 serpapi）から運賃プロバイダーを生成
+
+    各名前は SerpApi 互換のエンドポイントとして `{NAME}_API_KEY` / `{NAME}_BASE_URL` を読む。
+    1件だけなら集約せず、そのクライアントをそのまま返す。
+    """
+    names = [name.strip().lower() for name in (os.getenv("FARE_PROVIDERS") or "serpapi").split(",")]
+    providers = [
+        FlightDataClient(http_client=http_client, name=name, env_prefix=name.upper())
+        for name in dict.fromkeys(name for name in names if name)
+    ]
+    if len(providers) == 1:
+        return providers[0]
+    return FareAggregator.from_env(providers)
@@ -0,0 +1,53 @@
+"""
+運賃プロバイダーの共通インターフェース
+SerpApi（FlightDataClient）や複数プロバイダーの集約（FareAggregator）は
+いずれもこのインターフェースを実装し、FlightAnalyzerService から同じように呼ばれる
+"""
+from abc import ABC, abstractmethod
+from typing import Callable, Optional, Tuple
+from app.clients.resilience import Deadline, UpstreamGuard
+from app.models.schemas import FlightOffer, RawFlightData
+
+# プロバイダーをまたいで同じ便を判定するキー: (航空会社, 便名, 出発時刻, 到着時刻)
+OfferKey = Tuple[str, str, str, str]
+
+
+def offer_key(offer: FlightOffer) -> OfferKey:
+    """重複判定用の正規化キー（便名の空白・大文字小文字の違いは同じ便とみなす）"""
+    return (
+        offer.airline.strip().casefold(),
+        offer.flight_number.replace(" ", "").upper(),
+        offer.departure_time.strip(),
+        offer.arrival_time.strip(),
+    )
+
+
+class FareProvider(ABC):
+    """運賃プロバイダー"""
+
+    # メトリクスのラベルとステージ名
+    name: str = "fares"
+    # API キー未設定などで常にモックデータを返すか
+    use_mock: bool = False
+    # 締め切り・ヘッジ・サーキットブレーカー（HTTP を呼ぶプロバイダーのみ）
+    guard: Optional[UpstreamGuard] = None
+
+    @abstractmethod
+    async def get_flight_offers(
+        self,
+        departure: str,
+        arrival: str,
+        date: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> RawFlightData:
+        """
+        オファーを取得
+
+        締め切りを過ぎたら DeadlineExceeded を送出する。上流の失敗時は
+        モックデータ（is_mock=True）を返す。
+        """
+
+    def admit_hedges(self, admit: Callable[[], bool]) -> None:
+        """ヘッジの複製を出す前の確認（レート制限のトークン取得など）を設定する"""
+        if self.guard is not None:
+            self.guard.hedge_admit = admit
@@ -3,89 +3,168 @@
 Google Flights API を通じて LCC を含む実データを取得
 """
 import os
+import time
 import httpx
-from typing import List, Optional
-from app.models.schemas import FlightOffer, RawFlightData
+from datetime import date as date_type, timedelta
+from typing import Any, Optional
+from app.models.schemas import FlightOffer, FlightSegment, RawFlightData
+from app.serialization import construct, loads
+from app.clients.fare_provider import FareProvider
+from app.clients.http_pool import UpstreamHttpConfig
+from app.clients.resilience import CircuitOpenError, Deadline, DeadlineExceeded, UpstreamGuard
+from app.metrics import MOCK_FALLBACKS, UPSTREAM_RESPONSES, stage, upstream_call
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# SerpApi の応答から取り込むオファーの上限
+MAX_OFFERS = 10
 
-class FlightDataClient:
-    """SerpApi を使用したフライトデータ取得クライアント"""
+
+def default_outbound_date() -> str:
+    """日程未指定時の出発日（今日から2週間後）"""
+    return (date_type.today() + timedelta(days=14)).isoformat()
+
+
+def resolve_outbound_date(date: Optional[str]) -> str:
+    """実際に SerpApi へ送る出発日（未指定なら default_outbound_date）"""
+    return date or default_outbound_date()
+
+
+def _text(value: Any, default: str = "") -> str:
+    """SerpApi の値を文字列に揃える（検証を省いてモデルを作るため型をここで保証する）"""
+    if isinstance(value, str):
+        return value
+    return default if value is None else str(value)
+
+
+class FlightDataClient(FareProvider):
+    """
+    SerpApi を使用したフライトデータ取得クライアント
+
+    name / env_prefix を変えると、SerpApi 互換の別エンドポイント（別アカウントや
+    ミラー）を別プロバイダーとして扱える（`{env_prefix}_API_KEY` / `{env_prefix}_BASE_URL`）。
+    """
     
-    def __init__(self):
-        self.api_key = os.getenv("SERPAPI_API_KEY")
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        name: str = "serpapi",
+        env_prefix: str = "SERPAPI"
+    ):
+        self.name = name
+        self.api_key = os.getenv(f"{env_prefix}_API_KEY")
         self.use_mock = not self.api_key
-        self.base_url = "https://serpapi.com/search"
+        # ローカルのスタブサーバー（scripts/stub_upstreams.py）に向ける場合は上書きする
+        self.base_url = os.getenv(f"{env_prefix}_BASE_URL") or "https://serpapi.com/search"
+        # 共有クライアント（lifespan から注入）。未指定なら自前のプールを持つ
+        self.http_client = http_client or UpstreamHttpConfig.from_env(env_prefix, 20.0).create_client()
+        # 連続失敗時の遮断と、遅い呼び出しのヘッジ（{env_prefix}_HEDGE_PERCENTILE で有効化）
+        self.guard = UpstreamGuard.from_env(env_prefix, name)
 
     async def get_flight_offers(
-        self, 
-        departure: str, 
-        arrival: str, 
-        date: Optional[str] = None
+        self,
+        departure: str,
+        arrival: str,
+        date: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> RawFlightData:
-        """SerpApi (Google Flights) からオファーを取得"""
+        """
+        SerpApi (Google Flights) からオファーを取得
+
+        deadline を渡すとその残り時間で打ち切り、DeadlineExceeded を送出する。
+        """
         if self.use_mock:
+            MOCK_FALLBACKS.inc(self.name, "no_key")
             return self._get_mock_data(departure, arrival, date)
-        
+
         try:
             params = {
                 "engine": "google_flights",
                 "departure_id": departure,
                 "arrival_id": arrival,
-                "outbound_date": date if date else "2026-03-01",
+                "outbound_date": resolve_outbound_date(date),
                 "currency": "JPY",
                 "hl": "ja",
                 "api_key": self.api_key,
                 "type": "2"  # One-way
             }
             
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                response = await client.get(self.base_url, params=params)
+            async def request() -> httpx.Response:
+                with stage(self.name), upstream_call(self.name):
+                    response = await self.http_client.get(self.base_url, params=params)
+                UPSTREAM_RESPONSES.inc(self.name, str(response.status_code))
                 response.raise_for_status()
-                data = response.json()
-                
-                return self._parse_serpapi_response(data)
+                return response
+
+            response = await self.guard.call(request, deadline)
+            with stage(f"{self.name}_parse"):
+                return self._parse_serpapi_response(loads(response.content))
+        except DeadlineExceeded:
+            UPSTREAM_RESPONSES.inc(self.name, "DeadlineExceeded")
+            raise
+        except CircuitOpenError:
+            MOCK_FALLBACKS.inc(self.name, "circuit_open")
+            return self._get_mock_data(departure, arrival, date)
         except Exception as e:
-            print(f"SerpApi Error: {e}")
+            print(f"SerpApi Error ({self.name}): {e}")
+            if not isinstance(e, httpx.HTTPStatusError):
+                UPSTREAM_RESPONSES.inc(self.name, type(e).__name__)
+            MOCK_FALLBACKS.inc(self.name, "error")
             return self._get_mock_data(departure, arrival, date)
 
-    def _parse_serpapi_response(self, data: dict) -> RawFlightData:
-        """SerpApi のレスポンスを共通モデルに変換"""
+    def _parse_serpapi_response(self, data: dict, limit: int = MAX_OFFERS) -> RawFlightData:
+        """
+        SerpApi のレスポンスを共通モデルに変換
+
+        値はここで文字列・数値に揃えるため、モデルは検証を省いて生成する。
+        """
         offers = []
+        booking_link = data.get("search_metadata", {}).get("google_flights_url")
         
         # 'best_flights' と 'other_flights' から取得
         raw_flights = data.get("best_flights", []) + data.get("other_flights", [])
         
-        for flight in raw_flights[:10]:  # 上位10件
+        for flight in raw_flights[:limit]:  # 上位 limit 件
             # flight['flights'] はセグメント（乗り継ぎ）のリスト
-            segments = flight.get("flights", [])
+            segments = []
+            for seg in flight.get("flights", []):
+                departure = seg.get("departure_airport") or {}
+                arrival = seg.get("arrival_airport") or {}
+                segments.append(construct(FlightSegment, {
+                    "departure_airport": _text(departure.get("id")),
+                    "arrival_airport": _text(arrival.get("id")),
+                    "departure_time": _text(departure.get("time")),
+                    "arrival_time": _text(arrival.get("time")),
+                    "airline": _text(seg.get("airline")),
+                    "flight_number": _text(seg.get("flight_number")),
+                }))
             if not segments:
                 continue
             
             first_seg = segments[0]
-            last_seg = segments[-1]
-            
-            offers.append(FlightOffer(
-                airline=first_seg.get("airline", "Unknown"),
-                flight_number=first_seg.get("flight_number", "N/A"),
-                departure_time=first_seg.get("departure_airport", {}).get("time", ""),
-                arrival_time=last_seg.get("arrival_airport", {}).get("time", ""),
-                price=float(flight.get("price", 0)),
-                currency="JPY",
-                booking_link=data.get("search_metadata", {}).get("google_flights_url")
-            ))
+            offers.append(construct(FlightOffer, {
+                "airline": first_seg.airline or "Unknown",
+                "flight_number": first_seg.flight_number or "N/A",
+                "departure_time": first_seg.departure_time,
+                "arrival_time": segments[-1].arrival_time,
+                "price": float(flight.get("price") or 0),
+                "currency": "JPY",
+                "booking_link": booking_link if isinstance(booking_link, str) else None,
+                "segments": segments,
+            }))
             
-        return RawFlightData(
-            source="SerpApi (Google Flights)",
-            offers=offers
-        )
+        return construct(RawFlightData, {
+            "source": "SerpApi (Google Flights)",
+            "offers": offers,
+            "fetched_at": time.time(),
+        })
 
     def _get_mock_data(self, departure: str, arrival: str, date: str) -> RawFlightData:
         """APIキー未設定時のバックアップデータ"""
         return RawFlightData(
             source="SerpApi Mock (Google Flights 模倣)",
+            is_mock=True,
             offers=[
                 FlightOffer(
                     airline="Peach",
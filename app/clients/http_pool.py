@@ -0,0 +1,120 @@
+"""
+共有 HTTP クライアント
+アップストリーム（SerpApi / Grok）ごとに長寿命の httpx.AsyncClient を保持し、
+TCP+TLS 接続をリクエスト間で再利用する
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class UpstreamHttpConfig:
+    """アップストリームごとの接続プール・タイムアウト設定"""
+    timeout: float
+    connect_timeout: float = 5.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, prefix: str, default_timeout: float) -> "UpstreamHttpConfig":
+        """
+        環境変数から設定を読み込む
+
+        `{prefix}_HTTP_TIMEOUT` のようなアップストリーム固有の値を優先し、
+        未設定なら共通の `HTTP_*` を使う。
+        """
+        def key(name: str) -> str:
+            specific = f"{prefix}_HTTP_{name}"
+            return specific if os.getenv(specific) else f"HTTP_{name}"
+
+        return cls(
+            timeout=_env_float(key("TIMEOUT"), default_timeout),
+            connect_timeout=_env_float(key("CONNECT_TIMEOUT"), 5.0),
+            max_connections=_env_int(key("MAX_CONNECTIONS"), 100),
+            max_keepalive_connections=_env_int(key("MAX_KEEPALIVE"), 20),
+            keepalive_expiry=_env_float(key("KEEPALIVE_EXPIRY"), 30.0),
+            http2=_env_bool(key("HTTP2"), False),
+        )
+
+    def create_client(self) -> httpx.AsyncClient:
+        """設定に基づいて AsyncClient を生成"""
+        http2 = self.http2
+        if http2 and not _h2_available():
+            print("HTTP/2 requested but 'h2' is not installed; falling back to HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            http2=http2,
+        )
+
+
+class HttpClients:
+    """
+    アプリケーション全体で共有する HTTP クライアント群（lifespan で破棄）
+
+    各クライアントは最初にアクセスされた時点で生成する。
+    """
+
+    def __init__(
+        self,
+        serpapi: Optional[UpstreamHttpConfig] = None,
+        grok: Optional[UpstreamHttpConfig] = None,
+    ):
+        self.serpapi_config = serpapi or UpstreamHttpConfig.from_env("SERPAPI", 20.0)
+        self.grok_config = grok or UpstreamHttpConfig.from_env("GROK", 30.0)
+        self._serpapi: Optional[httpx.AsyncClient] = None
+        self._grok: Optional[httpx.AsyncClient] = None
+
+    @property
+    def serpapi(self) -> httpx.AsyncClient:
+        if self._serpapi is None:
+            self._serpapi = self.serpapi_config.create_client()
+        return self._serpapi
+
+    @property
+    def grok(self) -> httpx.AsyncClient:
+        if self._grok is None:
+            self._grok = self.grok_config.create_client()
+        return self._grok
+
+    async def aclose(self) -> None:
+        """生成済みのクライアントの接続を閉じる"""
+        for client in (self._serpapi, self._grok):
+            if client is not None:
+                await client.aclose()
+        self._serpapi = self._grok = None
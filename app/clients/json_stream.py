@@ -0,0 +1,71 @@
+"""
+LLM ストリーミング出力のインクリメンタル JSON パーサー
+{"hidden_options": [{...}, {...}], ...} 形式の応答から、
+配列要素のオブジェクトが閉じた時点で1件ずつ取り出す
+"""
+import re
+from typing import List
+from app.serialization import loads
+
+_ARRAY_START = re.compile(r'"hidden_options"\s*:\s*\[')
+
+
+class HiddenOptionStreamParser:
+    """チャンクを順に受け取り、完成した hidden_options の要素を返す"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.options: List[dict] = []
+        self._pos = -1          # 配列内の走査位置（-1 は配列開始前）
+        self._depth = 0
+        self._start = 0
+        self._in_string = False
+        self._escape = False
+        self._closed = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        """チャンクを追加し、新たに完成したオプションを返す"""
+        self.buffer += chunk
+        if self._closed:
+            return []
+        if self._pos < 0:
+            match = _ARRAY_START.search(self.buffer)
+            if match is None:
+                return []
+            self._pos = match.end()
+
+        completed = []
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        option = loads(buf[self._start:i + 1])
+                    except ValueError:
+                        option = None
+                    if isinstance(option, dict):
+                        completed.append(option)
+            elif ch == "]" and self._depth == 0:
+                self._closed = True
+                i += 1
+                break
+            i += 1
+        self._pos = i
+        self.options.extend(completed)
+        return completed
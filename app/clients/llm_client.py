@@ -3,18 +3,67 @@ LLM クライアント
 Grok API（または OpenAI）との通信を処理
 """
 import os
+import json
+import hashlib
+import time
 import httpx
-from typing import Optional
-from app.models.schemas import RawFlightData
+from typing import AsyncIterator, List, Optional, Tuple
+from app.models.schemas import DatePrice, HiddenFlightOption, MetroFare, RawFlightData
+from app.clients.flight_data_client import resolve_outbound_date
+from app.clients.http_pool import UpstreamHttpConfig
+from app.clients.json_stream import HiddenOptionStreamParser
+from app.clients.prompt_builder import BuiltPrompt, PromptBuilder, response_schema
+from app.clients.resilience import (
+    CircuitOpenError, Deadline, DeadlineExceeded, UpstreamGuard, iterate_within
+)
+from app.metrics import (
+    LLM_TOKENS, MOCK_FALLBACKS, UPSTREAM_RESPONSES, record_stage, stage, upstream_call
+)
+from app.serialization import loads
 from dotenv import load_dotenv
 
 load_dotenv()
 
+SYSTEM_PROMPT = (
+    "あなたは航空券の専門家です。提供された実フライトデータ（表形式）に基づいて隠れた格安ルートを提案してください。"
+    "指定の JSON スキーマで、各項目は簡潔に返答してください。"
+)
+
+
+def record_token_usage(usage: Optional[dict], prompt: BuiltPrompt) -> None:
+    """1回の呼び出しのトークン数を記録（usage がなければ見積もりのみ）"""
+    LLM_TOKENS.observe(prompt.estimated_tokens, "prompt_estimated")
+    if not usage:
+        return
+    LLM_TOKENS.observe(usage.get("prompt_tokens") or 0, "prompt")
+    LLM_TOKENS.observe(usage.get("completion_tokens") or 0, "completion")
+    reasoning = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens")
+    if reasoning is not None:
+        LLM_TOKENS.observe(reasoning, "reasoning")
+
 
 class LLMClient:
     """LLM クライアント（Grok API / OpenAI）"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self.base_url = os.getenv("GROK_BASE_URL") or "https://api.x.ai/v1/chat/completions"
+        self.model = "grok-4-1-fast-reasoning"
+        # 入力はトークン予算内に圧縮し、出力は max_tokens とスキーマで上限を決める
+        self.prompt_builder = PromptBuilder.from_env()
+        self.max_tokens = int(os.getenv("LLM_MAX_TOKENS") or 1024)
+        self.response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "hidden_route_analysis",
+                "strict": True,
+                "schema": response_schema(self.prompt_builder.max_options),
+            },
+        }
+        # 共有クライアント（lifespan から注入）。未指定なら自前のプールを持つ
+        self.http_client = http_client or UpstreamHttpConfig.from_env("GROK", 30.0).create_client()
+        # 連続失敗時の遮断と、遅い呼び出しのヘッジ（GROK_HEDGE_PERCENTILE で有効化）
+        self.guard = UpstreamGuard.from_env("GROK", "grok")
+
         # 環境変数から取得し、前後の空白を除去
         self.grok_api_key = (os.getenv("GROK_API_KEY") or "").strip()
         self.openai_api_key = (os.getenv("OPENAI_API_KEY") or "").strip()
@@ -38,29 +87,94 @@ class LLMClient:
         departure: str, 
         arrival: str, 
         date: Optional[str] = None,
-        raw_data: Optional[RawFlightData] = None
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None,
+        deadline: Optional[Deadline] = None
     ) -> dict:
         """
         フライトルートを分析して隠れた格安オプションを提案
+
+        deadline を渡すとその残り時間で打ち切り、DeadlineExceeded を送出する。
         """
         route_description = f"{departure} → {arrival}"
         if date:
             route_description += f" ({date})"
         
         if self.use_mock:
+            MOCK_FALLBACKS.inc("grok", "no_key")
             return self._mock_analysis(route_description)
         
         if self.grok_api_key:
-            return await self._call_grok_api(departure, arrival, date, raw_data)
+            return await self._call_grok_api(
+                departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix, deadline
+            )
         
         if self.openai_api_key:
-            return await self._call_openai_api(departure, arrival, date, raw_data)
+            return await self._call_openai_api(
+                departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
+            )
         
         return self._mock_analysis(route_description)
     
+    def prompt_fingerprint(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None
+    ) -> str:
+        """
+        正規化したプロンプト入力の安定ハッシュ
+
+        ユーザープロンプトはオファーを正規化（重複除去・価格順）して構築するため、
+        モデル名・システムプロンプト・構築したプロンプト・出力の上限が同じなら
+        同じ値になり、分析結果のキャッシュキーとして使える。
+        """
+        prompt = self._build_user_prompt(
+            departure.upper(), arrival.upper(), date, raw_data, price_calendar, candidates, metro_matrix
+        )
+        canonical = json.dumps(
+            {
+                "model": self.model,
+                "system": SYSTEM_PROMPT,
+                "user": prompt.text,
+                "max_tokens": self.max_tokens,
+                "response_format": self.response_format,
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _build_user_prompt(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str],
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None
+    ) -> BuiltPrompt:
+        """
+        ユーザープロンプトをトークン予算内で構築
+
+        日程は運賃を取得した日付に揃える（未指定の検索と、同じ日付の事前取得で
+        プロンプトとフィンガープリントが一致する）。
+        """
+        return self.prompt_builder.build(
+            departure, arrival, resolve_outbound_date(date), raw_data, price_calendar, candidates, metro_matrix
+        )
+
     def _mock_analysis(self, route: str) -> dict:
-        """モック分析（デモ用）"""
+        """モック分析（デモ用）。is_mock を立ててキャッシュ対象から外す"""
         return {
+            "is_mock": True,
             "hidden_options": [
                 {
                     "route": f"{route} (経由地: ソウル)",
@@ -86,56 +200,222 @@ class LLMClient:
                           "🌍 **別の空港**: 近領の空港を検討してください（例: 成田 vs 羽田）。"
         }
     
-    async def _call_grok_api(
+    async def stream_flight_route(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        フライトルートをストリーミングで分析
+
+        ("option", オプション) を解析でき次第1件ずつ返し、
+        最後に ("result", analyze_flight_route と同じ形の辞書) を返す。
+        deadline までに1件も届かなければ DeadlineExceeded を送出する。
+        """
+        if self.use_mock or not self.grok_api_key:
+            result = await self.analyze_flight_route(
+                departure, arrival, date, raw_data=raw_data,
+                price_calendar=price_calendar, candidates=candidates, metro_matrix=metro_matrix,
+                deadline=deadline
+            )
+            for option in result.get("hidden_options", []):
+                yield "option", option
+            yield "result", result
+            return
+
+        headers, payload, prompt = self._build_grok_request(
+            departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
+        )
+        payload["stream"] = True
+        # 最後のチャンクでトークン数を受け取る
+        payload["stream_options"] = {"include_usage": True}
+        usage = None
+        finish_reason = None
+        parser = HiddenOptionStreamParser()
+        start = time.perf_counter()
+        first_token = True
+        breaker = self.guard.breaker
+        # half_open の試行を確保したか（成否を記録するか返却するまで True）
+        trial = False
+        fallback = False
+        try:
+            trial = breaker.allow()
+            if not trial:
+                raise CircuitOpenError("grok")
+            with upstream_call("grok"):
+                async with self.http_client.stream(
+                    "POST", self.base_url, headers=headers, json=payload,
+                    timeout=self._request_timeout(deadline)
+                ) as response:
+                    UPSTREAM_RESPONSES.inc("grok", str(response.status_code))
+                    if response.status_code != 200:
+                        await response.aread()
+                        print(f"Grok API Error Response: {response.status_code} - {response.text}")
+                    response.raise_for_status()
+                    async for line in iterate_within(response.aiter_lines(), deadline, "grok_stream"):
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        event = loads(data)
+                        usage = event.get("usage") or usage
+                        choices = event.get("choices") or [{}]
+                        finish_reason = choices[0].get("finish_reason") or finish_reason
+                        delta = choices[0].get("delta", {}).get("content")
+                        if not delta:
+                            continue
+                        if first_token:
+                            # 最初のトークンまで（推論時間）
+                            record_stage("grok_first_token", time.perf_counter() - start)
+                            first_token = False
+                        for option in parser.feed(delta):
+                            yield "option", option
+            breaker.record_success()
+            trial = False
+            record_stage("grok_stream", time.perf_counter() - start)
+            record_token_usage(usage, prompt)
+            self._warn_if_truncated(finish_reason)
+            result = loads(parser.buffer)
+        except DeadlineExceeded:
+            UPSTREAM_RESPONSES.inc("grok", "DeadlineExceeded")
+            if not parser.options:
+                raise
+            # 途中まで届いた分だけを返す（キャッシュ対象外）
+            result = {"hidden_options": parser.options, "avoid_tips": "", "is_partial": True}
+        except CircuitOpenError:
+            MOCK_FALLBACKS.inc("grok", "circuit_open")
+            result = self._mock_analysis(f"{departure} → {arrival}")
+            fallback = True
+        except ValueError as e:
+            # 上流は応答しているので、途切れた・壊れた JSON はブレーカーの失敗に数えない
+            if trial:
+                breaker.record_success()
+                trial = False
+            print(f"Grok API Stream Bad Response: {e}")
+            UPSTREAM_RESPONSES.inc("grok", "bad_response")
+            result, fallback = self._partial_or_mock(parser, departure, arrival)
+        except Exception as e:
+            breaker.record_failure()
+            trial = False
+            print(f"Grok API Stream Exception: {e}")
+            if not isinstance(e, httpx.HTTPStatusError):
+                UPSTREAM_RESPONSES.inc("grok", type(e).__name__)
+            result, fallback = self._partial_or_mock(parser, departure, arrival)
+        finally:
+            # 締め切り・クライアントの切断（GeneratorExit / CancelledError）で抜けた試行を返却する
+            if trial:
+                breaker.release()
+        if fallback:
+            for option in result["hidden_options"]:
+                yield "option", option
+        yield "result", result
+
+    def _partial_or_mock(
+        self, parser: HiddenOptionStreamParser, departure: str, arrival: str
+    ) -> Tuple[dict, bool]:
+        """失敗したストリームの結果（届いた分があればそれ、なければモック）と、モックかどうか"""
+        if parser.options:
+            # 途中まで届いた分は返すが、不完全なのでキャッシュ対象外にする
+            return {"hidden_options": parser.options, "avoid_tips": "", "is_partial": True}, False
+        MOCK_FALLBACKS.inc("grok", "error")
+        return self._mock_analysis(f"{departure} → {arrival}"), True
+
+    def _build_grok_request(
         self, 
         departure: str, 
         arrival: str, 
         date: Optional[str],
-        raw_data: Optional[RawFlightData] = None
-    ) -> dict:
-        """Grok API を呼び出し"""
-        url = "https://api.x.ai/v1/chat/completions"
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None
+    ) -> Tuple[dict, dict, BuiltPrompt]:
+        """Grok API のヘッダー・ペイロードと、構築したプロンプトを返す"""
         headers = {
             "Authorization": f"Bearer {self.grok_api_key}",
             "Content-Type": "application/json"
         }
         
-        system_prompt = (
-            "あなたは航空券の専門家です。提供された実フライトデータに基づいて隠れた格安ルートを提案してください。"
-            "JSON形式で返答してください。"
+        prompt = self._build_user_prompt(
+            departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
         )
         
-        user_prompt = f"出発地: {departure}, 目的地: {arrival}"
-        if date:
-            user_prompt += f", 日程: {date}"
-        
-        if raw_data and raw_data.offers:
-            user_prompt += "\n\n実データ：\n"
-            for offer in raw_data.offers:
-                user_prompt += f"- {offer.airline} ({offer.flight_number}): {offer.departure_time}-{offer.arrival_time}, {offer.price} {offer.currency}\n"
-        
         payload = {
-            "model": "grok-4-1-fast-reasoning",
+            "model": self.model,
             "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt.text}
             ],
-            "response_format": {"type": "json_object"}
+            "max_tokens": self.max_tokens,
+            "response_format": self.response_format
         }
-        
+        return headers, payload, prompt
+
+    def _warn_if_truncated(self, finish_reason: Optional[str]) -> None:
+        if finish_reason == "length":
+            print(f"Grok API Warning: output truncated at max_tokens={self.max_tokens}")
+
+    def _request_timeout(self, deadline: Optional[Deadline]) -> httpx.Timeout:
+        """接続・読み取りの各タイムアウトを締め切りまでの残り時間に丸める"""
+        timeout = self.http_client.timeout
+        if deadline is None:
+            return timeout
+        return httpx.Timeout(
+            deadline.timeout(timeout.read),
+            connect=deadline.timeout(timeout.connect),
+        )
+
+    async def _call_grok_api(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str],
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> dict:
+        """Grok API を呼び出し"""
+        headers, payload, prompt = self._build_grok_request(
+            departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
+        )
+
+        async def request() -> httpx.Response:
+            with stage("grok"), upstream_call("grok"):
+                response = await self.http_client.post(self.base_url, headers=headers, json=payload)
+            UPSTREAM_RESPONSES.inc("grok", str(response.status_code))
+            if response.status_code != 200:
+                print(f"Grok API Error Response: {response.status_code} - {response.text}")
+            response.raise_for_status()
+            return response
+
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                if response.status_code != 200:
-                    print(f"Grok API Error Response: {response.status_code} - {response.text}")
-                response.raise_for_status()
-                data = response.json()
-                
-                content = data["choices"][0]["message"]["content"]
-                import json
-                return json.loads(content)
+            response = await self.guard.call(request, deadline)
+            data = loads(response.content)
+            record_token_usage(data.get("usage"), prompt)
+            self._warn_if_truncated(data["choices"][0].get("finish_reason"))
+            
+            content = data["choices"][0]["message"]["content"]
+            return loads(content)
+        except DeadlineExceeded:
+            UPSTREAM_RESPONSES.inc("grok", "DeadlineExceeded")
+            raise
+        except CircuitOpenError:
+            MOCK_FALLBACKS.inc("grok", "circuit_open")
+            return self._mock_analysis(f"{departure} → {arrival}")
         except Exception as e:
             print(f"Grok API Exception: {e}")
+            if not isinstance(e, httpx.HTTPStatusError):
+                UPSTREAM_RESPONSES.inc("grok", type(e).__name__)
+            MOCK_FALLBACKS.inc("grok", "error")
             return self._mock_analysis(f"{departure} → {arrival}")
 
     async def _call_openai_api(
@@ -143,7 +423,10 @@ class LLMClient:
         departure: str, 
         arrival: str, 
         date: Optional[str],
-        raw_data: Optional[RawFlightData] = None
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        metro_matrix: Optional[List[MetroFare]] = None
     ) -> dict:
         """OpenAI API を呼び出し"""
         return self._mock_analysis(f"{departure} → {arrival}")
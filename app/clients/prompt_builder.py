@@ -0,0 +1,174 @@
+"""
+プロンプト構築
+実データを判断に必要な項目だけの表形式に圧縮し、トークン予算内に収める。
+応答は HiddenFlightOption に合わせた厳密な JSON スキーマと max_tokens で上限を決める
+
+LLM のレイテンシは入力・出力トークン数にほぼ比例するため、
+安いオファーから順に予算の範囲で詰め、溢れた分は件数だけを伝える。
+"""
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+from app.models.schemas import DatePrice, HiddenFlightOption, MetroFare, RawFlightData
+
+# LLM に生成させる HiddenFlightOption のフィールド（real_fights はローカルで付与する）
+OPTION_FIELDS = ("route", "price", "save", "tips")
+
+# 表の1行: (価格, 航空会社, 便名, 出発時刻, 到着時刻, 経由地)
+OfferRow = Tuple[float, str, str, str, str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ローカルのトークン数見積もり（トークナイザーを使わない概算）
+
+    英数字・記号は約4文字で1トークン、日本語などの非 ASCII 文字は1文字1トークンとして
+    数える。実際より多めに出る傾向があり、予算の判定には安全側に働く。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return -(-ascii_chars // 4) + (len(text) - ascii_chars)
+
+
+def response_schema(max_options: int) -> dict:
+    """HiddenFlightOption に対応する応答の JSON スキーマ（strict モード用）"""
+    fields = HiddenFlightOption.model_fields
+    option = {
+        "type": "object",
+        "properties": {
+            name: {"type": "string", "description": fields[name].description}
+            for name in OPTION_FIELDS
+        },
+        "required": list(OPTION_FIELDS),
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "hidden_options": {"type": "array", "items": option, "maxItems": max_options},
+            "avoid_tips": {"type": "string"},
+        },
+        "required": ["hidden_options", "avoid_tips"],
+        "additionalProperties": False,
+    }
+
+
+def _clock(value: str) -> str:
+    """'2026-10-20 08:30' → '08:30'（時刻だけの値はそのまま）"""
+    return value.rsplit(" ", 1)[-1].rsplit("T", 1)[-1][:5] if value else "-"
+
+
+def offer_rows(raw_data: Optional[RawFlightData]) -> List[OfferRow]:
+    """オファーを判断に必要な項目だけの行にし、重複を除いて価格順に並べる"""
+    if not raw_data or not raw_data.offers:
+        return []
+    rows = set()
+    for offer in raw_data.offers:
+        stops = "/".join(seg.arrival_airport for seg in offer.segments[:-1])
+        arrival = _clock(offer.arrival_time)
+        if offer.segments and offer.departure_time[:10] != offer.arrival_time[:10]:
+            # 日付をまたぐ到着
+            arrival += "+1"
+        rows.add((
+            offer.price, offer.airline, offer.flight_number,
+            _clock(offer.departure_time), arrival, stops or "-",
+        ))
+    return sorted(rows)
+
+
+@dataclass
+class BuiltPrompt:
+    """構築したユーザープロンプトと見積もり"""
+    text: str
+    estimated_tokens: int
+    offers_included: int
+    offers_total: int
+
+
+class PromptBuilder:
+    """
+    トークン予算つきのユーザープロンプト構築
+
+    ルートとローカル候補は必ず含め、オファーは安い順に、近隣空港の組み合わせ別・
+    日付別の最安値は残りの予算で入る分だけ含める。
+    """
+
+    def __init__(self, token_budget: int = 1200, max_options: int = 5):
+        self.token_budget = token_budget
+        self.max_options = max_options
+
+    @classmethod
+    def from_env(cls) -> "PromptBuilder":
+        """`LLM_PROMPT_TOKEN_BUDGET` と `LLM_MAX_OPTIONS` から生成"""
+        return cls(
+            token_budget=int(os.getenv("LLM_PROMPT_TOKEN_BUDGET") or 1200),
+            max_options=int(os.getenv("LLM_MAX_OPTIONS") or 5),
+        )
+
+    def build(
+        self,
+        departure: str,
+        arrival: str,
+        date: Optional[str],
+        raw_data: Optional[RawFlightData] = None,
+        price_calendar: Optional[Sequence[DatePrice]] = None,
+        candidates: Optional[Sequence[HiddenFlightOption]] = None,
+        metro_matrix: Optional[Sequence[MetroFare]] = None,
+    ) -> BuiltPrompt:
+        lines = [f"ルート: {departure}→{arrival}" + (f" {date}" if date else "")]
+        if candidates:
+            lines.append("ローカル候補（検証・補足）:")
+            lines.extend(f"- {c.route} | {c.price} | {c.save}" for c in candidates)
+        used = estimate_tokens("\n".join(lines))
+
+        rows = offer_rows(raw_data)
+        included = 0
+        if rows:
+            currency = raw_data.offers[0].currency
+            header = f"実データ（{currency}、安い順）: 価格|航空会社|便名|発|着|経由"
+            used += estimate_tokens(header) + 1
+            lines.append(header)
+            for price, airline, flight_number, dep, arr, stops in rows:
+                line = f"{price:.0f}|{airline}|{flight_number}|{dep}|{arr}|{stops}"
+                cost = estimate_tokens(line) + 1
+                # 予算を超えても最安の1件は必ず含める
+                if included and used + cost > self.token_budget:
+                    break
+                lines.append(line)
+                used += cost
+                included += 1
+            if included < len(rows):
+                note = f"（他 {len(rows) - included} 件は省略）"
+                lines.append(note)
+                used += estimate_tokens(note) + 1
+
+        if metro_matrix:
+            # 安い組み合わせから並べ、取得できなかった組み合わせは末尾に
+            cells = sorted(metro_matrix, key=lambda cell: (cell.min_price is None, cell.min_price or 0.0))
+            pairs = " ".join(
+                f"{cell.departure}→{cell.arrival}:{cell.min_price:.0f}" if cell.min_price is not None
+                else f"{cell.departure}→{cell.arrival}:-"
+                for cell in cells
+            )
+            line = f"近隣空港の組み合わせ別最安値: {pairs}"
+            cost = estimate_tokens(line) + 1
+            if used + cost <= self.token_budget:
+                lines.append(line)
+                used += cost
+
+        if price_calendar:
+            days = " ".join(
+                f"{day.date[5:]}:{day.min_price:.0f}" if day.min_price is not None else f"{day.date[5:]}:-"
+                for day in price_calendar
+            )
+            line = f"日付別最安値: {days}"
+            cost = estimate_tokens(line) + 1
+            if used + cost <= self.token_budget:
+                lines.append(line)
+                used += cost
+
+        return BuiltPrompt(
+            text="\n".join(lines),
+            estimated_tokens=used,
+            offers_included=included,
+            offers_total=len(rows),
+        )
@@ -0,0 +1,280 @@
+"""
+上流呼び出しの耐障害性
+リクエスト全体の締め切り（Deadline）、遅い呼び出しの複製（ヘッジ）、
+失敗が続く上流を一時的に呼ばないサーキットブレーカーをまとめる
+
+Vercel の関数は 30 秒で打ち切られるため、ルーターで作った Deadline を
+サービス層からクライアントまで渡し、各段階は残り時間だけを使う。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, TypeVar
+
+from app.metrics import CIRCUIT_STATE, DEADLINE_EXCEEDED, UPSTREAM_HEDGES
+
+T = TypeVar("T")
+
+# vercel.json の maxDuration（30 秒）から描画・転送の余裕を引いた既定値
+DEFAULT_REQUEST_BUDGET = 25.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """リクエスト全体の残り時間を使い切った"""
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため上流を呼ばなかった"""
+
+
+class Deadline:
+    """
+    リクエスト全体の締め切り（単調時計基準）
+
+    ルーターで生成し、各段階は timeout() で残り時間を上限にする。
+    """
+
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_env(cls, default: float = DEFAULT_REQUEST_BUDGET) -> "Deadline":
+        """`REQUEST_BUDGET_SECONDS` から生成"""
+        return cls(float(os.getenv("REQUEST_BUDGET_SECONDS") or default))
+
+    def remaining(self) -> float:
+        """残り秒数（0 未満にはならない）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """cap と残り時間の小さい方。残りがなければ DeadlineExceeded"""
+        left = self.expires_at - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded("request budget exhausted")
+        return left if cap is None else min(cap, left)
+
+    async def run(self, fn: Callable[[], Awaitable[T]], stage: str) -> T:
+        """
+        fn() を残り時間内で待つ
+
+        時間切れでは fn() をキャンセルして DeadlineExceeded を送出する。
+        """
+        try:
+            timeout = self.timeout()
+        except DeadlineExceeded:
+            DEADLINE_EXCEEDED.inc(stage)
+            raise
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc(stage)
+            raise DeadlineExceeded(f"{stage} exceeded the request budget") from None
+
+
+async def iterate_within(
+    iterator: AsyncIterator[T], deadline: Optional[Deadline], stage: str
+) -> AsyncIterator[T]:
+    """ストリームの各要素を締め切りまでの残り時間で待つ"""
+    if deadline is None:
+        async for item in iterator:
+            yield item
+        return
+    while True:
+        try:
+            item = await deadline.run(iterator.__anext__, stage)
+        except StopAsyncIteration:
+            return
+        yield item
+
+
+class LatencyTracker:
+    """直近の成功した呼び出しのレイテンシ（ヘッジの発火点を決める）"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p パーセンタイル（標本が少ないうちは None）"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(len(ordered) * p / 100.0 + 0.5) - 1))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    連続失敗で開くサーキットブレーカー
+
+    - closed: 通常どおり呼び出す。failure_threshold 回連続で失敗すると open
+    - open: reset_timeout 秒間は呼び出さない
+    - half_open: 試行を1件だけ通し、成功すれば closed、失敗すれば再び open
+    failure_threshold <= 0 の場合は無効（常に closed）。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+
+    @classmethod
+    def from_env(cls, prefix: str, name: str) -> "CircuitBreaker":
+        """`{prefix}_BREAKER_FAILURES` と `{prefix}_BREAKER_RESET` から生成"""
+        failures = int(os.getenv(f"{prefix}_BREAKER_FAILURES") or 5)
+        reset = float(os.getenv(f"{prefix}_BREAKER_RESET") or 30.0)
+        return cls(name, failures, reset)
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        CIRCUIT_STATE.set((self.CLOSED, self.HALF_OPEN, self.OPEN).index(state), self.name)
+
+    def allow(self) -> bool:
+        """呼び出してよければ True（half_open では試行1件だけ通す）"""
+        if self.failure_threshold <= 0:
+            return True
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_flight = False
+        if self._state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failure_threshold <= 0:
+            return
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self._state != self.OPEN:
+                print(f"Circuit breaker opened: {self.name} ({self.failures} consecutive failures)")
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """成否を判定できなかった試行（締め切りによる打ち切りなど）を返却する"""
+        self._trial_in_flight = False
+
+
+class UpstreamGuard:
+    """
+    上流1つ分の呼び出しを締め切り・ヘッジ・サーキットブレーカーで包む
+
+    ヘッジは hedge_percentile（例: 95）を指定した場合のみ有効で、
+    呼び出しが直近レイテンシのそのパーセンタイルを超えたら同じ呼び出しを
+    もう1つ発行し、先に成功した方を使う。hedge_admit は複製を出す前に呼ばれ、
+    False なら複製しない（上流のクォータを消費する前の確認に使う）。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: float = 0.0,
+        hedge_admit: Optional[Callable[[], bool]] = None,
+    ):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_admit = hedge_admit
+        self.latency = LatencyTracker()
+
+    @classmethod
+    def from_env(cls, prefix: str, name: str) -> "UpstreamGuard":
+        """`{prefix}_HEDGE_PERCENTILE`（未設定・0 で無効）とブレーカー設定から生成"""
+        percentile = float(os.getenv(f"{prefix}_HEDGE_PERCENTILE") or 0.0)
+        return cls(name, CircuitBreaker.from_env(prefix, name), hedge_percentile=percentile)
+
+    def hedge_delay(self) -> Optional[float]:
+        """複製を出すまでの待ち時間（ヘッジ無効・標本不足なら None）"""
+        if self.hedge_percentile <= 0:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], deadline: Optional[Deadline] = None) -> T:
+        """
+        fn() を呼び出す
+
+        ブレーカーが開いていれば CircuitOpenError、締め切りを過ぎれば
+        DeadlineExceeded を送出する。fn() の例外は失敗として記録して送出する。
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name)
+        start = time.perf_counter()
+        try:
+            if deadline is None:
+                result = await self._hedged(fn)
+            else:
+                result = await deadline.run(lambda: self._hedged(fn), self.name)
+        except DeadlineExceeded:
+            # 上流の失敗とは限らないため、ブレーカーには数えない
+            self.breaker.release()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        self.latency.observe(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or (self.hedge_admit is not None and not self.hedge_admit()):
+                return await primary
+            UPSTREAM_HEDGES.inc(self.name, "fired")
+            hedge = asyncio.ensure_future(fn())
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            UPSTREAM_HEDGES.inc(self.name, "won")
+                        return task.result()
+            # 両方失敗した場合は元の呼び出しの例外を送出する
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
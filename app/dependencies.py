@@ -0,0 +1,209 @@
+"""
+依存性注入
+アプリケーションスコープの共有オブジェクトをリクエストハンドラへ渡す
+
+サーバーレス環境のコールドスタートを短くするため、import 時には何も構築しない。
+空港インデックス・HTTP クライアント・サービスはいずれも最初に必要になった時点で生成する。
+"""
+import asyncio
+import os
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from app.clients.http_pool import HttpClients
+from app.clients.fare_aggregator import create_fare_provider
+from app.clients.llm_client import LLMClient
+from app.clients.resilience import Deadline
+from app.services.admission import AdmissionController
+from app.services.job_queue import JobStore, JobWorkerPool
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.airport_index import AirportIndex
+from app.services.prefetch import PrefetchConfig, RouteRefresher
+from app.templating import BUILD_DIR, FragmentCache
+
+AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), "data", "airports.json")
+# scripts/build_assets.py が書き出す構築済みインデックス
+AIRPORTS_BLOB = os.path.join(BUILD_DIR, "airports.bin")
+
+_airport_index: Optional[AirportIndex] = None
+_admission: Optional[AdmissionController] = None
+_fragment_cache: Optional[FragmentCache] = None
+_job_mode_refused = False
+
+
+def get_airport_index() -> AirportIndex:
+    """空港検索インデックス（初回呼び出し時に一度だけ読み込む）"""
+    global _airport_index
+    if _airport_index is None:
+        _airport_index = AirportIndex.load(AIRPORTS_FILE, AIRPORTS_BLOB)
+    return _airport_index
+
+
+async def get_airports() -> AirportIndex:
+    """
+    ルートの依存として使う空港検索インデックス
+
+    補完は1文字ごとに呼ばれるため、読み込み済みならスレッドプールを経由せずに返す。
+    初回の読み込みだけはイベントループを止めないようスレッドプールで行う。
+    """
+    if _airport_index is not None:
+        return _airport_index
+    return await run_in_threadpool(get_airport_index)
+
+
+def get_fragment_cache() -> FragmentCache:
+    """描画済み HTML 断片のキャッシュ（初回呼び出し時に生成する）"""
+    global _fragment_cache
+    if _fragment_cache is None:
+        _fragment_cache = FragmentCache()
+    return _fragment_cache
+
+
+async def get_admission_controller() -> AdmissionController:
+    """分析のアドミッション制御（プロセス内で共有。イベントループ上で生成する）"""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController.from_env()
+    return _admission
+
+
+def create_flight_service(http_clients: HttpClients) -> FlightAnalyzerService:
+    """共有 HTTP クライアントを注入したサービスを生成"""
+    return FlightAnalyzerService(
+        llm_client=LLMClient(http_client=http_clients.grok),
+        flight_data_client=create_fare_provider(http_client=http_clients.serpapi),
+    )
+
+
+def init_app_state(app: FastAPI) -> None:
+    """
+    共有 HTTP クライアントを app.state に登録
+
+    クライアントの接続プールとサービスは最初のリクエストで生成する。
+    登録済みのもの（ベンチマークなどで差し込んだサービスを含む）は置き換えない。
+    """
+    if getattr(app.state, "http_clients", None) is None:
+        app.state.http_clients = HttpClients()
+    if not hasattr(app.state, "flight_service"):
+        app.state.flight_service = None
+    if not hasattr(app.state, "job_workers"):
+        app.state.job_workers = None
+
+
+async def close_app_state(app: FastAPI) -> None:
+    """ジョブのワーカーを止め、共有 HTTP クライアントを閉じる"""
+    job_workers = getattr(app.state, "job_workers", None)
+    if job_workers is not None:
+        await job_workers.stop()
+        app.state.job_workers = None
+    flight_service = getattr(app.state, "flight_service", None)
+    if flight_service is not None and flight_service.popularity.directory:
+        flight_service.popularity.save()
+    http_clients = getattr(app.state, "http_clients", None)
+    if http_clients is not None:
+        await http_clients.aclose()
+        del app.state.http_clients
+        del app.state.flight_service
+
+
+def start_prefetch_task(app: FastAPI) -> Optional["asyncio.Task[None]"]:
+    """
+    人気ルートの事前取得をバックグラウンドで開始（PREFETCH_ENABLED=true の場合）
+
+    起動を遅らせないよう、サービスは最初の巡回の直前に生成する。
+    """
+    if (os.getenv("PREFETCH_ENABLED") or "").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    config = PrefetchConfig.from_env()
+
+    async def run() -> None:
+        await asyncio.sleep(config.interval)
+        await RouteRefresher(ensure_flight_service(app), config).run_forever()
+
+    return asyncio.create_task(run())
+
+
+async def get_request_deadline() -> Deadline:
+    """
+    リクエスト全体の締め切り（REQUEST_BUDGET_SECONDS、既定 25 秒）
+
+    依存の解決時点、つまりハンドラの実行直前から数える。
+    スレッドプールを経由しないよう async で定義する。
+    """
+    return Deadline.from_env()
+
+
+def serverless_runtime() -> bool:
+    """サーバーレス環境（Vercel・AWS Lambda）で動いているか"""
+    return bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+def job_mode_enabled() -> bool:
+    """
+    /analyze をジョブとして積み、結果をポーリングで返すか（ANALYZE_JOB_MODE=true）
+
+    サーバーレス環境では有効にしない。応答を返した後のインスタンスは凍結されるため
+    プロセス内のワーカーが進まず、キューの SQLite ファイルもインスタンスごとの /tmp にあるので
+    別のインスタンスに届いたポーリングはジョブを見つけられない。
+    """
+    global _job_mode_refused
+    if (os.getenv("ANALYZE_JOB_MODE") or "").strip().lower() not in ("1", "true", "yes", "on"):
+        return False
+    if serverless_runtime():
+        if not _job_mode_refused:
+            _job_mode_refused = True
+            print("ANALYZE_JOB_MODE is not supported on serverless runtimes; analyzing synchronously")
+        return False
+    return True
+
+
+def ensure_job_workers(app: FastAPI) -> JobWorkerPool:
+    """
+    ジョブのワーカーを取得（未起動なら起動して app.state に登録する）
+
+    lifespan を実行しないランタイムでも、最初のジョブ投入時に起動する。
+    """
+    if getattr(app.state, "job_workers", None) is None:
+        flight_service = ensure_flight_service(app)
+        app.state.job_workers = JobWorkerPool.from_env(JobStore.from_env(), flight_service, get_airport_index())
+    app.state.job_workers.start()
+    return app.state.job_workers
+
+
+def start_job_workers(app: FastAPI) -> Optional[JobWorkerPool]:
+    """ジョブモード（ANALYZE_JOB_MODE=true）なら起動時にワーカーを開始する"""
+    if not job_mode_enabled():
+        return None
+    return ensure_job_workers(app)
+
+
+async def get_job_workers(request: Request) -> JobWorkerPool:
+    """
+    ジョブのキューとワーカー（イベントループ上で生成・起動する）
+
+    ジョブモードでなければジョブは存在しないため 404 を返し、ワーカーも起動しない。
+    """
+    if not job_mode_enabled():
+        raise HTTPException(status_code=404, detail="job mode is disabled")
+    return ensure_job_workers(request.app)
+
+
+def ensure_flight_service(app: FastAPI) -> FlightAnalyzerService:
+    """app.state のサービスを取得（未生成なら生成して登録する）"""
+    if getattr(app.state, "flight_service", None) is None:
+        init_app_state(app)
+        app.state.flight_service = create_flight_service(app.state.http_clients)
+    return app.state.flight_service
+
+
+async def get_flight_service(request: Request) -> FlightAnalyzerService:
+    """
+    リクエストスコープでサービスを取得
+
+    同期関数の依存はスレッドプールで実行され、初回の同時リクエストで
+    サービスが複数生成されてしまうため、イベントループ上で実行する。
+
+    初回リクエスト時に生成してプロセス内で使い回す。
+    lifespan を実行しないランタイム（一部のサーバーレス環境）でも同様に動作する。
+    """
+    return ensure_flight_service(request.app)
@@ -0,0 +1,286 @@
+"""
+HTTP キャッシュと圧縮
+- 強い ETag と If-None-Match による 304 応答
+- HTML・JSON・CSS などのテキスト応答の圧縮（brotli があれば br、なければ gzip）
+- /static の長期キャッシュ（内容のハッシュを付けた URL のみ immutable）
+
+圧縮した応答の ETag には符号化ごとの接尾辞（"...-br" / "...-gzip"）を付けて
+表現ごとに区別し、リクエストの If-None-Match からは取り除いてからアプリに渡す。
+"""
+import hashlib
+import os
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+STATIC_URL = "/static"
+# 内容のハッシュを付けた URL は内容が変われば URL も変わるため、1年キャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# ハッシュなしの URL と HTML 断片は毎回 ETag で再検証させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# 圧縮する Content-Type（SSE は逐次送信を優先して圧縮しない）
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "application/x-ndjson", "image/svg+xml",
+)
+
+
+def strong_etag(body: bytes) -> str:
+    """本文のハッシュから強い ETag を作る"""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match が ETag に一致するか（If-None-Match は弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+def conditional_response(
+    request: Request,
+    body: bytes,
+    media_type: str = "text/html; charset=utf-8",
+    status_code: int = 200,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+) -> Response:
+    """
+    強い ETag つきの応答を返す（GET/HEAD で If-None-Match が一致すれば本文なしの 304）
+
+    ETag は本文そのもののハッシュなので、描画結果が同じなら別プロセスでも同じ値になる。
+    """
+    etag = strong_etag(body)
+    response_headers = {"ETag": etag, "Cache-Control": cache_control}
+    if (
+        status_code == 200
+        and request.method in ("GET", "HEAD")
+        and etag_matches(request.headers.get("if-none-match"), etag)
+    ):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=response_headers)
+
+
+@lru_cache(maxsize=None)
+def _static_digest(path: str) -> str:
+    with open(os.path.join(STATIC_DIR, path), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def static_digest() -> str:
+    """/static 以下の全ファイルのハッシュ（static_url を埋め込んだ描画済み断片のキーに使う）"""
+    digest = hashlib.sha256()
+    for directory, _, files in sorted(os.walk(STATIC_DIR)):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, STATIC_DIR).encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def static_url(path: str) -> str:
+    """
+    静的ファイルの URL に内容のハッシュを付ける（テンプレートから使う）
+
+    ファイルが変われば URL も変わるため、ブラウザと CDN に長期キャッシュさせられる。
+    """
+    path = path.lstrip("/")
+    try:
+        return f"{STATIC_URL}/{path}?v={_static_digest(path)}"
+    except OSError:
+        return f"{STATIC_URL}/{path}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """ハッシュ付きの URL（?v=...）は immutable で長期キャッシュ、それ以外は再検証させる StaticFiles"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        query = scope.get("query_string", b"")
+        versioned = query.startswith(b"v=") or b"&v=" in query
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL
+        return response
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """Accept-Encoding を {符号化: q 値} にする"""
+    accepted = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """使う符号化（br は brotli がインストールされている場合のみ）"""
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (("br", "gzip") if brotli is not None else ("gzip",))
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def _split_etag_suffix(tag: str) -> Tuple[str, Optional[str]]:
+    """"abc-br" → ("abc", "br")（接尾辞がなければ (tag, None)）"""
+    for encoding in ("br", "gzip"):
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)] + '"', encoding
+    return tag, None
+
+
+class _Compressor:
+    """gzip / brotli の逐次圧縮（チャンクごとにフラッシュして送信を遅らせない）"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31: gzip ヘッダーつき
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    テキスト応答の圧縮（ASGI ミドルウェア）
+
+    Accept-Encoding に応じて br（brotli がある場合）か gzip で圧縮する。
+    minimum_size 未満の1回で終わる応答・SSE・圧縮済みの応答はそのまま送る。
+    ストリーミング応答はチャンクごとにフラッシュするため、NDJSON の逐次送信は保たれる。
+    """
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    @classmethod
+    def from_env(cls, app) -> "CompressionMiddleware":
+        """`COMPRESSION_MIN_SIZE`, `COMPRESSION_GZIP_LEVEL`, `COMPRESSION_BROTLI_QUALITY`"""
+        return cls(
+            app,
+            minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE") or 500),
+            gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL") or 6),
+            brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY") or 5),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""))
+
+        # If-None-Match から符号化の接尾辞を外し、アプリ側の ETag と比較できるようにする。
+        # scope は複製せずに書き換える（アプリが設定する scope["route"] を外側の
+        # MetricsMiddleware が読むため）
+        echoed = None
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            tags = []
+            for tag in if_none_match.split(","):
+                tag, suffix = _split_etag_suffix(tag.strip())
+                echoed = echoed or suffix
+                tags.append(tag)
+            scope["headers"] = [
+                (k, v) for k, v in scope["headers"] if k != b"if-none-match"
+            ] + [(b"if-none-match", ", ".join(tags).encode("latin-1"))]
+
+        if encoding is None and echoed is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                if message["status"] == 304:
+                    # クライアントが持っている表現の ETag を返す
+                    if echoed is not None:
+                        _suffix_etag(MutableHeaders(raw=message["headers"]), echoed)
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                response_headers = MutableHeaders(raw=start_message["headers"])
+                content_type = response_headers.get("content-type", "").split(";")[0].strip().lower()
+                if (
+                    encoding is None
+                    or "content-encoding" in response_headers
+                    or content_type not in COMPRESSIBLE_TYPES
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                _suffix_etag(response_headers, encoding)
+                compressed = compressor.compress(body, final=not more_body)
+                if more_body:
+                    del response_headers["Content-Length"]
+                else:
+                    response_headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                await send({**message, "body": compressed})
+                return
+            await send({**message, "body": compressor.compress(body, final=not more_body)})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _suffix_etag(headers: MutableHeaders, encoding: str) -> None:
+    """強い ETag に符号化の接尾辞を付ける（弱い ETag はそのまま）"""
+    etag = headers.get("etag")
+    if etag and etag.startswith('"') and etag.endswith('"'):
+        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
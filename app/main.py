@@ -1,24 +1,83 @@
 """
 FastAPI メインアプリケーション
 """
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.routers import pages
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
+from app.dependencies import (
+    init_app_state, close_app_state, get_flight_service, get_fragment_cache, start_job_workers,
+    start_prefetch_task
+)
+from app.http_caching import STATIC_DIR, STATIC_URL, CachedStaticFiles, CompressionMiddleware
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.routers import api, pages
+from app.serialization import FastJSONResponse
+from app.metrics import (
+    CACHE_ENTRIES, REGISTRY, SINGLE_FLIGHT_IN_FLIGHT, MetricsMiddleware
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """共有 HTTP クライアント（接続プール）の生成と破棄、事前取得タスク・ジョブのワーカーの起動と停止"""
+    init_app_state(app)
+    prefetch_task = start_prefetch_task(app)
+    start_job_workers(app)
+    yield
+    if prefetch_task is not None:
+        prefetch_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await prefetch_task
+    await close_app_state(app)
+
 
 app = FastAPI(
     title="Flight Optimizer AI",
     description="隠れた格安航空券を見つけるAIツール",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+    # JSON レスポンスは orjson でエンコード（未インストールなら標準の json）
+    default_response_class=FastJSONResponse
 )
 
-# 静的ファイルをマウント
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# HTML・静的ファイル・JSON の圧縮（br / gzip）
+app.add_middleware(CompressionMiddleware.from_env)
+# ステージ別の計測（Server-Timing ヘッダーと /metrics）。外側に置き、圧縮の時間も応答時間に含める
+app.add_middleware(MetricsMiddleware)
+
+# 静的ファイルをマウント（ETag と Cache-Control つき）
+app.mount(STATIC_URL, CachedStaticFiles(directory=STATIC_DIR), name="static")
 
 # ルーターを追加
 app.include_router(pages.router)
+app.include_router(api.router)
 
 
 @app.get("/health")
 async def health_check():
     """ヘルスチェック"""
     return {"status": "ok"}
+
+
+@app.get("/cache-stats")
+async def cache_stats(flight_service: FlightAnalyzerService = Depends(get_flight_service)):
+    """キャッシュのヒット/ミス/追い出し件数"""
+    return {
+        "fare": flight_service.fare_cache.stats(),
+        "analysis": flight_service.analysis_cache.stats(),
+        "fragment": get_fragment_cache().stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus テキスト形式のメトリクス（ワーカープロセス単位）"""
+    CACHE_ENTRIES.set(len(get_fragment_cache().backend), "fragment_cache")
+    flight_service = getattr(app.state, "flight_service", None)
+    if flight_service is not None:
+        CACHE_ENTRIES.set(len(flight_service.fare_cache.backend), "fare_cache")
+        CACHE_ENTRIES.set(len(flight_service.analysis_cache.backend), "analysis_cache")
+        SINGLE_FLIGHT_IN_FLIGHT.set(flight_service.fare_flights.in_flight(), "fares")
+        SINGLE_FLIGHT_IN_FLIGHT.set(flight_service.llm_flights.in_flight(), "analysis")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,322 @@
+"""
+メトリクス計測
+ステージ別の所要時間・上流の応答・キャッシュのヒットなどをプロセス内で集計し、
+Prometheus のテキスト形式（/metrics）とリクエストごとの Server-Timing ヘッダーで公開する
+
+- ヒストグラムは固定バケットで、観測は二分探索と加算のみ
+- 更新はイベントループ上でのみ行う前提でロックを持たない（ワーカープロセスごとに集計し、
+  Prometheus 側でインスタンス単位に合算する）
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 秒単位の既定バケット（上流 API の数秒〜テンプレート描画の数ミリ秒をカバー）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """増減する値（実行中のリクエスト数など）"""
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """固定バケットのヒストグラム（バケットごとの件数・合計・件数を保持）"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels → [バケットごとの件数..., +Inf の件数], 合計
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    """メトリクスの登録と Prometheus テキスト形式への出力"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "hrs_stage_duration_seconds", "Duration of each processing stage", ("stage",)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "hrs_http_request_duration_seconds", "HTTP request duration by route", ("method", "route")
+)
+HTTP_RESPONSES = REGISTRY.counter(
+    "hrs_http_responses_total", "HTTP responses by route and status", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "hrs_http_requests_in_flight", "HTTP requests currently being handled"
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "hrs_upstream_responses_total", "Upstream API responses by status code or error type", ("upstream", "status")
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "hrs_upstream_requests_in_flight", "Upstream API requests currently in flight", ("upstream",)
+)
+MOCK_FALLBACKS = REGISTRY.counter(
+    "hrs_mock_fallbacks_total", "Responses served from mock data instead of the upstream", ("upstream", "reason")
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "hrs_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result")
+)
+CACHE_ENTRIES = REGISTRY.gauge(
+    "hrs_cache_entries", "Entries currently held by each cache", ("cache",)
+)
+SINGLE_FLIGHT_IN_FLIGHT = REGISTRY.gauge(
+    "hrs_single_flight_keys_in_flight", "Keys with an upstream call in flight", ("group",)
+)
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "hrs_deadline_exceeded_total", "Stages cut off by the end-to-end request deadline", ("stage",)
+)
+DEGRADED_RESPONSES = REGISTRY.counter(
+    "hrs_degraded_responses_total", "Responses served without a stage that ran out of budget", ("reason",)
+)
+UPSTREAM_HEDGES = REGISTRY.counter(
+    "hrs_upstream_hedges_total", "Hedged duplicate upstream calls (fired, and won by the duplicate)", ("upstream", "outcome")
+)
+LLM_TOKENS = REGISTRY.histogram(
+    "hrs_llm_tokens", "Tokens per LLM call (prompt, completion, reasoning, and the local prompt estimate)", ("kind",),
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+PREFETCH_REFRESHES = REGISTRY.counter(
+    "hrs_prefetch_refreshes_total", "Refresh-ahead work for popular routes by kind and outcome", ("kind", "outcome")
+)
+FARE_PROVIDER_CALLS = REGISTRY.counter(
+    "hrs_fare_provider_calls_total",
+    "Fare provider calls made by the aggregator (used, empty, error, cancelled, skipped)", ("provider", "outcome")
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "hrs_circuit_breaker_state", "Circuit breaker state per upstream (0=closed, 1=half-open, 2=open)", ("upstream",)
+)
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "hrs_admission_decisions_total",
+    "Admission decisions for analyses (admitted, queued, rate_limited, overloaded, queue_timeout)", ("outcome",)
+)
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "hrs_admission_in_flight", "Analyses currently holding an admission slot"
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "hrs_admission_queue_depth", "Analyses waiting for an admission slot"
+)
+ANALYSIS_JOBS = REGISTRY.counter(
+    "hrs_analysis_jobs_total", "Background analysis jobs by outcome (enqueued, rejected, done, failed, reclaimed)",
+    ("outcome",)
+)
+
+
+# ---- Server-Timing ----
+
+class ServerTiming:
+    """1リクエスト分のステージ別所要時間（Server-Timing ヘッダー用）"""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.entries.append((stage, seconds))
+
+    def header(self, total: Optional[float] = None) -> str:
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.entries]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_timing: ContextVar[Optional[ServerTiming]] = ContextVar("server_timing", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """ステージの所要時間をヒストグラムと現在のリクエストの Server-Timing に記録"""
+    STAGE_SECONDS.observe(seconds, stage)
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        record_stage(self.name, time.perf_counter() - self.start)
+
+
+def stage(name: str) -> _Stage:
+    """with ブロックの所要時間をステージとして記録する（@contextmanager より軽量）"""
+    return _Stage(name)
+
+
+@contextmanager
+def upstream_call(upstream: str) -> Iterator[None]:
+    """上流呼び出しの実行中件数を数える"""
+    UPSTREAM_IN_FLIGHT.inc(upstream)
+    try:
+        yield
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(upstream)
+
+
+class MetricsMiddleware:
+    """
+    リクエスト単位の計測（ASGI ミドルウェア）
+
+    ルートのパステンプレート単位で所要時間とステータスを集計し、
+    レスポンスヘッダーに Server-Timing を付与する。ストリーミング応答では
+    ヘッダー送信時点までのステージのみが含まれる。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header(time.perf_counter() - start).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _current_timing.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "other"
+            method = scope.get("method", "")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method, route)
+            HTTP_RESPONSES.inc(method, route, status)
@@ -11,6 +11,18 @@ class FlightSearchRequest(BaseModel):
     departure: str = Field(..., description="出発地")
     arrival: str = Field(..., description="到着地")
     date: Optional[str] = Field(None, description="日程（YYYY-MM-DD）")
+    flex_days: int = Field(0, ge=0, le=3, description="前後に広げて検索する日数")
+    metro: bool = Field(False, description="出発地・到着地を都市圏の空港（羽田/成田など）に広げて検索する")
+
+
+class FlightSegment(BaseModel):
+    """オファーを構成する1区間（搭乗1回分）"""
+    departure_airport: str = Field(..., description="出発空港コード")
+    arrival_airport: str = Field(..., description="到着空港コード")
+    departure_time: str = Field("", description="出発時刻")
+    arrival_time: str = Field("", description="到着時刻")
+    airline: str = Field("", description="航空会社")
+    flight_number: str = Field("", description="便名")
 
 
 class FlightOffer(BaseModel):
@@ -22,12 +34,45 @@ class FlightOffer(BaseModel):
     price: float = Field(..., description="価格")
     currency: str = Field(..., description="通貨")
     booking_link: Optional[str] = Field(None, description="予約リンク")
+    segments: List[FlightSegment] = Field(default_factory=list, description="乗り継ぎを含む全区間")
 
 
 class RawFlightData(BaseModel):
     """外部APIから取得した生のフライトデータ"""
     source: str = Field(..., description="データソース（Amadeus等）")
     offers: List[FlightOffer] = Field(default_factory=list, description="フライトオファーのリスト")
+    is_mock: bool = Field(False, description="モックデータかどうか")
+    fetched_at: Optional[float] = Field(None, description="取得時刻（UNIX 時間）")
+    from_cache: bool = Field(False, description="キャッシュから返したかどうか")
+
+
+class DatePrice(BaseModel):
+    """日付別の最安値（柔軟日程検索のカレンダー1マス）"""
+    date: str = Field(..., description="日付（YYYY-MM-DD）")
+    min_price: Optional[float] = Field(None, description="最安値")
+    currency: str = Field("JPY", description="通貨")
+    offer_count: int = Field(0, description="オファー件数")
+
+
+class MetroFare(BaseModel):
+    """都市圏の空港の組み合わせごとの最安値（近隣空港マトリクスの1マス）"""
+    departure: str = Field(..., description="出発空港（IATA コード）")
+    arrival: str = Field(..., description="到着空港（IATA コード）")
+    min_price: Optional[float] = Field(None, description="最安値（取得できなければ None）")
+    currency: str = Field("JPY", description="通貨")
+    airline: Optional[str] = Field(None, description="最安便の航空会社")
+    flight_number: Optional[str] = Field(None, description="最安便の便名")
+    offer_count: int = Field(0, description="オファー件数")
+
+
+class PriceInsight(BaseModel):
+    """運賃履歴に基づく価格評価"""
+    price: float = Field(..., description="評価対象の価格（今回の最安値）")
+    cheaper_than_percent: float = Field(..., description="観測運賃のうち、この価格より高いものの割合（%）")
+    sample_size: int = Field(..., description="観測件数")
+    median_price: float = Field(..., description="観測価格の中央値")
+    min_price_30d: Optional[float] = Field(None, description="直近30日の最安値")
+    trend_per_day: Optional[float] = Field(None, description="直近30日の価格トレンド（円/日）")
 
 
 class HiddenFlightOption(BaseModel):
@@ -48,3 +93,44 @@ class FlightAnalysisResponse(BaseModel):
     )
     avoid_tips: str = Field(..., description="価格操作回避のヒント")
     raw_data: Optional[RawFlightData] = Field(None, description="参考にした実データ")
+    price_calendar: List[DatePrice] = Field(
+        default_factory=list,
+        description="日付別の最安値カレンダー（柔軟日程検索時）"
+    )
+    price_insight: Optional[PriceInsight] = Field(None, description="運賃履歴に基づく価格評価")
+    metro_matrix: List[MetroFare] = Field(
+        default_factory=list,
+        description="出発地・到着地の都市圏の空港の組み合わせごとの最安値（近隣空港検索時）"
+    )
+    degraded: Optional[str] = Field(
+        None,
+        description="制限時間内に終わらず省略した段階（fares / analysis）"
+    )
+
+
+class BatchAnalysisRequest(BaseModel):
+    """一括分析リクエスト"""
+    requests: List[FlightSearchRequest] = Field(..., max_length=500, description="分析するルートのリスト")
+    concurrency: Optional[int] = Field(None, ge=1, le=32, description="同時実行数")
+    timeout: Optional[float] = Field(None, gt=0, le=300, description="1件あたりの制限時間（秒）")
+
+
+class BatchAnalysisItem(BaseModel):
+    """一括分析の1件分の結果（NDJSON の1行）"""
+    index: int = Field(..., description="リクエスト内の位置")
+    request: FlightSearchRequest = Field(..., description="元のリクエスト")
+    result: Optional[FlightAnalysisResponse] = Field(None, description="分析結果")
+    error: Optional[str] = Field(None, description="エラー内容（失敗時）")
+    elapsed_ms: float = Field(..., description="処理時間（ミリ秒）")
+
+
+class AnalysisJobStatus(BaseModel):
+    """分析ジョブの状態（ANALYZE_JOB_MODE の /analyze で積んだジョブ）"""
+    id: str = Field(..., description="ジョブ ID")
+    status: str = Field(..., description="queued / running / done / failed")
+    request: FlightSearchRequest = Field(..., description="元のリクエスト")
+    position: Optional[int] = Field(None, description="待機中の順番（0 なら次に実行される）")
+    result: Optional[FlightAnalysisResponse] = Field(None, description="分析結果（完了時）")
+    error: Optional[str] = Field(None, description="エラー内容（失敗時）")
+    created_at: float = Field(..., description="投入時刻（UNIX 時刻）")
+    finished_at: Optional[float] = Field(None, description="完了時刻（UNIX 時刻）")
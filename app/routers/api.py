@@ -0,0 +1,107 @@
+"""
+JSON API ルーター
+社内ツール向けの一括分析エンドポイントと分析ジョブの参照
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.models.schemas import AnalysisJobStatus, BatchAnalysisItem, BatchAnalysisRequest, FlightSearchRequest
+from app.services.airport_index import AirportIndex
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.job_queue import QUEUED, JobWorkerPool
+from app.services.metro_matrix import expand_metro
+from app.clients.resilience import Deadline
+from app.dependencies import get_airports, get_flight_service, get_job_workers
+import asyncio
+import os
+import time
+
+router = APIRouter(prefix="/api")
+
+# 一括分析の既定値（リクエストで上書き可能）
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY") or 8)
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT") or 25.0)
+# 締め切り後に縮退した結果を組み立てる猶予（これも超えたらエラー扱い）
+BATCH_TIMEOUT_GRACE = 1.0
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(
+    batch: BatchAnalysisRequest,
+    flight_service: FlightAnalyzerService = Depends(get_flight_service),
+    airports: AirportIndex = Depends(get_airports)
+):
+    """
+    複数ルートの一括分析（NDJSON ストリーミング）
+
+    完了した順に BatchAnalysisItem を1行ずつ返す。
+    各項目のエラーやタイムアウトはその行の error に記録し、バッチ全体は失敗させない。
+    """
+    semaphore = asyncio.Semaphore(batch.concurrency or BATCH_CONCURRENCY)
+    timeout = batch.timeout or BATCH_ITEM_TIMEOUT
+
+    async def run_item(index: int, item: FlightSearchRequest) -> BatchAnalysisItem:
+        async with semaphore:
+            start = time.perf_counter()
+            result, error = None, None
+            departure = item.departure.strip().upper()
+            arrival = item.arrival.strip().upper()
+            if departure not in airports or arrival not in airports:
+                invalid = departure if departure not in airports else arrival
+                error = f"無効な空港コードです: {invalid}"
+            else:
+                try:
+                    # 締め切りに間に合わない段階は省略され、実データのみの結果が返る
+                    result = await asyncio.wait_for(
+                        flight_service.analyze_route(
+                            departure, arrival, item.date, flex_days=item.flex_days,
+                            deadline=Deadline(timeout),
+                            metro_codes=expand_metro(airports, departure, arrival) if item.metro else None
+                        ),
+                        timeout + BATCH_TIMEOUT_GRACE
+                    )
+                except asyncio.TimeoutError:
+                    error = f"制限時間（{timeout:g}秒）を超えました"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            return BatchAnalysisItem(
+                index=index,
+                request=item,
+                result=result,
+                error=error,
+                elapsed_ms=(time.perf_counter() - start) * 1000
+            )
+
+    async def lines():
+        tasks = [
+            asyncio.create_task(run_item(index, item))
+            for index, item in enumerate(batch.requests)
+        ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                item = await completed
+                yield item.model_dump_json() + "\n"
+        finally:
+            # クライアント切断時は残りの分析を止める
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJobStatus)
+async def get_job(job_id: str, job_workers: JobWorkerPool = Depends(get_job_workers)):
+    """分析ジョブの状態と結果"""
+    job = await run_in_threadpool(job_workers.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return AnalysisJobStatus(
+        id=job.id,
+        status=job.status,
+        request=job.request,
+        position=await run_in_threadpool(job_workers.store.position, job) if job.status == QUEUED else None,
+        result=job.response(),
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
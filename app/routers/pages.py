@@ -2,31 +2,63 @@
 ページルーター
 HTMX を使った Web インターフェースのルート定義
 """
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Depends, Request, Form, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from app.models.schemas import FlightAnalysisResponse, FlightSearchRequest, HiddenFlightOption
 from app.services.flight_analyzer import FlightAnalyzerService
-from typing import Optional
-import json
-import os
+from app.clients.resilience import Deadline, DeadlineExceeded
+from app.services.airport_index import AirportIndex, build_option_html, normalize
+from app.services.fare_cache import describe_freshness
+from app.services.metro_matrix import expand_metro
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.job_queue import DONE, FAILED, QUEUED, JobQueueFull, JobWorkerPool
+from app.metrics import ANALYSIS_JOBS, stage
+from app.dependencies import (
+    ensure_job_workers, get_admission_controller, get_airports, get_flight_service,
+    get_fragment_cache, get_job_workers, get_request_deadline, job_mode_enabled
+)
+from app.http_caching import conditional_response
+from app.templating import create_templates
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
-flight_service = FlightAnalyzerService()
+templates = create_templates()
 
-# 空港データの読み込み
-AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "airports.json")
-with open(AIRPORTS_FILE, "r", encoding="utf-8") as f:
-    airports_data = json.load(f)
+# 柔軟日程検索で前後に広げる最大日数
+MAX_FLEX_DAYS = 3
+# 空港データはデプロイ時にしか変わらないため、補完の結果はブラウザに1時間キャッシュさせる
+AIRPORT_SEARCH_CACHE_CONTROL = "public, max-age=3600"
+
+
+def _fragment_response(request: Request, name: str, context: Dict[str, Any], cache: bool = True) -> Response:
+    """
+    テンプレートを描画して強い ETag つきで返す（GET で ETag が一致すれば 304）
+
+    cache=True なら描画入力（request 以外の context）が同じ描画済みの断片を再利用する。
+    context の値は BaseModel か JSON にできる値に限る。
+    """
+    template = templates.get_template(name)
+
+    def render() -> str:
+        return template.render({"request": request, **context})
+
+    if cache:
+        fragments = get_fragment_cache()
+        key = fragments.key(name, *(item for pair in sorted(context.items()) for item in pair))
+        body = fragments.get_or_render(key, render)
+    else:
+        with stage("render"):
+            body = render().encode("utf-8")
+    return conditional_response(request, body)
 
 
 @router.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """ホームページ"""
-    return templates.TemplateResponse(
-        "index.html", 
-        {"request": request}
-    )
+    return _fragment_response(request, "index.html", {})
 
 
 @router.post("/analyze", response_class=HTMLResponse)
@@ -34,18 +66,33 @@ async def analyze_flight(
     request: Request,
     departure: str = Form(...),
     arrival: str = Form(...),
-    date: Optional[str] = Form(None)
+    date: Optional[str] = Form(None),
+    stream: Optional[str] = Form(None),
+    flex_days: int = Form(0),
+    metro: Optional[str] = Form(None),
+    flight_service: FlightAnalyzerService = Depends(get_flight_service),
+    airports: AirportIndex = Depends(get_airports),
+    deadline: Deadline = Depends(get_request_deadline),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """フライト分析（HTMX パーシャル）"""
+    """
+    フライト分析（HTMX パーシャル）
+
+    stream が指定された場合は実データだけを先に返し、
+    AI 分析は /analyze/stream から SSE で順次送る。
+    metro が指定された場合は都市圏の空港の全組み合わせも検索する。
+    ジョブモード（ANALYZE_JOB_MODE=true）ではジョブを積んで、状態をポーリングするパーシャルを返す。
+    アドミッション制御で断った場合は Retry-After つきで「再試行」の案内を返す。
+    """
     try:
         # 入力の正規化（IATAコードは常に大文字）
         departure_code = departure.strip().upper()
         arrival_code = arrival.strip().upper()
+        flex_days = min(max(flex_days, 0), MAX_FLEX_DAYS)
 
         # 有効な空港コードかチェック
-        valid_codes = {a["code"] for a in airports_data}
-        if departure_code not in valid_codes or arrival_code not in valid_codes:
-            invalid_code = departure_code if departure_code not in valid_codes else arrival_code
+        if departure_code not in airports or arrival_code not in airports:
+            invalid_code = departure_code if departure_code not in airports else arrival_code
             return templates.TemplateResponse(
                 "partials/result_partial.html",
                 {
@@ -54,24 +101,34 @@ async def analyze_flight(
                 }
             )
 
-        # サービス層で分析を実行
-        result = await flight_service.analyze_route(departure_code, arrival_code, date)
-        
-        # 代理モード（モック）の警告
-        warnings = []
-        if flight_service.llm_client.use_mock:
-            warnings.append("Grok APIキーが未設定のため、分析はデモ用です。")
-        if flight_service.flight_data_client.use_mock:
-            warnings.append("SerpApiキーが未設定のため、フライトデータはモックです。")
-        
-        warning_msg = " ".join(warnings) if warnings else None
+        # 事前取得の対象を決めるため、検索されたルートを記録する
+        flight_service.popularity.record(departure_code, arrival_code, date)
 
-        return templates.TemplateResponse(
+        if job_mode_enabled():
+            return await _enqueue_analysis(
+                request, admission,
+                FlightSearchRequest(
+                    departure=departure_code, arrival=arrival_code, date=date, flex_days=flex_days, metro=bool(metro)
+                )
+            )
+
+        try:
+            async with admission.slot(admission.client_key(request), deadline):
+                result, stream_url = await _run_analysis(
+                    flight_service, departure_code, arrival_code, date, flex_days, bool(stream), deadline,
+                    expand_metro(airports, departure_code, arrival_code) if metro else None
+                )
+        except AdmissionRejected as rejected:
+            return _busy_response(request, rejected)
+
+        return _fragment_response(
+            request,
             "partials/result_partial.html",
             {
-                "request": request,
                 "result": result,
-                "warning": warning_msg
+                "warning": _mock_warning(flight_service),
+                "freshness": describe_freshness(result.raw_data),
+                "stream_url": stream_url
             }
         )
     except Exception as e:
@@ -84,9 +141,209 @@ async def analyze_flight(
         )
 
 
+def _mock_warning(flight_service: FlightAnalyzerService) -> Optional[str]:
+    """代理モード（モック）の警告"""
+    warnings = []
+    if flight_service.llm_client.use_mock:
+        warnings.append("Grok APIキーが未設定のため、分析はデモ用です。")
+    if flight_service.flight_data_client.use_mock:
+        warnings.append("SerpApiキーが未設定のため、フライトデータはモックです。")
+    return " ".join(warnings) if warnings else None
+
+
+def _busy_response(request: Request, rejected: AdmissionRejected) -> HTMLResponse:
+    """混雑時は待たせずに断り、しばらくしてからの再試行を促す"""
+    response = templates.TemplateResponse(
+        "partials/result_partial.html",
+        {"request": request, "busy": rejected.message}
+    )
+    response.headers["Retry-After"] = str(rejected.retry_after)
+    return response
+
+
+async def _enqueue_analysis(
+    request: Request,
+    admission: AdmissionController,
+    search: FlightSearchRequest
+) -> HTMLResponse:
+    """
+    分析をジョブとして積み、状態をポーリングするパーシャルを返す
+
+    処理枠はワーカーの数で決まるため、ここではクライアントごとのレート制限だけを掛ける。
+    """
+    job_workers = ensure_job_workers(request.app)
+    try:
+        admission.check_rate(admission.client_key(request))
+        job_id = await run_in_threadpool(job_workers.store.enqueue, search)
+    except AdmissionRejected as rejected:
+        return _busy_response(request, rejected)
+    except JobQueueFull:
+        ANALYSIS_JOBS.inc("rejected")
+        return _busy_response(request, AdmissionRejected("overloaded", job_workers.poll_interval * 10))
+    ANALYSIS_JOBS.inc("enqueued")
+    job_workers.notify()
+    return await _job_response(request, job_workers, job_id)
+
+
+async def _job_response(request: Request, job_workers: JobWorkerPool, job_id: str) -> HTMLResponse:
+    """ジョブの状態に応じたパーシャル（完了までは自身を1秒ごとに取得し直す要素）"""
+    job = await run_in_threadpool(job_workers.store.get, job_id)
+    if job is None:
+        return templates.TemplateResponse(
+            "partials/result_partial.html",
+            {"request": request, "error": "分析ジョブが見つかりません。時間をおいてもう一度検索してください。"}
+        )
+    if job.status == FAILED:
+        return templates.TemplateResponse(
+            "partials/result_partial.html",
+            {"request": request, "error": f"分析中にエラーが発生しました: {job.error}"}
+        )
+    if job.status == DONE:
+        result = job.response()
+        return _fragment_response(
+            request,
+            "partials/result_partial.html",
+            {
+                "result": result,
+                "warning": _mock_warning(job_workers.flight_service),
+                "freshness": describe_freshness(result.raw_data),
+            }
+        )
+    # 待ち順位・状態が変わらない間のポーリングは 304 で済ませる
+    position = await run_in_threadpool(job_workers.store.position, job) if job.status == QUEUED else None
+    return _fragment_response(
+        request,
+        "partials/result_partial.html",
+        {"job": job, "position": position},
+        cache=False
+    )
+
+
+async def _run_analysis(
+    flight_service: FlightAnalyzerService,
+    departure_code: str,
+    arrival_code: str,
+    date: Optional[str],
+    flex_days: int,
+    stream: bool,
+    deadline: Deadline,
+    metro_codes: Optional[Tuple[List[str], List[str]]] = None
+) -> Tuple[FlightAnalysisResponse, Optional[str]]:
+    """分析を実行して (結果, SSE の URL) を返す（stream なら実データのみ取得する）"""
+    if not stream:
+        # サービス層で分析を実行
+        result = await flight_service.analyze_route(
+            departure_code, arrival_code, date, flex_days=flex_days, deadline=deadline, metro_codes=metro_codes
+        )
+        return result, None
+
+    # 実データのみ取得し、分析は SSE 側で行う（近隣空港の区間は SSE 側では運賃キャッシュから引く）
+    try:
+        raw_data, price_calendar, metro_matrix = await flight_service.get_offers_with_matrix(
+            departure_code, arrival_code, date, flex_days, metro_codes, deadline
+        )
+    except DeadlineExceeded:
+        # 運賃が間に合わなければ SSE は開かず、ローカル検索の候補のみ返す
+        return flight_service.degraded_response(departure_code, arrival_code, date), None
+    result = FlightAnalysisResponse(
+        route=flight_service.route_label(departure_code, arrival_code, date),
+        avoid_tips="",
+        raw_data=raw_data,
+        price_calendar=price_calendar,
+        price_insight=await flight_service.get_price_insight(departure_code, arrival_code, raw_data),
+        metro_matrix=metro_matrix
+    )
+    params = {"departure": departure_code, "arrival": arrival_code}
+    if date:
+        params["date"] = date
+    if flex_days:
+        params["flex_days"] = flex_days
+    if metro_codes:
+        params["metro"] = 1
+    return result, f"/analyze/stream?{urlencode(params)}"
+
+
+@router.get("/analyze/jobs/{job_id}", response_class=HTMLResponse)
+async def analyze_job(
+    request: Request,
+    job_id: str,
+    job_workers: JobWorkerPool = Depends(get_job_workers)
+):
+    """分析ジョブの状態（HTMX のポーリング用パーシャル）"""
+    return await _job_response(request, job_workers, job_id)
+
+
+def _sse_event(event: str, html: str) -> str:
+    """SSE のイベントを組み立てる（複数行データは行ごとに data: を付ける）"""
+    lines = html.splitlines() or [""]
+    return f"event: {event}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+@router.get("/analyze/stream")
+async def analyze_stream(
+    departure: str,
+    arrival: str,
+    date: Optional[str] = None,
+    flex_days: int = 0,
+    metro: Optional[str] = None,
+    flight_service: FlightAnalyzerService = Depends(get_flight_service),
+    airports: AirportIndex = Depends(get_airports),
+    deadline: Deadline = Depends(get_request_deadline),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """
+    AI 分析の SSE ストリーム（option → tips → done の順に送信）
+
+    /analyze で受け付けた検索の続きなので、クライアントのトークンは消費せず処理枠だけ確保する。
+    """
+    departure_code = departure.strip().upper()
+    arrival_code = arrival.strip().upper()
+    flex_days = min(max(flex_days, 0), MAX_FLEX_DAYS)
+    option_template = templates.get_template("partials/option_card.html")
+
+    async def events():
+        if departure_code not in airports or arrival_code not in airports:
+            yield _sse_event("done", "")
+            return
+        try:
+            async with admission.slot(deadline=deadline):
+                async for kind, payload in flight_service.stream_analysis(
+                    departure_code, arrival_code, date, flex_days, deadline,
+                    expand_metro(airports, departure_code, arrival_code) if metro else None
+                ):
+                    if kind == "option":
+                        try:
+                            option = HiddenFlightOption(**payload)
+                        except ValidationError:
+                            continue
+                        yield _sse_event("option", option_template.render(option=option))
+                    elif kind == "result":
+                        yield _sse_event("tips", str(payload.get("avoid_tips", "")))
+        except AdmissionRejected as rejected:
+            yield _sse_event("tips", f"AI 分析は混雑のため省略しました。{rejected.message}")
+        except Exception as e:
+            print(f"Analyze Stream Error: {e}")
+        yield _sse_event("done", "")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/search-airports", response_class=HTMLResponse)
-async def search_airports(request: Request, q: str = ""):
-    """空港検索（HTMX 補完用）"""
+async def search_airports(
+    request: Request,
+    q: str = "",
+    airports: AirportIndex = Depends(get_airports)
+):
+    """
+    空港検索（HTMX 補完用）
+
+    同じクエリの <option> 断片は再利用する。ブラウザには1時間キャッシュさせ、
+    期限切れ後の再検証には強い ETag で 304 を返す。
+    """
     # HTMX から送られるパラメータ名が 'q' でない場合への対応
     if not q:
         params = request.query_params
@@ -94,30 +351,15 @@ async def search_airports(request: Request, q: str = ""):
             # 最初のクエリパラメータの値を検索語として使用
             q = next(iter(params.values()), "")
             
-    q = q.strip().lower()
+    q = q.strip()
     if not q:
         return HTMLResponse(content="")
     
-    # 検索ロジック
-    matches = []
-    
-    # 完全一致
-    exact_match = [a for a in airports_data if a["code"].lower() == q]
-    # 前方一致 (IATAコード)
-    starts_with = [a for a in airports_data if a["code"].lower().startswith(q) and a not in exact_match]
-    # その他 (名称、都市名)
-    others = [
-        a for a in airports_data 
-        if (q in a["name"].lower() or q in a["city"].lower()) 
-        and a not in exact_match and a not in starts_with
-    ]
-    
-    matches = exact_match + starts_with + others
-    
+    # インデックス検索（完全一致 → 前方一致 → 名称・都市名、最大10件）し、
     # マッチした候補を <option> タグのリストとして返す
-    options = "".join([
-        f'<option value="{a["code"]}">{a["city"]} - {a["name"]} ({a["code"]})</option>' 
-        for a in matches[:10]  # 最大10件
-    ])
-    
-    return HTMLResponse(content=options)
+    fragments = get_fragment_cache()
+    body = fragments.get_or_render(
+        fragments.key("search-airports", normalize(q), 10),
+        lambda: build_option_html(airports.search(q, limit=10))
+    )
+    return conditional_response(request, body, cache_control=AIRPORT_SEARCH_CACHE_CONTROL)
@@ -0,0 +1,78 @@
+"""
+シリアライズの高速パス
+- JSON: orjson があれば上流応答のデコードと JSON レスポンスのエンコードに使う
+  （未インストールなら標準の json にフォールバック）
+- モデル: 検証済み・自前で組み立てたデータは検証を省いて生成する
+
+検証を省いてよいのは型が分かっているデータだけ。LLM の出力のような
+信頼できない入力は従来どおり通常のコンストラクタで検証すること。
+"""
+import json
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar, Union
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+M = TypeVar("M", bound=BaseModel)
+
+_new = object.__new__
+_setattr = object.__setattr__
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """JSON をデコード（失敗時は json.JSONDecodeError のサブクラスを送出）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """コンパクトな UTF-8 の JSON にエンコード（非 ASCII はエスケープしない）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """dumps でエンコードする JSONResponse（FastAPI の default_response_class 用）"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def _defaulted_fields(model: Type[BaseModel]) -> Optional[Tuple[Tuple[str, FieldInfo], ...]]:
+    """既定値を持つフィールド（private 属性を持つモデルは None = model_construct に任せる）"""
+    if model.__private_attributes__:
+        return None
+    return tuple((name, field) for name, field in model.model_fields.items() if not field.is_required())
+
+
+def construct(model: Type[M], values: Dict[str, Any]) -> M:
+    """
+    検証を省いてモデルを生成する（model_construct の軽量版）
+
+    pydantic 2.9 の model_construct はフィールドごとの処理が Python で書かれており、
+    小さいモデルでは通常の検証より遅い。ここでは values をそのまま __dict__ にする
+    （values は呼び出し側で新しく作った dict を渡し、値の型も呼び出し側が保証すること）。
+    """
+    defaulted = _defaulted_fields(model)
+    if defaulted is None:
+        return model.model_construct(**values)
+    fields_set = set(values)
+    for name, field in defaulted:
+        if name not in values:
+            values[name] = field.get_default(call_default_factory=True)
+    instance = _new(model)
+    _setattr(instance, "__dict__", values)
+    _setattr(instance, "__pydantic_fields_set__", fields_set)
+    _setattr(instance, "__pydantic_extra__", None)
+    _setattr(instance, "__pydantic_private__", None)
+    return instance
@@ -0,0 +1,213 @@
+"""
+アドミッション制御
+/analyze の前段で、クライアントごとのトークンバケット・同時実行数の上限・
+上限つきの待ち行列によって受け付けるリクエストを絞る
+
+負荷の急増時にすべてを上流へ流すと、SerpApi のクォータを使い切って全員がモックになり、
+待ち時間も際限なく伸びる。受け付けた分は上限内の待ちで処理し、
+溢れた分は待たせずに「しばらくしてから再試行」を返す。
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+from starlette.requests import HTTPConnection
+
+from app.clients.resilience import Deadline
+from app.metrics import ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, record_stage
+from app.services.rate_limit import TokenBucket
+
+# 断った理由ごとの表示メッセージ
+REJECTION_NOTICES = {
+    "rate_limited": "短時間に検索が集中しています。",
+    "overloaded": "ただいま混み合っています。",
+    "queue_timeout": "ただいま混み合っています。",
+}
+
+
+class AdmissionRejected(Exception):
+    """受け付けなかった（reason: rate_limited / overloaded / queue_timeout）"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        # Retry-After ヘッダー用の秒数（1 以上の整数）
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def message(self) -> str:
+        return f"{REJECTION_NOTICES[self.reason]}{self.retry_after}秒ほど待ってから再試行してください。"
+
+
+def client_key(connection: HTTPConnection, trust_proxy: bool = False) -> str:
+    """
+    クライアントの識別子（IP アドレス）
+
+    trust_proxy なら X-Forwarded-For の先頭を使う。ヘッダーを上書きする信頼できるプロキシ
+    （Vercel など）の背後でのみ有効にすること。直接受ける uvicorn ではクライアントが
+    リクエストごとに別の値を送れるため、接続元のアドレスを使う。
+    """
+    if trust_proxy:
+        forwarded = connection.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return connection.client.host if connection.client else "unknown"
+
+
+def trust_proxy_from_env() -> bool:
+    """
+    X-Forwarded-For を信頼するか（`ADMISSION_TRUST_PROXY`）
+
+    未設定なら Vercel 上（`VERCEL` が設定されている）でのみ信頼する。
+    Vercel はこのヘッダーをプラットフォーム側で上書きするため、クライアントが偽装した値は届かない。
+    """
+    value = (os.getenv("ADMISSION_TRUST_PROXY") or "").strip().lower()
+    if not value:
+        return bool(os.getenv("VERCEL"))
+    return value in ("1", "true", "yes", "on")
+
+
+class AdmissionController:
+    """
+    同時実行数の上限と待ち行列つきの受付
+
+    - クライアントごとに client_rate 件/秒（最大 client_burst 件）のトークンバケット
+    - 同時に処理するのは max_in_flight 件まで（0 以下で無制限）
+    - 溢れた分は max_queue 件まで到着順に待たせ、queue_timeout 秒
+      （と締め切りの残り時間）を過ぎたら断る。待ち行列も満杯なら即座に断る
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        max_queue: int = 32,
+        queue_timeout: float = 2.0,
+        client_rate: float = 0.5,
+        client_burst: float = 5.0,
+        max_clients: int = 10000,
+        trust_proxy: bool = False,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.trust_proxy = trust_proxy
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # クライアントごとのバケット（LRU。追い出されたクライアントは満タンから再開）
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # 1件が枠を占有する時間の指数移動平均（再試行までの目安）
+        self._hold = 1.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """
+        `ADMISSION_MAX_IN_FLIGHT`, `ADMISSION_MAX_QUEUE`, `ADMISSION_QUEUE_TIMEOUT`,
+        `ANALYZE_CLIENT_RATE_PER_SEC`, `ANALYZE_CLIENT_RATE_BURST`, `ADMISSION_MAX_CLIENTS`,
+        `ADMISSION_TRUST_PROXY`
+        """
+        return cls(
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT") or 32),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE") or 32),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT") or 2.0),
+            client_rate=float(os.getenv("ANALYZE_CLIENT_RATE_PER_SEC") or 0.5),
+            client_burst=float(os.getenv("ANALYZE_CLIENT_RATE_BURST") or 5.0),
+            max_clients=int(os.getenv("ADMISSION_MAX_CLIENTS") or 10000),
+            trust_proxy=trust_proxy_from_env(),
+        )
+
+    def client_key(self, connection: HTTPConnection) -> str:
+        return client_key(connection, self.trust_proxy)
+
+    def check_rate(self, client: str) -> None:
+        """クライアントのトークンを1つ消費する（足りなければ AdmissionRejected）"""
+        if self.client_rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        if not bucket.try_acquire():
+            ADMISSION_DECISIONS.inc("rate_limited")
+            raise AdmissionRejected("rate_limited", (1.0 - bucket.tokens) / bucket.rate)
+
+    def retry_after(self) -> float:
+        """待ち行列が一巡するまでの目安（秒）"""
+        if self.max_in_flight <= 0:
+            return 1.0
+        return self._hold * (len(self._waiters) + 1) / self.max_in_flight
+
+    async def acquire(self, deadline: Optional[Deadline] = None) -> None:
+        """処理枠を1つ確保する（空きがなければ待ち行列で待つ）"""
+        if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self._waiters):
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight)
+            ADMISSION_DECISIONS.inc("admitted")
+            return
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_DECISIONS.inc("overloaded")
+            raise AdmissionRejected("overloaded", self.retry_after())
+
+        timeout = self.queue_timeout if deadline is None else min(self.queue_timeout, deadline.remaining())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        start = time.perf_counter()
+        try:
+            # wait_for と違い、時間切れでも waiter をキャンセルしない（枠の受け渡しと競合させない）
+            done, _ = await asyncio.wait((waiter,), timeout=timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 枠を受け取った直後にキャンセルされた
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        record_stage("admission_wait", time.perf_counter() - start)
+        if not done:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+            ADMISSION_DECISIONS.inc("queue_timeout")
+            raise AdmissionRejected("queue_timeout", self.retry_after())
+        ADMISSION_DECISIONS.inc("queued")
+
+    def release(self) -> None:
+        """処理枠を返す（待っている先頭のリクエストがあればそのまま引き渡す）"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    @asynccontextmanager
+    async def slot(self, client: Optional[str] = None, deadline: Optional[Deadline] = None) -> AsyncIterator[None]:
+        """
+        受け付けたリクエストの処理区間
+
+        client を渡すとそのクライアントのトークンも消費する
+        （同じ操作の続き、たとえば SSE のストリームでは None にする）。
+        """
+        if client is not None:
+            self.check_rate(client)
+        await self.acquire(deadline)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold += 0.2 * (time.perf_counter() - start - self._hold)
+            self.release()
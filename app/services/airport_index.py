@@ -0,0 +1,218 @@
+"""
+空港検索インデックス
+起動時に一度だけ構築し、オートコンプリートを線形走査なしで処理する
+
+ビルド時に scripts/build_assets.py で構築済みインデックスを marshal 形式の
+バイナリに書き出しておくと、起動時は JSON の解析とインデックス構築を省ける。
+"""
+import hashlib
+import json
+import marshal
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# 構築済みバイナリの形式バージョン（インデックスの構造を変えたら上げる）
+BLOB_VERSION = 1
+
+
+def normalize(text: str) -> str:
+    """検索用の正規化（全角/半角の統一 + 小文字化）"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+class AirportIndex:
+    """
+    空港データの検索インデックス
+
+    - IATA コード → 空港 の辞書（完全一致・バリデーション用）
+    - コード接頭辞 → 空港ID列（前方一致用）
+    - 名称・都市名の n-gram 転置インデックス（部分一致用）
+
+    空港ID は元データ中の位置であり、各ポスティングリストは昇順に並ぶため
+    既存の「データ順」のランキングをそのまま保てる。
+    """
+
+    NGRAM = 2
+    # 都市名 → 空港コード列（近隣空港検索で初めて使うときに構築する）
+    _cities: Optional[Dict[str, List[str]]] = None
+
+    def __init__(self, airports: List[dict]):
+        self.airports = airports
+        self._by_code: Dict[str, int] = {}
+        self._prefixes: Dict[str, List[int]] = {}
+        self._codes: List[str] = []
+        self._texts: List[str] = []
+        self._grams: Dict[str, List[int]] = {}
+
+        for i, airport in enumerate(airports):
+            code = normalize(airport["code"])
+            self._codes.append(code)
+            self._by_code.setdefault(code, i)
+            for end in range(1, len(code) + 1):
+                self._prefixes.setdefault(code[:end], []).append(i)
+
+            name = normalize(airport["name"])
+            city = normalize(airport["city"])
+            # 区切り文字を挟むことでフィールドを跨いだ誤マッチを防ぐ
+            self._texts.append(f"{name}\x00{city}")
+            grams = set()
+            for field in (name, city):
+                grams.update(self._iter_grams(field))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(i)
+
+    @classmethod
+    def from_file(cls, path: str) -> "AirportIndex":
+        """JSON ファイルからインデックスを構築"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def load(cls, path: str, blob_path: Optional[str] = None) -> "AirportIndex":
+        """
+        構築済みバイナリがあればそれを読み込み、なければ JSON から構築
+
+        バイナリには元の JSON のハッシュを埋め込んであり、
+        JSON が更新されていれば古いバイナリは使わない。
+        """
+        with open(path, "rb") as f:
+            source = f.read()
+        if blob_path:
+            index = cls._from_blob(blob_path, hashlib.sha256(source).hexdigest())
+            if index is not None:
+                return index
+        return cls(json.loads(source))
+
+    @classmethod
+    def _from_blob(cls, blob_path: str, digest: str) -> Optional["AirportIndex"]:
+        try:
+            with open(blob_path, "rb") as f:
+                state = marshal.load(f)
+            version, blob_digest, airports, by_code, prefixes, codes, texts, grams = state
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != BLOB_VERSION or blob_digest != digest:
+            return None
+        index = cls.__new__(cls)
+        index.airports = airports
+        index._by_code = by_code
+        index._prefixes = prefixes
+        index._codes = codes
+        index._texts = texts
+        index._grams = grams
+        return index
+
+    @classmethod
+    def blob_is_fresh(cls, blob_path: str, source_path: str) -> bool:
+        """構築済みバイナリが source_path の現在の内容から作られたものか"""
+        with open(source_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return cls._from_blob(blob_path, digest) is not None
+
+    def dump_blob(self, blob_path: str, source_path: str) -> None:
+        """構築済みインデックスを source_path のハッシュ付きで書き出す"""
+        with open(source_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with open(blob_path, "wb") as f:
+            marshal.dump((
+                BLOB_VERSION, digest, self.airports, self._by_code,
+                self._prefixes, self._codes, self._texts, self._grams,
+            ), f)
+
+    @classmethod
+    def _iter_grams(cls, text: str) -> Iterator[str]:
+        """1文字 gram と n-gram を列挙（1文字クエリにも対応するため）"""
+        yield from text
+        for start in range(len(text) - cls.NGRAM + 1):
+            yield text[start:start + cls.NGRAM]
+
+    def __len__(self) -> int:
+        return len(self.airports)
+
+    def __contains__(self, code: str) -> bool:
+        return normalize(code) in self._by_code
+
+    def get(self, code: str) -> Optional[dict]:
+        """IATA コードから空港を取得"""
+        i = self._by_code.get(normalize(code))
+        return self.airports[i] if i is not None else None
+
+    def metro_codes(self, code: str) -> List[str]:
+        """同じ都市の空港コード（code を先頭に、残りはデータ順。未登録なら空）"""
+        airport = self.get(code)
+        if airport is None:
+            return []
+        if self._cities is None:
+            cities: Dict[str, List[str]] = {}
+            for other in self.airports:
+                cities.setdefault(normalize(other["city"]), []).append(other["code"])
+            self._cities = cities
+        codes = self._cities[normalize(airport["city"])]
+        return [airport["code"]] + [other for other in codes if other != airport["code"]]
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """
+        空港を検索
+
+        ランキング: コード完全一致 → コード前方一致 → 名称・都市名の部分一致
+        （各グループ内は元データ順）。上位 limit 件に達した時点で打ち切る。
+        """
+        q = normalize(query.strip())
+        if not q or limit <= 0:
+            return []
+
+        results: List[dict] = []
+        seen = set()
+        for i in self._iter_ranked(q):
+            if i in seen:
+                continue
+            seen.add(i)
+            results.append(self.airports[i])
+            if len(results) >= limit:
+                break
+        return results
+
+    def _iter_ranked(self, q: str) -> Iterator[int]:
+        prefixed = self._prefixes.get(q, ())
+        # 完全一致
+        for i in prefixed:
+            if self._codes[i] == q:
+                yield i
+        # 前方一致 (IATAコード)
+        yield from prefixed
+        # その他 (名称、都市名)
+        for i in self._iter_substring(q):
+            if not self._codes[i].startswith(q):
+                yield i
+
+    def _iter_substring(self, q: str) -> Iterator[int]:
+        """n-gram で候補を絞り込み、実際の部分一致で検証する"""
+        postings = self._candidate_postings(q)
+        if postings is None:
+            return
+        for i in postings:
+            if q in self._texts[i]:
+                yield i
+
+    def _candidate_postings(self, q: str) -> Optional[List[int]]:
+        """クエリの gram のうち最も短いポスティングリストを返す"""
+        if len(q) < self.NGRAM:
+            grams = {q}
+        else:
+            grams = {q[s:s + self.NGRAM] for s in range(len(q) - self.NGRAM + 1)}
+        shortest: Optional[List[int]] = None
+        for gram in grams:
+            posting = self._grams.get(gram)
+            if not posting:
+                return None
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+        return shortest
+
+
+def build_option_html(airports: Iterable[dict]) -> str:
+    """候補を <option> タグのリストに変換"""
+    return "".join(
+        f'<option value="{a["code"]}">{a["city"]} - {a["name"]} ({a["code"]})</option>'
+        for a in airports
+    )
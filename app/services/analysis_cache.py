@@ -0,0 +1,42 @@
+"""
+LLM 分析キャッシュ
+正規化したプロンプト入力のハッシュ（コンテンツアドレス）をキーに
+Grok の分析結果を保持し、同じ入力での再分析を省略する
+"""
+from typing import Optional
+from app.serialization import dumps, loads
+from app.services.cache import CacheBackend, create_cache_backend
+
+
+class AnalysisCache:
+    """LLMClient.analyze_flight_route の結果を保持する TTL キャッシュ"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        # 既定: メモリ / 1時間 / 512件
+        if backend is None:
+            backend = create_cache_backend("ANALYSIS_CACHE", 3600.0, 512)
+        self.backend = backend
+
+    def get(self, fingerprint: str) -> Optional[dict]:
+        """キャッシュ済みの分析結果を取得"""
+        entry = self.backend.get(fingerprint)
+        if entry is None:
+            return None
+        return loads(entry.value)
+
+    def age(self, fingerprint: str) -> Optional[float]:
+        """保存からの経過秒数（未登録なら None。事前取得の判定用）"""
+        return self.backend.age(fingerprint)
+
+    def set(self, fingerprint: str, result: dict) -> None:
+        """分析結果を保存（モック分析・途中で切れた分析は保存しない）"""
+        if result.get("is_mock") or result.get("is_partial"):
+            return
+        self.backend.set(
+            fingerprint,
+            dumps(result),
+        )
+
+    def stats(self) -> dict:
+        """ヒット/ミス/追い出しのカウンター"""
+        return {"entries": len(self.backend), "ttl": self.backend.ttl, **self.backend.stats.to_dict()}
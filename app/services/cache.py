@@ -0,0 +1,241 @@
+"""
+キャッシュバックエンド
+TTL + 件数上限（LRU）付きのキー・バリューストア。
+プロセス内（メモリ）とファイル（SQLite）の2種類を提供し、
+SQLite はサーバーレスのコールドスタートや複数ワーカー間でヒットを共有できる
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+from app.metrics import CACHE_LOOKUPS
+
+
+@dataclass
+class CacheStats:
+    """キャッシュの統計カウンター（プロセス単位）"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class CacheEntry:
+    """キャッシュから取り出した値"""
+    value: bytes
+    stored_at: float
+
+    @property
+    def age(self) -> float:
+        """保存からの経過秒数"""
+        return max(0.0, time.time() - self.stored_at)
+
+
+class CacheBackend(ABC):
+    """キャッシュバックエンドの共通インターフェース"""
+
+    def __init__(self, ttl: float, max_entries: int, name: str = "cache"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # メトリクスのラベル（fare_cache / analysis_cache など）
+        self.name = name
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """値を取得（期限切れ・未登録なら None）"""
+        found = self._get(key)
+        if found is None:
+            self.stats.misses += 1
+            CACHE_LOOKUPS.inc(self.name, "miss")
+            return None
+        value, stored_at = found
+        if time.time() - stored_at > self.ttl:
+            self._delete(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            CACHE_LOOKUPS.inc(self.name, "expired")
+            return None
+        self.stats.hits += 1
+        CACHE_LOOKUPS.inc(self.name, "hit")
+        return CacheEntry(value=value, stored_at=stored_at)
+
+    def age(self, key: str) -> Optional[float]:
+        """保存からの経過秒数（未登録なら None）。統計・期限切れ処理には影響しない"""
+        found = self._get(key)
+        if found is None:
+            return None
+        return max(0.0, time.time() - found[1])
+
+    def set(self, key: str, value: bytes, stored_at: Optional[float] = None) -> None:
+        """値を保存し、上限を超えた分を古い順に追い出す"""
+        evicted = self._set(key, value, stored_at if stored_at is not None else time.time())
+        self.stats.evictions += evicted
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        ...
+
+    @abstractmethod
+    def _set(self, key: str, value: bytes, stored_at: float) -> int:
+        """保存して追い出した件数を返す"""
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """プロセス内の LRU キャッシュ"""
+
+    def __init__(self, ttl: float, max_entries: int, name: str = "cache"):
+        super().__init__(ttl, max_entries, name)
+        self._data: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        found = self._data.get(key)
+        if found is not None:
+            self._data.move_to_end(key)
+        return found
+
+    def _set(self, key: str, value: bytes, stored_at: float) -> int:
+        self._data[key] = (value, stored_at)
+        self._data.move_to_end(key)
+        evicted = 0
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def _delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite ファイルを使った LRU キャッシュ
+
+    複数プロセスから同じファイルを開けるよう WAL モードを使う。
+    table を分ければ1つのファイルに複数のキャッシュを同居できる。
+
+    get / set はイベントループ上から同期的に呼ばれるため、他のプロセスの書き込みロックを
+    待つのは timeout 秒（既定 50ms）までにする。待ちきれなければ読み出しはミス、
+    書き込みは省略として扱う（キャッシュなので取得し直せば済む）。
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int, table: str = "cache", timeout: float = 0.05):
+        super().__init__(ttl, max_entries, name=table)
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name: {table}")
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 初期化（WAL への切り替えとテーブル作成）は起動時の1回だけなので長めに待ち、
+        # その後の読み書きは timeout に縮める
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self.timeout = timeout
+        self._conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+
+    def _get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.OperationalError as e:
+                print(f"Cache Error ({self.table}): {e}")
+                return None
+            if row is not None:
+                try:
+                    self._conn.execute(
+                        f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                    )
+                except sqlite3.OperationalError:
+                    # LRU の順序が更新されないだけなので値は返す
+                    pass
+        return (bytes(row[0]), row[1]) if row is not None else None
+
+    def _set(self, key: str, value: bytes, stored_at: float) -> int:
+        with self._lock:
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, stored_at, time.time()),
+                )
+                cursor = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            except sqlite3.OperationalError as e:
+                print(f"Cache Error ({self.table}): {e}")
+                return 0
+            return max(cursor.rowcount, 0)
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            except sqlite3.OperationalError as e:
+                print(f"Cache Error ({self.table}): {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def create_cache_backend(prefix: str, default_ttl: float, default_max_entries: int) -> CacheBackend:
+    """
+    環境変数からバックエンドを生成
+
+    `{prefix}_BACKEND` (memory | sqlite), `{prefix}_TTL`, `{prefix}_MAX_ENTRIES`,
+    `{prefix}_PATH`（sqlite 時のファイル。既定は /tmp 配下で Vercel でも書き込み可能）,
+    `{prefix}_SQLITE_TIMEOUT`（sqlite 時のロック待ちの上限秒数。既定 0.05）
+    """
+    backend = (os.getenv(f"{prefix}_BACKEND") or "memory").strip().lower()
+    ttl = float(os.getenv(f"{prefix}_TTL") or default_ttl)
+    max_entries = int(os.getenv(f"{prefix}_MAX_ENTRIES") or default_max_entries)
+    if backend == "sqlite":
+        path = os.getenv(f"{prefix}_PATH") or "/tmp/hidden_route_scanner/cache.sqlite3"
+        timeout = float(os.getenv(f"{prefix}_SQLITE_TIMEOUT") or 0.05)
+        return SQLiteCacheBackend(path, ttl, max_entries, table=prefix.lower(), timeout=timeout)
+    if backend != "memory":
+        raise ValueError(f"unknown cache backend for {prefix}: {backend}")
+    return MemoryCacheBackend(ttl, max_entries, name=prefix.lower())
@@ -0,0 +1,120 @@
+"""
+運賃キャッシュ
+(出発地, 到着地, 日程) 単位で SerpApi の取得結果を保持し、
+同じルートの繰り返し検索でクォータとレイテンシを節約する
+"""
+import time
+from typing import Optional
+from app.clients.flight_data_client import resolve_outbound_date
+from app.models.schemas import FlightOffer, FlightSegment, RawFlightData
+from app.serialization import construct, dumps, loads
+from app.services.cache import CacheBackend, create_cache_backend
+
+# 保存形式のバージョン（フィールド構成を変えたら上げる）
+FORMAT_VERSION = 2
+
+# FlightOffer を保存するときのフィールド順（キー名は保存しない。末尾に区間のリストが続く）
+OFFER_FIELDS = (
+    "airline", "flight_number", "departure_time", "arrival_time",
+    "price", "currency", "booking_link",
+)
+
+# FlightSegment を保存するときのフィールド順
+SEGMENT_FIELDS = (
+    "departure_airport", "arrival_airport", "departure_time", "arrival_time",
+    "airline", "flight_number",
+)
+
+
+def encode_raw_data(raw_data: RawFlightData) -> bytes:
+    """RawFlightData をコンパクトな JSON 配列にエンコード"""
+    rows = [
+        [getattr(offer, f) for f in OFFER_FIELDS]
+        + [[[getattr(seg, f) for f in SEGMENT_FIELDS] for seg in offer.segments]]
+        for offer in raw_data.offers
+    ]
+    return dumps([FORMAT_VERSION, raw_data.source, rows])
+
+
+def decode_raw_data(blob: bytes) -> Optional[RawFlightData]:
+    """
+    encode_raw_data の逆変換（形式が異なれば None）
+
+    自分で書き込んだ検証済みのデータなので、モデルは検証を省いて生成する。
+    """
+    version, source, rows = loads(blob)
+    if version != FORMAT_VERSION:
+        return None
+    return construct(RawFlightData, {
+        "source": source,
+        "offers": [
+            construct(FlightOffer, {
+                **dict(zip(OFFER_FIELDS, row)),
+                "segments": [construct(FlightSegment, dict(zip(SEGMENT_FIELDS, seg))) for seg in row[-1]],
+            })
+            for row in rows
+        ],
+    })
+
+
+class FareCache:
+    """FlightDataClient.get_flight_offers の前段に置く TTL キャッシュ"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        # 既定: メモリ / 10分 / 1024件
+        if backend is None:
+            backend = create_cache_backend("FARE_CACHE", 600.0, 1024)
+        self.backend = backend
+
+    @staticmethod
+    def make_key(departure: str, arrival: str, date: Optional[str]) -> str:
+        """
+        キャッシュキー（日程は実際に取得する日付に揃える）
+
+        未指定の検索と、同じ日付を明示した検索は同じ運賃なので同じエントリを使う。
+        """
+        return f"{departure.upper()}:{arrival.upper()}:{resolve_outbound_date(date)}"
+
+    def get(self, departure: str, arrival: str, date: Optional[str]) -> Optional[RawFlightData]:
+        """キャッシュ済みの運賃データを取得"""
+        entry = self.backend.get(self.make_key(departure, arrival, date))
+        if entry is None:
+            return None
+        raw_data = decode_raw_data(entry.value)
+        if raw_data is None:
+            return None
+        raw_data.fetched_at = entry.stored_at
+        raw_data.from_cache = True
+        return raw_data
+
+    def age(self, departure: str, arrival: str, date: Optional[str]) -> Optional[float]:
+        """保存からの経過秒数（未登録なら None。事前取得の判定用）"""
+        return self.backend.age(self.make_key(departure, arrival, date))
+
+    def set(self, departure: str, arrival: str, date: Optional[str], raw_data: RawFlightData) -> None:
+        """運賃データを保存（モックデータは保存しない）"""
+        if raw_data.is_mock:
+            return
+        self.backend.set(
+            self.make_key(departure, arrival, date),
+            encode_raw_data(raw_data),
+            stored_at=raw_data.fetched_at,
+        )
+
+    def stats(self) -> dict:
+        """ヒット/ミス/追い出しのカウンター"""
+        return {"entries": len(self.backend), "ttl": self.backend.ttl, **self.backend.stats.to_dict()}
+
+
+def describe_freshness(raw_data: Optional[RawFlightData]) -> Optional[str]:
+    """結果パーシャル用のデータ鮮度表示"""
+    if raw_data is None or raw_data.is_mock or raw_data.fetched_at is None:
+        return None
+    age = max(0, int(time.time() - raw_data.fetched_at))
+    if age < 60:
+        when = "たった今"
+    elif age < 3600:
+        when = f"{age // 60}分前"
+    else:
+        when = f"{age // 3600}時間前"
+    return f"{when}に取得（キャッシュ）" if raw_data.from_cache else f"{when}に取得"
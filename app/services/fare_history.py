@@ -0,0 +1,371 @@
+"""
+運賃履歴ストア
+取得したオファーを列指向の追記専用ファイルに蓄積し、
+NumPy の memmap でベクトル化した価格統計（パーセンタイル・期間最安値・トレンド）を返す
+
+レイアウト（ルートごとにパーティション分割し、クエリは対象ルートの列だけを読む）:
+
+    {root}/{DEP}-{ARR}/travel_date.i4   搭乗日（1970-01-01 からの日数）
+                       observed_at.u4   観測時刻（UNIX 秒）
+                       airline.u2       航空会社（airlines.txt の行番号）
+                       dep_minute.i2    出発時刻（0時からの分、不明は -1）
+                       price.f4         価格
+                       airlines.txt     航空会社名の辞書
+                       .lock            追記時のプロセス間ロック
+
+行は観測順に追記されるため、末尾ほど新しい。結果パーシャル用の価格評価（insight）は
+末尾 window_rows 行の要約をルートごとに保持し、行が増えたか SUMMARY_TTL 秒を過ぎたときだけ
+計算し直す（履歴が伸びても1回あたりの計算量は窓の大きさで頭打ちになる）。
+ルートの行数が max_rows を超えたら、追記時に新しい半分だけを残して書き直す。
+読み書きはファイル I/O とロック待ちを伴うため、イベントループからはスレッドで呼ぶ。
+
+NumPy はコールドスタートを軽くするため、最初に読み書きするときに import する。
+"""
+import fcntl
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import date as date_type
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from app.models.schemas import FlightOffer, PriceInsight
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 列名 → dtype（リトルエンディアン固定。拡張子は dtype の型コード）
+COLUMNS: Dict[str, str] = {
+    "travel_date": "<i4",
+    "observed_at": "<u4",
+    "airline": "<u2",
+    "dep_minute": "<i2",
+    "price": "<f4",
+}
+
+# insight が要約する末尾の行数と、ルートごとに保持する行数の上限
+DEFAULT_WINDOW_ROWS = 200_000
+DEFAULT_MAX_ROWS = 1_000_000
+# 行が増えなくても期間（30日）の窓がずれるため、要約をこの秒数で計算し直す
+SUMMARY_TTL = 300.0
+
+_EPOCH = date_type(1970, 1, 1)
+_TIME = re.compile(r"(\d{1,2}):(\d{2})")
+_ROUTE = re.compile(r"^[A-Z0-9]{3,4}$")
+
+
+def _parse_minute(value: str) -> int:
+    """"2026-03-01 08:30" や "08:30" を 0時からの分に変換"""
+    match = _TIME.search(value or "")
+    if match is None:
+        return -1
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def _parse_day(value: Optional[str]) -> int:
+    if not value:
+        return -1
+    try:
+        return (date_type.fromisoformat(value[:10]) - _EPOCH).days
+    except ValueError:
+        return -1
+
+
+@dataclass
+class RouteColumns:
+    """1ルート分の列（memmap の読み取り専用ビュー）"""
+    travel_date: "np.ndarray"
+    observed_at: "np.ndarray"
+    airline: "np.ndarray"
+    dep_minute: "np.ndarray"
+    price: "np.ndarray"
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+
+@dataclass
+class RouteSummary:
+    """insight 用の1ルート分の要約（末尾 window_rows 行から計算）"""
+    rows: int
+    computed_at: float
+    sorted_prices: "np.ndarray"
+    median_price: float
+    min_price_30d: Optional[float]
+    trend_per_day: Optional[float]
+
+
+def _daily_min_trend(observed_at: "np.ndarray", prices: "np.ndarray") -> Optional[float]:
+    """観測日ごとの最安値に最小二乗で当てはめた直線の傾き（円/日）"""
+    import numpy as np
+
+    if prices.size == 0:
+        return None
+    day = (observed_at // 86400).astype(np.int64)
+    order = np.lexsort((prices, day))
+    day, prices = day[order], prices[order]
+    first = np.concatenate(([True], day[1:] != day[:-1]))
+    x, y = day[first].astype(np.float64), prices[first].astype(np.float64)
+    if x.size < 2:
+        return None
+    x -= x.mean()
+    return float((x * (y - y.mean())).sum() / (x * x).sum())
+
+
+class FareHistory:
+    """ルート単位にパーティション分割した列指向の運賃履歴"""
+
+    def __init__(self, root: Optional[str] = None, window_rows: Optional[int] = None, max_rows: Optional[int] = None):
+        self.root = root or os.getenv("FARE_HISTORY_DIR") or "/tmp/hidden_route_scanner/fare_history"
+        self.window_rows = window_rows or int(os.getenv("FARE_HISTORY_WINDOW_ROWS") or DEFAULT_WINDOW_ROWS)
+        self.max_rows = max_rows or int(os.getenv("FARE_HISTORY_MAX_ROWS") or DEFAULT_MAX_ROWS)
+        # route_dir → ((inode, サイズ), ビュー)。書き直し後は inode が変わるので開き直す
+        self._views: Dict[str, Tuple[Tuple[int, int], RouteColumns]] = {}
+        self._summaries: Dict[str, RouteSummary] = {}
+
+    def _route_dir(self, departure: str, arrival: str) -> Optional[str]:
+        departure, arrival = departure.upper(), arrival.upper()
+        if not (_ROUTE.match(departure) and _ROUTE.match(arrival)):
+            return None
+        return os.path.join(self.root, f"{departure}-{arrival}")
+
+    # ---- 追記 ----
+
+    def append(
+        self,
+        departure: str,
+        arrival: str,
+        date: Optional[str],
+        offers: Iterable[FlightOffer],
+        observed_at: Optional[float] = None,
+    ) -> int:
+        """オファーを追記し、書き込んだ行数を返す"""
+        import numpy as np
+
+        offers = [offer for offer in offers if offer.price > 0]
+        route_dir = self._route_dir(departure, arrival)
+        if not offers or route_dir is None:
+            return 0
+        os.makedirs(route_dir, exist_ok=True)
+
+        observed = int(observed_at if observed_at is not None else time.time())
+        with open(os.path.join(route_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                airline_ids = self._airline_ids(route_dir, [o.airline for o in offers])
+                n = len(offers)
+                self._append_columns(route_dir, {
+                    "travel_date": np.full(n, _parse_day(date or offers[0].departure_time), COLUMNS["travel_date"]),
+                    "observed_at": np.full(n, observed, COLUMNS["observed_at"]),
+                    "airline": np.asarray(airline_ids, COLUMNS["airline"]),
+                    "dep_minute": np.asarray([_parse_minute(o.departure_time) for o in offers], COLUMNS["dep_minute"]),
+                    "price": np.asarray([o.price for o in offers], COLUMNS["price"]),
+                })
+                self._compact_if_needed(route_dir)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return len(offers)
+
+    def append_columns(self, departure: str, arrival: str, columns: Dict[str, "np.ndarray"]) -> None:
+        """列配列をまとめて追記（一括取り込み・ベンチマーク用）"""
+        import numpy as np
+
+        route_dir = self._route_dir(departure, arrival)
+        if route_dir is None:
+            raise ValueError(f"invalid route: {departure}-{arrival}")
+        os.makedirs(route_dir, exist_ok=True)
+        with open(os.path.join(route_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._append_columns(route_dir, {
+                    name: np.asarray(columns[name], dtype) for name, dtype in COLUMNS.items()
+                })
+                self._compact_if_needed(route_dir)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _append_columns(route_dir: str, columns: Dict[str, "np.ndarray"]) -> None:
+        for name, values in columns.items():
+            path = os.path.join(route_dir, f"{name}.{COLUMNS[name][1:]}")
+            with open(path, "ab") as f:
+                f.write(values.tobytes())
+
+    def _compact_if_needed(self, route_dir: str) -> None:
+        """行数が max_rows を超えたら新しい max_rows // 2 行だけを残す（追記ロックを持って呼ぶ）"""
+        import numpy as np
+
+        rows = min(
+            os.path.getsize(os.path.join(route_dir, f"{name}.{dtype[1:]}")) // np.dtype(dtype).itemsize
+            for name, dtype in COLUMNS.items()
+        )
+        if rows <= self.max_rows:
+            return
+        keep = self.max_rows // 2
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(route_dir, f"{name}.{dtype[1:]}")
+            tail = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))[rows - keep:]
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(tail.tobytes())
+            # 開いている memmap は置き換え前のファイルを読み続ける
+            os.replace(tmp, path)
+
+    def _airline_ids(self, route_dir: str, airlines: List[str]) -> List[int]:
+        """航空会社名を辞書の行番号に変換（未登録なら追記）"""
+        path = os.path.join(route_dir, "airlines.txt")
+        known: List[str] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                known = f.read().splitlines()
+        index = {name: i for i, name in enumerate(known)}
+        added = []
+        for name in airlines:
+            name = name.replace("\n", " ")
+            if name not in index:
+                index[name] = len(known) + len(added)
+                added.append(name)
+        if added:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{name}\n" for name in added))
+        return [index[name.replace("\n", " ")] for name in airlines]
+
+    # ---- 読み取り ----
+
+    def columns(self, departure: str, arrival: str) -> Optional[RouteColumns]:
+        """ルートの列を memmap で開く（ファイルが伸びたときだけ開き直す）"""
+        import numpy as np
+
+        route_dir = self._route_dir(departure, arrival)
+        if route_dir is None:
+            return None
+        price_path = os.path.join(route_dir, "price.f4")
+        try:
+            stat = os.stat(price_path)
+        except OSError:
+            return None
+        version = (stat.st_ino, stat.st_size)
+        cached = self._views.get(route_dir)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        rows = stat.st_size // np.dtype(COLUMNS["price"]).itemsize
+        arrays = {}
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(route_dir, f"{name}.{dtype[1:]}")
+            # 書き込み途中の列があっても行がずれないよう、全列で揃う行数に切り詰める
+            rows = min(rows, os.path.getsize(path) // np.dtype(dtype).itemsize)
+            arrays[name] = path
+        if rows == 0:
+            return None
+        view = RouteColumns(**{
+            name: np.memmap(path, dtype=COLUMNS[name], mode="r", shape=(rows,))
+            for name, path in arrays.items()
+        })
+        self._views[route_dir] = (version, view)
+        return view
+
+    def count(self, departure: str, arrival: str) -> int:
+        cols = self.columns(departure, arrival)
+        return len(cols) if cols is not None else 0
+
+    def _window(self, cols: RouteColumns, days: Optional[float], now: Optional[float]) -> "np.ndarray":
+        if days is None:
+            return cols.price
+        since = (now if now is not None else time.time()) - days * 86400
+        return cols.price[cols.observed_at >= since]
+
+    def percentiles(
+        self,
+        departure: str,
+        arrival: str,
+        qs: Iterable[float] = (10, 25, 50, 75, 90),
+        days: Optional[float] = None,
+    ) -> Optional[Dict[float, float]]:
+        """観測価格のパーセンタイル"""
+        import numpy as np
+
+        cols = self.columns(departure, arrival)
+        if cols is None:
+            return None
+        prices = self._window(cols, days, None)
+        if prices.size == 0:
+            return None
+        qs = list(qs)
+        return dict(zip(qs, np.percentile(prices, qs).tolist()))
+
+    def percentile_rank(self, departure: str, arrival: str, price: float) -> Optional[float]:
+        """price より高い観測価格の割合（%）= 「観測運賃の X% より安い」"""
+        import numpy as np
+
+        cols = self.columns(departure, arrival)
+        if cols is None:
+            return None
+        return float(np.count_nonzero(cols.price > price)) / len(cols) * 100
+
+    def min_over_window(self, departure: str, arrival: str, days: float = 30) -> Optional[float]:
+        """直近 days 日に観測した最安値"""
+        cols = self.columns(departure, arrival)
+        if cols is None:
+            return None
+        prices = self._window(cols, days, None)
+        return float(prices.min()) if prices.size else None
+
+    def trend(self, departure: str, arrival: str, days: float = 30) -> Optional[float]:
+        """
+        直近 days 日の価格トレンド（円/日）
+
+        観測日ごとの最安値に最小二乗で直線を当てはめた傾き。
+        """
+        cols = self.columns(departure, arrival)
+        if cols is None:
+            return None
+        mask = cols.observed_at >= time.time() - days * 86400
+        return _daily_min_trend(cols.observed_at[mask], cols.price[mask])
+
+    def summary(self, departure: str, arrival: str) -> Optional[RouteSummary]:
+        """末尾 window_rows 行の要約（行が増えたか SUMMARY_TTL 秒を過ぎたら計算し直す）"""
+        import numpy as np
+
+        cols = self.columns(departure, arrival)
+        if cols is None:
+            return None
+        key = f"{departure.upper()}-{arrival.upper()}"
+        now = time.time()
+        cached = self._summaries.get(key)
+        if cached is not None and cached.rows == len(cols) and now - cached.computed_at < SUMMARY_TTL:
+            return cached
+
+        start = max(0, len(cols) - self.window_rows)
+        prices = np.asarray(cols.price[start:])
+        observed = np.asarray(cols.observed_at[start:])
+        recent = observed >= now - 30 * 86400
+        sorted_prices = np.sort(prices)
+        summary = RouteSummary(
+            rows=len(cols),
+            computed_at=now,
+            sorted_prices=sorted_prices,
+            median_price=float(np.median(sorted_prices)),
+            min_price_30d=float(prices[recent].min()) if recent.any() else None,
+            trend_per_day=_daily_min_trend(observed[recent], prices[recent]),
+        )
+        self._summaries[key] = summary
+        return summary
+
+    def insight(self, departure: str, arrival: str, price: float, min_samples: int = 20) -> Optional[PriceInsight]:
+        """結果パーシャル用の価格評価（直近 window_rows 行が対象）"""
+        import numpy as np
+
+        summary = self.summary(departure, arrival)
+        if summary is None or summary.sorted_prices.size < min_samples:
+            return None
+        n = summary.sorted_prices.size
+        higher = n - int(np.searchsorted(summary.sorted_prices, price, side="right"))
+        return PriceInsight(
+            price=price,
+            cheaper_than_percent=higher / n * 100,
+            sample_size=n,
+            median_price=summary.median_price,
+            min_price_30d=summary.min_price_30d,
+            trend_per_day=summary.trend_per_day,
+        )
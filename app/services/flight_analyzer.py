@@ -1,21 +1,432 @@
 from app.clients.llm_client import LLMClient
-from app.clients.flight_data_client import FlightDataClient
-from app.models.schemas import FlightAnalysisResponse, HiddenFlightOption, RawFlightData
-from typing import Optional
+from app.clients.fare_provider import FareProvider
+from app.clients.flight_data_client import FlightDataClient, default_outbound_date, resolve_outbound_date
+from app.clients.resilience import Deadline, DeadlineExceeded
+from app.services.fare_cache import FareCache
+from app.services.analysis_cache import AnalysisCache
+from app.services.single_flight import SingleFlight
+from app.services.rate_limit import TokenBucket
+from app.services.price_calendar import build_price_calendar, flexible_dates
+from app.services.metro_matrix import AirportPair, build_metro_matrix, metro_pairs
+from app.services.route_engine import RouteGraph
+from app.services.fare_history import FareHistory
+from app.services.popularity import PopularityTracker
+from app.metrics import DEGRADED_RESPONSES, stage
+from app.models.schemas import (
+    DatePrice, FlightAnalysisResponse, HiddenFlightOption, MetroFare, PriceInsight, RawFlightData
+)
+from pydantic import ValidationError
+from typing import AsyncIterator, Awaitable, List, Optional, Sequence, Tuple
+import asyncio
+import os
+
+# LLM に渡すローカル候補の件数
+LLM_CANDIDATE_LIMIT = 3
+# 残り時間がこれを下回ったら LLM 分析を始めない（秒）
+ANALYSIS_MIN_BUDGET = float(os.getenv("ANALYSIS_MIN_BUDGET_SECONDS") or 3.0)
+
+# 時間切れで省略した段階ごとの表示メッセージ
+DEGRADED_NOTICES = {
+    "fares": "制限時間内に運賃を取得できませんでした。時間をおいて再検索してください。",
+    "analysis": "制限時間内に AI 分析が完了しなかったため、実データとローカル検索の候補のみを表示しています。",
+}
+
+
+def validate_analysis(result: dict) -> dict:
+    """
+    LLM の分析結果を応答モデルで検証する
+
+    検証できないオプションは除き、その場合は is_partial を立てて分析キャッシュに
+    保存しない（不正な出力を TTL の間返し続けない）。
+    """
+    options = result.get("hidden_options")
+    avoid_tips = result.get("avoid_tips", "")
+    valid = []
+    invalid = not isinstance(options, list) or not isinstance(avoid_tips, str)
+    for option in options if isinstance(options, list) else []:
+        try:
+            HiddenFlightOption.model_validate(option)
+        except ValidationError:
+            invalid = True
+            continue
+        valid.append(option)
+    if not invalid:
+        return result
+    print(f"Invalid LLM analysis: kept {len(valid)} of {len(options) if isinstance(options, list) else 0} options")
+    return {
+        **result,
+        "hidden_options": valid,
+        "avoid_tips": avoid_tips if isinstance(avoid_tips, str) else "",
+        "is_partial": True,
+    }
 
 
 class FlightAnalyzerService:
     """フライト分析サービス"""
     
-    def __init__(self):
-        self.llm_client = LLMClient()
-        self.flight_data_client = FlightDataClient()
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        flight_data_client: Optional[FareProvider] = None,
+        fare_cache: Optional[FareCache] = None,
+        analysis_cache: Optional[AnalysisCache] = None
+    ):
+        self.llm_client = llm_client or LLMClient()
+        self.flight_data_client = flight_data_client or FlightDataClient()
+        self.fare_cache = fare_cache or FareCache()
+        self.analysis_cache = analysis_cache or AnalysisCache()
+        # 同一ルートの同時リクエストを段階ごとに1回の上流呼び出しへまとめる
+        self.fare_flights = SingleFlight()
+        self.llm_flights = SingleFlight()
+        # SerpApi のクォータに合わせたレート制限と、柔軟日程検索の同時実行数
+        self.serpapi_limiter = TokenBucket.from_env("SERPAPI_RATE", 5.0, 10.0)
+        # ヘッジの複製もクォータを消費するため、待たずにトークンを取れた場合だけ出す
+        self.flight_data_client.admit_hedges(self.serpapi_limiter.try_acquire)
+        self.fanout_semaphore = asyncio.Semaphore(int(os.getenv("FLEX_MAX_CONCURRENCY") or 8))
+        # 取得済みオファーから Hidden City / 別切り乗り継ぎをローカルに探索する
+        self.route_graph = RouteGraph()
+        # 取得した実運賃を蓄積し、「観測運賃の X% より安い」を算出する
+        self.fare_history = FareHistory()
+        # /analyze で検索されたルートの人気度（事前取得の対象を決める）
+        self.popularity = PopularityTracker.from_env()
     
-    async def analyze_route(
+    @staticmethod
+    def route_label(departure: str, arrival: str, date: Optional[str] = None) -> str:
+        """表示用のルート文字列"""
+        route_str = f"{departure} → {arrival}"
+        if date:
+            route_str += f" ({date})"
+        return route_str
+
+    async def get_flight_offers(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> RawFlightData:
+        """
+        運賃キャッシュを経由してフライトデータを取得
+
+        deadline までに取得できなければ DeadlineExceeded を送出する。
+        合流した呼び出しはそれぞれ自分の残り時間だけ待つ。
+        """
+        cached = self.fare_cache.get(departure, arrival, date)
+        if cached is not None:
+            self.route_graph.add_offers(cached.offers)
+            return cached
+
+        def fetch() -> Awaitable[RawFlightData]:
+            return self._fetch_offers(departure, arrival, date, deadline)
+
+        key = FareCache.make_key(departure, arrival, date)
+        if deadline is None:
+            return await self.fare_flights.do(key, fetch)
+        return await deadline.run(lambda: self.fare_flights.do(key, fetch), "fares")
+
+    async def refresh_flight_offers(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None
+    ) -> RawFlightData:
+        """
+        キャッシュを使わずに取得し直して保存する（事前取得用）
+
+        レート制限のトークンは呼び出し側が try_acquire で確保しておくこと。
+        """
+        key = FareCache.make_key(departure, arrival, date)
+        return await self.fare_flights.do(
+            key, lambda: self._fetch_offers(departure, arrival, date, rate_limited=False)
+        )
+
+    async def _fetch_offers(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str],
+        deadline: Optional[Deadline] = None,
+        rate_limited: bool = True
+    ) -> RawFlightData:
+        if rate_limited and not self.flight_data_client.use_mock:
+            await self.serpapi_limiter.acquire()
+        raw_data = await self.flight_data_client.get_flight_offers(
+            departure, arrival, date, deadline=deadline
+        )
+        self.fare_cache.set(departure, arrival, date, raw_data)
+        if not raw_data.is_mock:
+            self.route_graph.add_offers(raw_data.offers)
+            await self._record_history(departure, arrival, date, raw_data)
+        return raw_data
+
+    async def get_offers_with_calendar(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        flex_days: int = 0,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[RawFlightData, List[DatePrice]]:
+        """
+        指定日のフライトデータと、±flex_days の日付別最安値カレンダーを取得
+
+        各日付の検索は並行に実行し、同時実行数はセマフォ、上流呼び出しは
+        トークンバケットで制限する（キャッシュヒットは制限を消費しない）。
+        """
+        if flex_days <= 0:
+            return await self.get_flight_offers(departure, arrival, date, deadline), []
+
+        center = date or default_outbound_date()
+        dates = flexible_dates(center, flex_days)
+        if center not in dates:
+            dates.append(center)
+
+        async def fetch(day: str) -> Optional[RawFlightData]:
+            async with self.fanout_semaphore:
+                try:
+                    return await self.get_flight_offers(departure, arrival, day, deadline)
+                except DeadlineExceeded:
+                    if day == center:
+                        raise
+                    # 周辺日は間に合った分だけでカレンダーを作る
+                    return None
+
+        fetched = await asyncio.gather(*(fetch(day) for day in dates))
+        results = {day: raw for day, raw in zip(dates, fetched) if raw is not None}
+        calendar = build_price_calendar(
+            results, include_mock=self.flight_data_client.use_mock
+        )
+        return results[center], calendar
+
+    async def get_metro_matrix(
+        self, 
+        departures: Sequence[str], 
+        arrivals: Sequence[str], 
+        date: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        primary: Optional[AirportPair] = None
+    ) -> List[MetroFare]:
+        """
+        出発 × 到着の空港の全組み合わせについて最安値を求める
+
+        各組み合わせは区間（出発・到着・日付）単位の運賃キャッシュとシングルフライトを
+        経由して並行に取得するため、他の利用者やリクエストと重なる区間は
+        上流を呼ばずに同じデータを使う。間に合わなかった組み合わせは価格なしにする。
+        primary は呼び出し側が別途取得中の組み合わせで、その取得に合流するだけなので
+        並行数の枠を使わない（3×3 でも残り8区間が1往復に収まる）。
+        """
+        pairs = metro_pairs(departures, arrivals)
+
+        async def fetch(pair: AirportPair) -> Optional[RawFlightData]:
+            try:
+                if pair == primary:
+                    return await self.get_flight_offers(pair[0], pair[1], date, deadline)
+                async with self.fanout_semaphore:
+                    return await self.get_flight_offers(pair[0], pair[1], date, deadline)
+            except DeadlineExceeded:
+                return None
+
+        fetched = await asyncio.gather(*(fetch(pair) for pair in pairs))
+        return build_metro_matrix(
+            dict(zip(pairs, fetched)), include_mock=self.flight_data_client.use_mock
+        )
+
+    async def get_offers_with_matrix(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        flex_days: int = 0,
+        metro_codes: Optional[Tuple[Sequence[str], Sequence[str]]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[RawFlightData, List[DatePrice], List[MetroFare]]:
+        """
+        get_offers_with_calendar に加えて、近隣空港マトリクスを同時に取得
+
+        metro_codes は (出発地の都市圏の空港, 到着地の都市圏の空港)。
+        指定した組み合わせ自体もマトリクスに含まれ、その取得は本体とシングルフライトで1回にまとまる。
+        """
+        if not metro_codes:
+            raw_data, price_calendar = await self.get_offers_with_calendar(
+                departure, arrival, date, flex_days, deadline
+            )
+            return raw_data, price_calendar, []
+        (raw_data, price_calendar), metro_matrix = await asyncio.gather(
+            self.get_offers_with_calendar(departure, arrival, date, flex_days, deadline),
+            self.get_metro_matrix(metro_codes[0], metro_codes[1], date, deadline, primary=(departure, arrival)),
+        )
+        return raw_data, price_calendar, metro_matrix
+
+    async def _record_history(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str],
+        raw_data: RawFlightData
+    ) -> None:
+        """運賃履歴に追記する（ファイルロックと I/O はスレッドで行う）"""
+        try:
+            await asyncio.to_thread(
+                self.fare_history.append,
+                departure, arrival, date, raw_data.offers, observed_at=raw_data.fetched_at
+            )
+        except OSError as e:
+            print(f"Fare History Error: {e}")
+
+    async def get_price_insight(
+        self, 
+        departure: str, 
+        arrival: str, 
+        raw_data: Optional[RawFlightData]
+    ) -> Optional[PriceInsight]:
+        """今回の最安値を運賃履歴と比較する（履歴が少なければ None）"""
+        if raw_data is None or raw_data.is_mock:
+            return None
+        prices = [offer.price for offer in raw_data.offers if offer.price > 0]
+        if not prices:
+            return None
+        return await asyncio.to_thread(self.fare_history.insight, departure, arrival, min(prices))
+
+    def find_local_options(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        limit: int = 5
+    ) -> List[HiddenFlightOption]:
+        """
+        取得済みオファーのグラフから候補を求める（LLM 不要・数ミリ秒）
+
+        日程未指定の検索は実際に運賃を取得した日付で絞り込む（他の日の区間を混ぜない）。
+        """
+        return self.route_graph.find_candidates(departure, arrival, resolve_outbound_date(date), limit=limit)
+
+    async def get_llm_analysis(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str],
+        raw_data: RawFlightData,
+        price_calendar: Optional[List[DatePrice]] = None,
+        candidates: Optional[List[HiddenFlightOption]] = None,
+        deadline: Optional[Deadline] = None,
+        refresh: bool = False,
+        metro_matrix: Optional[List[MetroFare]] = None
+    ) -> dict:
+        """
+        LLM 分析を取得
+
+        正規化したプロンプト入力のハッシュで分析キャッシュを引き、
+        ミス時は同じ入力で実行中の分析があればその結果を共有する。
+        キャッシュにない分析を始めるには ANALYSIS_MIN_BUDGET 以上の残り時間が必要で、
+        足りない・間に合わない場合は DeadlineExceeded を送出する。
+        refresh=True ならキャッシュを引かずに分析し直す（事前取得用）。
+        """
+        fingerprint = self.llm_client.prompt_fingerprint(
+            departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
+        )
+        cached = None if refresh else self.analysis_cache.get(fingerprint)
+        if cached is not None:
+            return cached
+
+        async def analyze() -> dict:
+            result = validate_analysis(await self.llm_client.analyze_flight_route(
+                departure, arrival, date, raw_data=raw_data, price_calendar=price_calendar,
+                candidates=candidates, metro_matrix=metro_matrix, deadline=deadline
+            ))
+            self.analysis_cache.set(fingerprint, result)
+            return result
+
+        if deadline is None:
+            return await self.llm_flights.do(fingerprint, analyze)
+        self._check_analysis_budget(deadline)
+        return await deadline.run(lambda: self.llm_flights.do(fingerprint, analyze), "analysis")
+
+    @staticmethod
+    def _check_analysis_budget(deadline: Optional[Deadline]) -> None:
+        if deadline is not None and deadline.remaining() < ANALYSIS_MIN_BUDGET:
+            raise DeadlineExceeded("not enough budget left for the LLM analysis")
+
+    @staticmethod
+    def degraded_analysis(reason: str) -> dict:
+        """時間切れで LLM 分析を省略したときの結果（キャッシュ対象外）"""
+        DEGRADED_RESPONSES.inc(reason)
+        return {"hidden_options": [], "avoid_tips": DEGRADED_NOTICES[reason], "is_partial": True}
+
+    def degraded_response(
         self, 
         departure: str, 
         arrival: str, 
         date: Optional[str] = None
+    ) -> FlightAnalysisResponse:
+        """運賃を制限時間内に取得できなかったときのレスポンス（ローカル検索の候補のみ）"""
+        return FlightAnalysisResponse(
+            route=self.route_label(departure, arrival, date),
+            hidden_options=self.find_local_options(departure, arrival, date),
+            avoid_tips=self.degraded_analysis("fares")["avoid_tips"],
+            degraded="fares"
+        )
+
+    async def stream_analysis(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        flex_days: int = 0,
+        deadline: Optional[Deadline] = None,
+        metro_codes: Optional[Tuple[Sequence[str], Sequence[str]]] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        LLM 分析をストリーミングで取得
+
+        ローカル経路エンジンの候補を最初に返し、LLM 分析はキャッシュ済みなら
+        即座に全件、そうでなければ Grok のストリーミング出力から
+        オプションを解析でき次第返す。最後に ("result", 分析結果) を返す。
+        deadline に間に合わない段階は省略し、その旨を結果の avoid_tips で伝える。
+        """
+        try:
+            raw_data, price_calendar, metro_matrix = await self.get_offers_with_matrix(
+                departure, arrival, date, flex_days, metro_codes, deadline
+            )
+        except DeadlineExceeded:
+            yield "result", self.degraded_analysis("fares")
+            return
+        candidates = self.find_local_options(departure, arrival, date)
+        for candidate in candidates:
+            yield "option", candidate.model_dump()
+
+        candidates = candidates[:LLM_CANDIDATE_LIMIT]
+        fingerprint = self.llm_client.prompt_fingerprint(
+            departure, arrival, date, raw_data, price_calendar, candidates, metro_matrix
+        )
+        result = self.analysis_cache.get(fingerprint)
+        if result is not None:
+            for option in result.get("hidden_options", []):
+                yield "option", option
+            yield "result", result
+            return
+
+        try:
+            self._check_analysis_budget(deadline)
+            async for kind, payload in self.llm_client.stream_flight_route(
+                departure, arrival, date, raw_data=raw_data, price_calendar=price_calendar,
+                candidates=candidates, metro_matrix=metro_matrix, deadline=deadline
+            ):
+                if kind == "result":
+                    payload = validate_analysis(payload)
+                    self.analysis_cache.set(fingerprint, payload)
+                yield kind, payload
+        except DeadlineExceeded:
+            yield "result", self.degraded_analysis("analysis")
+
+    async def analyze_route(
+        self, 
+        departure: str, 
+        arrival: str, 
+        date: Optional[str] = None,
+        flex_days: int = 0,
+        deadline: Optional[Deadline] = None,
+        metro_codes: Optional[Tuple[Sequence[str], Sequence[str]]] = None
     ) -> FlightAnalysisResponse:
         """
         フライトルートを分析
@@ -24,32 +435,57 @@ class FlightAnalyzerService:
             departure: 出発地
             arrival: 到着地
             date: 日程（オプション）
+            flex_days: 前後何日まで日程をずらして検索するか（0 で指定日のみ）
+            deadline: リクエスト全体の締め切り。間に合わない段階は省略し、
+                実データのみ（またはローカル検索の候補のみ）を返す
+            metro_codes: (出発地側, 到着地側) の都市圏の空港。指定すると
+                全組み合わせの最安値マトリクスも取得して LLM に渡す
             
         Returns:
             FlightAnalysisResponse
         """
-        # 1. 実際のフライトデータを取得
-        raw_data = await self.flight_data_client.get_flight_offers(
-            departure, arrival, date
-        )
+        # 1. 実際のフライトデータを取得（キャッシュ優先、柔軟日程なら前後の日付も、近隣空港検索なら全組み合わせも）
+        try:
+            with stage("fares"):
+                raw_data, price_calendar, metro_matrix = await self.get_offers_with_matrix(
+                    departure, arrival, date, flex_days, metro_codes, deadline
+                )
+        except DeadlineExceeded:
+            return self.degraded_response(departure, arrival, date)
 
-        # 2. LLM に分析を依頼（実データを渡す）
-        result = await self.llm_client.analyze_flight_route(
-            departure, arrival, date, raw_data=raw_data
-        )
-        
-        # 3. レスポンスを構築
-        route_str = f"{departure} → {arrival}"
-        if date:
-            route_str += f" ({date})"
-        
-        hidden_options = [
-            HiddenFlightOption(**opt) for opt in result.get("hidden_options", [])
-        ]
+        # 2. ローカル経路エンジンで候補を求め、上位だけを LLM に渡す
+        with stage("route_engine"):
+            candidates = self.find_local_options(departure, arrival, date)
+
+        # 3. LLM に分析を依頼（実データを渡す）。間に合わなければ実データと候補のみ
+        degraded = None
+        try:
+            with stage("analysis"):
+                result = await self.get_llm_analysis(
+                    departure, arrival, date, raw_data, price_calendar,
+                    candidates[:LLM_CANDIDATE_LIMIT], deadline, metro_matrix=metro_matrix
+                )
+        except DeadlineExceeded:
+            degraded = "analysis"
+            result = self.degraded_analysis(degraded)
         
-        return FlightAnalysisResponse(
-            route=route_str,
-            hidden_options=hidden_options,
-            avoid_tips=result.get("avoid_tips", ""),
-            raw_data=raw_data
-        )
+        price_insight = await self.get_price_insight(departure, arrival, raw_data)
+
+        # 4. レスポンスを構築
+        with stage("build_response"):
+            route_str = self.route_label(departure, arrival, date)
+            
+            hidden_options = candidates + [
+                HiddenFlightOption.model_validate(opt) for opt in result.get("hidden_options", [])
+            ]
+            
+            return FlightAnalysisResponse(
+                route=route_str,
+                hidden_options=hidden_options,
+                avoid_tips=result.get("avoid_tips", ""),
+                raw_data=raw_data,
+                price_calendar=price_calendar,
+                price_insight=price_insight,
+                metro_matrix=metro_matrix,
+                degraded=degraded
+            )
@@ -0,0 +1,347 @@
+"""
+分析ジョブのキュー
+POST /analyze を受け付けた時点ではジョブを SQLite に積むだけにして、
+ワーカー（asyncio タスク）が FlightAnalyzerService.analyze_route をバックグラウンドで実行する
+
+ブラウザは結果が出るまでジョブの状態を1秒ごとに問い合わせる。接続を Grok の応答待ちの間
+保持しないため、サーバーレスの 30 秒制限を超える分析も実行できる。完了した結果は
+ジョブ ID で保存しておき、問い合わせは主キーでの読み出しだけで済ませる。
+
+SQLite は WAL モードで開くので、同じファイルを共有する複数のプロセスが
+ジョブを積んだり取り出したりできる（取り出しは BEGIN IMMEDIATE で排他する）。
+JobStore のメソッドは他のプロセスのロック待ち（最大 timeout 秒）でブロックするため、
+イベントループからはスレッドで呼ぶ（ワーカーは asyncio.to_thread、ルートは run_in_threadpool）。
+"""
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.clients.resilience import Deadline
+from app.metrics import ANALYSIS_JOBS, record_stage
+from app.models.schemas import FlightAnalysisResponse, FlightSearchRequest
+from app.serialization import dumps, loads
+from app.services.airport_index import AirportIndex
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.metro_matrix import expand_metro
+
+DEFAULT_JOB_QUEUE_PATH = "/tmp/hidden_route_scanner/jobs.sqlite3"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """待機中のジョブが上限に達している"""
+
+
+@dataclass
+class Job:
+    """キューに積まれた分析ジョブ"""
+    id: str
+    status: str
+    request: FlightSearchRequest
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    # 完了時の FlightAnalysisResponse（JSON）
+    result: Optional[bytes] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def response(self) -> Optional[FlightAnalysisResponse]:
+        """完了した分析結果"""
+        if self.result is None:
+            return None
+        return FlightAnalysisResponse.model_validate_json(self.result)
+
+
+class JobStore:
+    """
+    SQLite に保存するジョブキュー
+
+    実行中のまま lease 秒を過ぎたジョブ（ワーカーのプロセスが落ちたなど）は
+    max_attempts 回まで取り出し直す。完了から retention 秒を過ぎたジョブは削除する。
+    """
+
+    _COLUMNS = "id, status, request, created_at, started_at, finished_at, attempts, error"
+
+    def __init__(self, path: str, retention: float = 86400.0, max_pending: int = 1000, max_attempts: int = 2):
+        self.path = path
+        self.retention = retention
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, request BLOB NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, result BLOB)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        """`JOB_QUEUE_PATH`, `JOB_RETENTION_SECONDS`, `JOB_MAX_PENDING`, `JOB_MAX_ATTEMPTS`"""
+        return cls(
+            os.getenv("JOB_QUEUE_PATH") or DEFAULT_JOB_QUEUE_PATH,
+            retention=float(os.getenv("JOB_RETENTION_SECONDS") or 86400.0),
+            max_pending=int(os.getenv("JOB_MAX_PENDING") or 1000),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS") or 2),
+        )
+
+    def _row_to_job(self, row: tuple, result: Optional[bytes] = None) -> Job:
+        job_id, status, request, created_at, started_at, finished_at, attempts, error = row
+        return Job(
+            id=job_id,
+            status=status,
+            request=FlightSearchRequest(**loads(request)),
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            attempts=attempts,
+            error=error,
+            result=bytes(result) if result is not None else None,
+        )
+
+    def enqueue(self, request: FlightSearchRequest) -> str:
+        """ジョブを積んで ID を返す（待機中が max_pending 件なら JobQueueFull）"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs waiting")
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, request, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, dumps(request.model_dump()), time.time()),
+            )
+        return job_id
+
+    def claim(self, lease: float) -> Optional[Job]:
+        """最も古い待機中のジョブを実行中にして返す（なければ None）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 取り出し直しの上限を超えた放置ジョブは失敗として閉じる
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, "ワーカーが応答しませんでした", now, RUNNING, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs "
+                    "WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (RUNNING, now, now + lease, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        if job.status == RUNNING:
+            ANALYSIS_JOBS.inc("reclaimed")
+        job.status, job.started_at, job.attempts = RUNNING, now, job.attempts + 1
+        return job
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (DONE, result, time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (FAILED, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """ジョブを取得（完了していれば結果も含む）"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS}, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._row_to_job(row[:-1], row[-1])
+
+    def position(self, job: Job) -> int:
+        """待機中のジョブの順番（先に積まれた待機中のジョブの数。0 なら次に実行される）"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, job.created_at)
+            ).fetchone()[0]
+
+    def counts(self) -> dict:
+        """状態ごとのジョブ数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def purge(self) -> int:
+        """保持期間を過ぎた完了済みのジョブを削除し、件数を返す"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - self.retention),
+            )
+        return max(cursor.rowcount, 0)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorkerPool:
+    """
+    ジョブを実行する asyncio ワーカー
+
+    同じプロセスで積まれたジョブは notify() ですぐに取り出し、
+    他のプロセスが積んだジョブは poll_interval 秒ごとに確認する。
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        flight_service: FlightAnalyzerService,
+        airports: Optional[AirportIndex] = None,
+        workers: int = 4,
+        budget: float = 120.0,
+        poll_interval: float = 1.0,
+    ):
+        self.store = store
+        self.flight_service = flight_service
+        # 近隣空港検索（request.metro）の展開に使う
+        self.airports = airports
+        self.workers = workers
+        # 1件の分析の締め切り（リクエストの 30 秒制限には縛られない）
+        self.budget = budget
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._purged_at = 0.0
+
+    @classmethod
+    def from_env(
+        cls, store: JobStore, flight_service: FlightAnalyzerService, airports: Optional[AirportIndex] = None
+    ) -> "JobWorkerPool":
+        """`JOB_WORKERS`, `JOB_BUDGET_SECONDS`, `JOB_POLL_INTERVAL`"""
+        return cls(
+            store,
+            flight_service,
+            airports=airports,
+            workers=int(os.getenv("JOB_WORKERS") or 4),
+            budget=float(os.getenv("JOB_BUDGET_SECONDS") or 120.0),
+            poll_interval=float(os.getenv("JOB_POLL_INTERVAL") or 1.0),
+        )
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        """ワーカーを起動する（起動済みなら何もしない）"""
+        if self.running:
+            return
+        # リクエスト処理中に起動されても、そのリクエストの Server-Timing などを引き継がない
+        self._tasks = [
+            asyncio.create_task(self._work(), context=contextvars.Context())
+            for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """ワーカーを止める（実行中のジョブは lease 切れの後に取り出し直される）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """ジョブが積まれたことを待機中のワーカーに知らせる"""
+        self._wakeup.set()
+
+    async def _work(self) -> None:
+        # 締め切り後に縮退した結果を保存するまでの猶予を lease に含める
+        lease = self.budget + 30.0
+        while True:
+            try:
+                # 取り出し中に止められた場合、取り出したジョブは lease 切れの後に取り出し直される
+                job = await asyncio.to_thread(self.store.claim, lease)
+            except sqlite3.Error as e:
+                print(f"Job Queue Error: {e}")
+                job = None
+            if job is None:
+                await self._purge()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 結果の保存に失敗しても（database is locked など）ワーカーは止めない。
+                # ジョブは lease 切れの後に取り出し直される
+                print(f"Job Worker Error ({job.id}): {type(e).__name__}: {e}")
+
+    async def run_job(self, job: Job) -> None:
+        """1件を実行して結果（または失敗）を保存する"""
+        record_stage("job_wait", max(0.0, time.time() - job.created_at))
+        request = job.request
+        metro_codes = None
+        if request.metro and self.airports is not None:
+            metro_codes = expand_metro(self.airports, request.departure, request.arrival)
+        try:
+            result = await self.flight_service.analyze_route(
+                request.departure, request.arrival, request.date,
+                flex_days=request.flex_days, deadline=Deadline(self.budget), metro_codes=metro_codes
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job Error ({job.id}): {e}")
+            await asyncio.to_thread(self.store.fail, job.id, f"{type(e).__name__}: {e}")
+            ANALYSIS_JOBS.inc("failed")
+            return
+        await asyncio.to_thread(self.store.complete, job.id, result.model_dump_json().encode("utf-8"))
+        ANALYSIS_JOBS.inc("done")
+
+    async def _purge(self) -> None:
+        """保持期間を過ぎたジョブを削除する（1分に1回まで）"""
+        now = time.monotonic()
+        if now - self._purged_at < 60.0:
+            return
+        self._purged_at = now
+        try:
+            await asyncio.to_thread(self.store.purge)
+        except sqlite3.Error as e:
+            print(f"Job Queue Error: {e}")
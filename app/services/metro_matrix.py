@@ -0,0 +1,47 @@
+"""
+近隣空港マトリクス
+出発地・到着地をそれぞれの都市圏の空港（羽田/成田、関西/伊丹など）に広げ、
+組み合わせごとの最安値の表を組み立てる
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.models.schemas import MetroFare, RawFlightData
+from app.services.airport_index import AirportIndex
+
+# (出発空港, 到着空港)
+AirportPair = Tuple[str, str]
+
+
+def expand_metro(airports: AirportIndex, departure: str, arrival: str) -> Optional[Tuple[List[str], List[str]]]:
+    """出発地・到着地をそれぞれの都市圏の空港に広げる（どちらも1空港だけの都市なら None）"""
+    departures = airports.metro_codes(departure) or [departure]
+    arrivals = airports.metro_codes(arrival) or [arrival]
+    if len(departures) == 1 and len(arrivals) == 1:
+        return None
+    return departures, arrivals
+
+
+def metro_pairs(departures: Sequence[str], arrivals: Sequence[str]) -> List[AirportPair]:
+    """出発 × 到着の組み合わせ（同じ空港どうしは除く）"""
+    return [(departure, arrival) for departure in departures for arrival in arrivals if departure != arrival]
+
+
+def build_metro_matrix(
+    results: Dict[AirportPair, Optional[RawFlightData]],
+    include_mock: bool = False
+) -> List[MetroFare]:
+    """組み合わせごとの取得結果から最安値の表を作る（取得できなかった・モックの組み合わせは価格なし）"""
+    matrix = []
+    for (departure, arrival), raw_data in results.items():
+        offers = [] if raw_data is None or (raw_data.is_mock and not include_mock) else raw_data.offers
+        priced = [offer for offer in offers if offer.price > 0]
+        cheapest = min(priced, key=lambda offer: offer.price) if priced else None
+        matrix.append(MetroFare(
+            departure=departure,
+            arrival=arrival,
+            min_price=cheapest.price if cheapest else None,
+            currency=cheapest.currency if cheapest else "JPY",
+            airline=cheapest.airline if cheapest else None,
+            flight_number=cheapest.flight_number if cheapest else None,
+            offer_count=len(offers)
+        ))
+    return matrix
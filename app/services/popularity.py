@@ -0,0 +1,181 @@
+"""
+ルートの人気度
+/analyze のトラフィックから、件数上限つきのヘビーヒッター推定（Space-Saving）で
+よく検索されるルートを求める。事前取得（app/services/prefetch.py）が上位を更新する
+
+- カウンターは capacity 個まで。溢れたら最小のカウンターを新しいキーに譲る
+  （譲られたキーの件数は最大で「譲った値」だけ過大になり、それを誤差として持つ）
+- 半減期ごとに全件数を半分にし、最近のトラフィックを重視する
+- スナップショットをプロセスごとのファイルに書き出し、CLI（scripts/prefetch.py）が合算する
+"""
+import glob
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.clients.flight_data_client import resolve_outbound_date
+
+DEFAULT_POPULARITY_DIR = "/tmp/hidden_route_scanner/popularity"
+
+# (出発地, 到着地, 日程)。日程は実際に取得する日付（古いスナップショットでは未指定が空文字）
+RouteKey = Tuple[str, str, str]
+
+
+class SpaceSaving:
+    """Space-Saving アルゴリズムによる上位キーの推定"""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = max(capacity, 1)
+        # key → [推定件数, 誤差の上限]
+        self._counters: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def add(self, key: str, weight: float = 1.0) -> None:
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+        if len(self._counters) < self.capacity:
+            self._counters[key] = [weight, 0.0]
+            return
+        victim = min(self._counters, key=lambda k: self._counters[k][0])
+        floor = self._counters.pop(victim)[0]
+        self._counters[key] = [floor + weight, floor]
+
+    def top(self, n: int) -> List[Tuple[str, float, float]]:
+        """推定件数の多い順に (key, 件数, 誤差) を n 件"""
+        ranked = sorted(self._counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def clear(self) -> None:
+        self._counters.clear()
+
+    def decay(self, factor: float) -> None:
+        """全件数に factor を掛ける"""
+        for counter in self._counters.values():
+            counter[0] *= factor
+            counter[1] *= factor
+
+    def merge(self, counters: Iterable[Tuple[str, float, float]]) -> None:
+        """他のスケッチの (key, 件数, 誤差) を加算する（溢れた分は小さい順に捨てる）"""
+        for key, count, error in counters:
+            current = self._counters.setdefault(key, [0.0, 0.0])
+            current[0] += count
+            current[1] += error
+        if len(self._counters) > self.capacity:
+            for key, _, _ in self.top(len(self._counters))[self.capacity:]:
+                del self._counters[key]
+
+
+def route_key(departure: str, arrival: str, date: Optional[str]) -> str:
+    """運賃キャッシュのキーと同じく、日程は実際に取得する日付に揃える"""
+    return f"{departure.upper()}:{arrival.upper()}:{resolve_outbound_date(date)}"
+
+
+def parse_route_key(key: str) -> RouteKey:
+    departure, arrival, date = key.split(":", 2)
+    return departure, arrival, date
+
+
+class PopularityTracker:
+    """
+    /analyze で検索されたルートの人気度
+
+    record() はリクエストごとに呼ばれるため、ファイルへの書き出しは
+    save_interval 秒に1回だけ行う（directory が None なら書き出さない）。
+    """
+
+    def __init__(
+        self,
+        capacity: int = 256,
+        half_life: float = 3600.0,
+        directory: Optional[str] = None,
+        save_interval: float = 60.0,
+    ):
+        self.sketch = SpaceSaving(capacity)
+        self.half_life = half_life
+        self.directory = directory
+        self.save_interval = save_interval
+        self._decayed_at = time.time()
+        self._saved_at = time.time()
+
+    @classmethod
+    def from_env(cls) -> "PopularityTracker":
+        """`POPULARITY_CAPACITY`, `POPULARITY_HALF_LIFE`, `POPULARITY_DIR`（空文字で書き出さない）"""
+        directory = os.getenv("POPULARITY_DIR")
+        return cls(
+            capacity=int(os.getenv("POPULARITY_CAPACITY") or 256),
+            half_life=float(os.getenv("POPULARITY_HALF_LIFE") or 3600.0),
+            directory=DEFAULT_POPULARITY_DIR if directory is None else (directory or None),
+        )
+
+    def record(self, departure: str, arrival: str, date: Optional[str] = None) -> None:
+        """検索を1件記録する"""
+        now = time.time()
+        self._maybe_decay(now)
+        self.sketch.add(route_key(departure, arrival, date))
+        if self.directory and now - self._saved_at >= self.save_interval:
+            self.save()
+
+    def _maybe_decay(self, now: float) -> None:
+        if self.half_life <= 0:
+            return
+        elapsed = now - self._decayed_at
+        if elapsed >= self.half_life:
+            self.sketch.decay(0.5 ** (elapsed / self.half_life))
+            self._decayed_at = now
+
+    def top(self, n: int) -> List[Tuple[RouteKey, float]]:
+        """人気の高い順に ((出発地, 到着地, 日程), 推定件数) を n 件"""
+        self._maybe_decay(time.time())
+        return [(parse_route_key(key), count) for key, count, _ in self.sketch.top(n)]
+
+    # ---- スナップショット ----
+
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory or DEFAULT_POPULARITY_DIR, f"popularity-{os.getpid()}.json")
+
+    def save(self) -> None:
+        """このプロセスのスケッチをファイルに書き出す（書き込み途中のファイルは見せない）"""
+        self._saved_at = time.time()
+        path = self.snapshot_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"saved_at": self._saved_at, "counters": self.sketch.top(self.sketch.capacity)},
+                    f, separators=(",", ":"),
+                )
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Popularity Save Error: {e}")
+
+    def load_snapshots(self, max_age: float = 86400.0) -> int:
+        """
+        ディレクトリ内の各プロセスのスナップショットを合算する
+
+        max_age 秒より古いもの（終了したプロセスの残骸）は無視し、
+        保存からの経過時間に応じて半減期で減衰させる。読み込んだファイル数を返す。
+        """
+        now = time.time()
+        loaded = 0
+        for path in glob.glob(os.path.join(self.directory or DEFAULT_POPULARITY_DIR, "popularity-*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Popularity Load Error: {path}: {e}")
+                continue
+            age = now - snapshot.get("saved_at", 0)
+            if age > max_age:
+                continue
+            factor = 0.5 ** (age / self.half_life) if self.half_life > 0 else 1.0
+            self.sketch.merge(
+                (key, count * factor, error * factor) for key, count, error in snapshot["counters"]
+            )
+            loaded += 1
+        return loaded
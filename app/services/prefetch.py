@@ -0,0 +1,180 @@
+"""
+人気ルートの事前取得（refresh-ahead）
+人気度（app/services/popularity.py）の上位ルートについて、運賃と LLM 分析の
+キャッシュが期限切れになる前に取得し直し、期限切れ直後の利用者が
+SerpApi + Grok の待ち時間を負担しないようにする
+
+uvicorn 上ではアプリ内の asyncio タスク（PREFETCH_ENABLED=true）として、
+サーバーレス環境では scripts/prefetch.py を cron から実行して使う。
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date as date_type
+from typing import Dict, List, Optional, Tuple
+
+from app.metrics import PREFETCH_REFRESHES, stage
+from app.services.flight_analyzer import LLM_CANDIDATE_LIMIT, FlightAnalyzerService
+from app.services.popularity import RouteKey, parse_route_key, route_key
+
+
+def _is_upcoming(day: str) -> bool:
+    """日程未指定、または今日以降の日付なら True（不正な形式は False）"""
+    if not day:
+        return True
+    try:
+        return date_type.fromisoformat(day) >= date_type.today()
+    except ValueError:
+        return False
+
+
+@dataclass
+class PrefetchConfig:
+    """事前取得の対象と上流呼び出しの予算（1回の巡回あたり）"""
+    top_n: int = 20
+    # TTL のこの割合を過ぎたエントリを取得し直す
+    refresh_after: float = 0.8
+    max_fare_calls: int = 10
+    max_llm_calls: int = 3
+    interval: float = 60.0
+    # これ未満の推定検索数のルートは対象にしない
+    min_count: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "PrefetchConfig":
+        """`PREFETCH_*` 環境変数から生成"""
+        return cls(
+            top_n=int(os.getenv("PREFETCH_TOP_N") or 20),
+            refresh_after=float(os.getenv("PREFETCH_REFRESH_AFTER") or 0.8),
+            max_fare_calls=int(os.getenv("PREFETCH_MAX_FARE_CALLS") or 10),
+            max_llm_calls=int(os.getenv("PREFETCH_MAX_LLM_CALLS") or 3),
+            interval=float(os.getenv("PREFETCH_INTERVAL") or 60.0),
+            min_count=float(os.getenv("PREFETCH_MIN_COUNT") or 2.0),
+        )
+
+
+@dataclass
+class PrefetchReport:
+    """1回の巡回の結果"""
+    routes: int = 0
+    fares_refreshed: int = 0
+    analyses_refreshed: int = 0
+    fresh: int = 0
+    skipped_budget: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    details: List[Tuple[str, str]] = field(default_factory=list)
+
+    def add(self, route: str, outcome: str) -> None:
+        self.details.append((route, outcome))
+
+
+class RouteRefresher:
+    """人気ルートのキャッシュを期限切れ前に更新する"""
+
+    def __init__(self, service: FlightAnalyzerService, config: Optional[PrefetchConfig] = None):
+        self.service = service
+        self.popularity = service.popularity
+        self.config = config or PrefetchConfig.from_env()
+
+    def targets(self, extra: Tuple[RouteKey, ...] = ()) -> List[RouteKey]:
+        """
+        更新対象（明示指定 + 人気上位。出発日を過ぎたものは除く）
+
+        日程は運賃キャッシュのキーと同じく実際に取得する日付に揃え、
+        未指定と同じ日付の明示指定を1件にまとめる。
+        """
+        routes: Dict[RouteKey, None] = dict.fromkeys(parse_route_key(route_key(*route)) for route in extra)
+        for route, count in self.popularity.top(self.config.top_n):
+            if count >= self.config.min_count:
+                routes.setdefault(parse_route_key(route_key(*route)), None)
+        return [route for route in routes if _is_upcoming(route[2])]
+
+    def _needs_refresh(self, age: Optional[float], ttl: float) -> bool:
+        return age is None or age >= ttl * self.config.refresh_after
+
+    async def run_once(self, extra: Tuple[RouteKey, ...] = ()) -> PrefetchReport:
+        """
+        1回巡回する
+
+        運賃は max_fare_calls 件まで、かつレート制限のトークンを待たずに取れる
+        場合だけ取得し直す（利用者の検索を待たせない）。LLM 分析は運賃の
+        取得後に、そのデータで分析キャッシュが古い・ないルートを max_llm_calls 件まで更新する。
+        """
+        start = time.perf_counter()
+        report = PrefetchReport()
+        service = self.service
+        fare_calls = llm_calls = 0
+        for departure, arrival, date in self.targets(extra):
+            report.routes += 1
+            label = service.route_label(departure, arrival, date or None)
+            day = date or None
+            try:
+                age = service.fare_cache.age(departure, arrival, day)
+                raw_data = None
+                if not self._needs_refresh(age, service.fare_cache.backend.ttl):
+                    raw_data = service.fare_cache.get(departure, arrival, day)
+                if raw_data is None:
+                    if fare_calls >= self.config.max_fare_calls or not service.serpapi_limiter.try_acquire():
+                        report.skipped_budget += 1
+                        PREFETCH_REFRESHES.inc("fares", "skipped_budget")
+                        report.add(label, "skipped_budget")
+                        continue
+                    fare_calls += 1
+                    with stage("prefetch_fares"):
+                        raw_data = await service.refresh_flight_offers(departure, arrival, day)
+                    report.fares_refreshed += 1
+                    PREFETCH_REFRESHES.inc("fares", "refreshed")
+                    if raw_data.is_mock:
+                        # 上流が使えずモックに落ちた場合は分析も更新しない
+                        report.add(label, "fares_mock")
+                        continue
+                else:
+                    service.route_graph.add_offers(raw_data.offers)
+
+                if service.llm_client.use_mock:
+                    # モック分析はキャッシュされないため更新しない
+                    report.add(label, "fares_only")
+                    continue
+                candidates = service.find_local_options(departure, arrival, day)[:LLM_CANDIDATE_LIMIT]
+                fingerprint = service.llm_client.prompt_fingerprint(
+                    departure, arrival, day, raw_data, [], candidates
+                )
+                analysis_age = service.analysis_cache.age(fingerprint)
+                if not self._needs_refresh(analysis_age, service.analysis_cache.backend.ttl):
+                    report.fresh += 1
+                    report.add(label, "fresh")
+                    continue
+                if llm_calls >= self.config.max_llm_calls:
+                    report.skipped_budget += 1
+                    PREFETCH_REFRESHES.inc("analysis", "skipped_budget")
+                    report.add(label, "analysis_skipped_budget")
+                    continue
+                llm_calls += 1
+                with stage("prefetch_analysis"):
+                    await service.get_llm_analysis(
+                        departure, arrival, day, raw_data, [], candidates, refresh=True
+                    )
+                report.analyses_refreshed += 1
+                PREFETCH_REFRESHES.inc("analysis", "refreshed")
+                report.add(label, "refreshed")
+            except Exception as e:
+                print(f"Prefetch Error ({label}): {e}")
+                report.errors += 1
+                PREFETCH_REFRESHES.inc("route", "error")
+                report.add(label, f"error: {type(e).__name__}")
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    async def run_forever(self) -> None:
+        """巡回と interval 秒の待機を繰り返す（キャンセルで停止）"""
+        while True:
+            report = await self.run_once()
+            if report.fares_refreshed or report.analyses_refreshed or report.errors:
+                print(
+                    f"Prefetch: {report.routes} routes, {report.fares_refreshed} fares, "
+                    f"{report.analyses_refreshed} analyses, {report.errors} errors "
+                    f"({report.elapsed:.1f}s)"
+                )
+            await asyncio.sleep(self.config.interval)
@@ -0,0 +1,36 @@
+"""
+日程の柔軟検索
+指定日の前後の日付を展開し、日付 × 最安値のカレンダーを組み立てる
+"""
+from datetime import date as date_type, timedelta
+from typing import Dict, List, Optional
+from app.clients.flight_data_client import default_outbound_date
+from app.models.schemas import DatePrice, RawFlightData
+
+
+def flexible_dates(date: Optional[str], days: int) -> List[str]:
+    """基準日 ±days の日付（今日より前は除く）"""
+    center = date_type.fromisoformat(date or default_outbound_date())
+    today = date_type.today()
+    return [
+        (center + timedelta(days=offset)).isoformat()
+        for offset in range(-days, days + 1)
+        if center + timedelta(days=offset) >= today
+    ]
+
+
+def build_price_calendar(results: Dict[str, RawFlightData], include_mock: bool = False) -> List[DatePrice]:
+    """日付ごとの取得結果から最安値カレンダーを作る（エラー時のモックは除外）"""
+    calendar = []
+    for date in sorted(results):
+        raw_data = results[date]
+        if raw_data.is_mock and not include_mock:
+            continue
+        prices = [offer.price for offer in raw_data.offers if offer.price > 0]
+        calendar.append(DatePrice(
+            date=date,
+            min_price=min(prices) if prices else None,
+            currency=raw_data.offers[0].currency if raw_data.offers else "JPY",
+            offer_count=len(raw_data.offers)
+        ))
+    return calendar
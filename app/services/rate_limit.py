@@ -0,0 +1,53 @@
+"""
+レート制限
+上流 API のクォータに合わせたトークンバケット
+"""
+import asyncio
+import os
+import time
+
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    rate 個/秒で補充され、最大 capacity 個まで貯まる。
+    rate <= 0 の場合は無制限として扱う。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str, default_rate: float, default_burst: float) -> "TokenBucket":
+        """`{prefix}_PER_SEC` と `{prefix}_BURST` から生成"""
+        rate = float(os.getenv(f"{prefix}_PER_SEC") or default_rate)
+        burst = float(os.getenv(f"{prefix}_BURST") or default_burst)
+        return cls(rate, burst)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """待たずに取得できればトークンを消費して True"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """トークンが貯まるまで待って消費する（到着順）"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
@@ -0,0 +1,238 @@
+"""
+ローカル経路エンジン
+取得済みオファーから空港と区間のグラフを作り、LLM を使わずに
+別切り乗り継ぎ（複数チケット）と Hidden City の候補を決定的に求める
+"""
+import heapq
+from bisect import insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.models.schemas import FlightOffer, HiddenFlightOption
+
+# 別切りで乗り継ぐ場合の最低乗り継ぎ時間
+MIN_CONNECTION = timedelta(minutes=90)
+
+_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S")
+
+
+def parse_time(value: str) -> Optional[datetime]:
+    """SerpApi の時刻文字列を datetime に変換（日付を含まない場合は None）"""
+    for fmt in _TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@dataclass(frozen=True, eq=False)
+class Leg:
+    """1枚のチケットで移動できる区間（経由便を含む）"""
+    origin: str
+    destination: str
+    price: float
+    departure: Optional[datetime]
+    arrival: Optional[datetime]
+    stops: Tuple[str, ...]
+    offer: FlightOffer
+
+    @classmethod
+    def from_offer(cls, offer: FlightOffer) -> Optional["Leg"]:
+        """区間情報を持つオファーから生成（持たない場合は None）"""
+        if not offer.segments or offer.price <= 0:
+            return None
+        first, last = offer.segments[0], offer.segments[-1]
+        return cls(
+            origin=first.departure_airport,
+            destination=last.arrival_airport,
+            price=offer.price,
+            departure=parse_time(first.departure_time),
+            arrival=parse_time(last.arrival_time),
+            stops=tuple(seg.arrival_airport for seg in offer.segments[:-1]),
+            offer=offer,
+        )
+
+    @property
+    def key(self) -> tuple:
+        return (self.origin, self.destination, self.offer.flight_number,
+                self.offer.departure_time, self.stops)
+
+    def arrival_at(self, stop: str) -> Optional[datetime]:
+        """経由地 stop への到着時刻"""
+        for seg in self.offer.segments:
+            if seg.arrival_airport == stop:
+                return parse_time(seg.arrival_time)
+        return None
+
+
+def _by_price(leg: Leg) -> float:
+    return leg.price
+
+
+def _format_price(price: float) -> str:
+    return f"¥{price:,.0f}"
+
+
+def _format_save(price: float, baseline: Optional[float]) -> str:
+    if not baseline or baseline <= 0:
+        return "—"
+    return f"{max(0.0, (baseline - price) / baseline * 100):.0f}%"
+
+
+class RouteGraph:
+    """
+    空港をノード、チケット（Leg）を辺とする有向グラフ
+
+    最近追加した max_legs 件を保持し、古い区間から捨てる。
+    隣接リストと経由地インデックスは価格順を保ったまま差分更新する。
+    """
+
+    def __init__(self, max_legs: int = 20000):
+        self.max_legs = max_legs
+        self._legs: "OrderedDict[tuple, Leg]" = OrderedDict()
+        self._by_origin: Dict[str, List[Leg]] = {}
+        self._through: Dict[Tuple[str, str], List[Leg]] = {}
+
+    def __len__(self) -> int:
+        return len(self._legs)
+
+    def add_offers(self, offers: Iterable[FlightOffer]) -> None:
+        for offer in offers:
+            leg = Leg.from_offer(offer)
+            if leg is not None:
+                self.add_leg(leg)
+
+    def add_leg(self, leg: Leg) -> None:
+        """区間を追加する（同じ便が既にあれば、新しく取得した価格の区間で置き換える）"""
+        previous = self._legs.pop(leg.key, None)
+        if previous is not None:
+            self._unindex(previous)
+        self._legs[leg.key] = leg
+        insort(self._by_origin.setdefault(leg.origin, []), leg, key=_by_price)
+        for stop in leg.stops:
+            insort(self._through.setdefault((leg.origin, stop), []), leg, key=_by_price)
+        while len(self._legs) > self.max_legs:
+            _, evicted = self._legs.popitem(last=False)
+            self._unindex(evicted)
+
+    def _unindex(self, leg: Leg) -> None:
+        self._by_origin[leg.origin].remove(leg)
+        for stop in leg.stops:
+            self._through[(leg.origin, stop)].remove(leg)
+
+    def cheapest_direct(self, origin: str, destination: str, date: Optional[str] = None) -> Optional[float]:
+        """origin → destination を1枚で移動する最安値"""
+        for leg in self._by_origin.get(origin, ()):
+            if leg.destination == destination and _on_date(leg, date):
+                return leg.price
+        return None
+
+    def k_cheapest_paths(
+        self,
+        origin: str,
+        destination: str,
+        k: int = 5,
+        max_legs: int = 3,
+        date: Optional[str] = None,
+        max_cost: Optional[float] = None,
+    ) -> List[Tuple[float, List[Leg]]]:
+        """
+        合計価格の安い順に最大 k 本の経路を求める
+
+        最良優先探索で部分経路を展開し、各ノードを確定できる回数を k 回までに
+        制限する（k-shortest walks）。同じ空港を2度通る経路と、乗り継ぎ時間が
+        足りない経路は除外する。隣接リストは価格順なので、max_cost を超えた
+        時点でそのノードの展開を打ち切れる。
+        """
+        tie = count()
+        heap: List[Tuple[float, int, str, Tuple[Leg, ...]]] = [(0.0, next(tie), origin, ())]
+        settled: Dict[str, int] = {}
+        paths: List[Tuple[float, List[Leg]]] = []
+        while heap and len(paths) < k:
+            cost, _, node, path = heapq.heappop(heap)
+            if settled.get(node, 0) >= k:
+                continue
+            settled[node] = settled.get(node, 0) + 1
+            if node == destination and path:
+                paths.append((cost, list(path)))
+                continue
+            if len(path) >= max_legs:
+                continue
+            visited = {origin, *(leg.destination for leg in path)}
+            # 別切りの乗り継ぎに必要な最早出発時刻（時刻不明なら乗り継げない）
+            earliest = None
+            if path:
+                if path[-1].arrival is None:
+                    continue
+                earliest = path[-1].arrival + MIN_CONNECTION
+            for leg in self._by_origin.get(node, ()):
+                if max_cost is not None and cost + leg.price >= max_cost:
+                    break
+                if leg.destination in visited or settled.get(leg.destination, 0) >= k:
+                    continue
+                if earliest is not None:
+                    if leg.departure is None or leg.departure < earliest:
+                        continue
+                elif not _on_date(leg, date):
+                    continue
+                heapq.heappush(heap, (cost + leg.price, next(tie), leg.destination, path + (leg,)))
+        return paths
+
+    def hidden_city_legs(self, origin: str, target: str, date: Optional[str] = None) -> List[Leg]:
+        """target を経由して先の都市へ向かうチケット（安い順）"""
+        return [leg for leg in self._through.get((origin, target), ()) if _on_date(leg, date)]
+
+    def find_candidates(
+        self,
+        origin: str,
+        destination: str,
+        date: Optional[str] = None,
+        limit: int = 5,
+    ) -> List[HiddenFlightOption]:
+        """直行（1枚）の最安値より安い Hidden City / 別切り乗り継ぎの候補"""
+        baseline = self.cheapest_direct(origin, destination, date)
+        candidates: List[Tuple[float, HiddenFlightOption]] = []
+
+        for leg in self.hidden_city_legs(origin, destination, date)[:limit]:
+            if baseline is not None and leg.price >= baseline:
+                break
+            arrival = leg.arrival_at(destination)
+            candidates.append((leg.price, HiddenFlightOption(
+                route=f"{origin} → {destination} (Hidden City: {leg.destination} 行きを {destination} で途中下車)",
+                price=_format_price(leg.price),
+                save=_format_save(leg.price, baseline),
+                tips=(
+                    f"{leg.offer.airline} {leg.offer.flight_number} で {destination} 到着"
+                    + (f" {arrival:%H:%M}" if arrival else "")
+                    + "。受託手荷物は預けられず、復路を同じ予約にできません"
+                ),
+                real_fights=[leg.offer],
+            )))
+
+        paths = self.k_cheapest_paths(
+            origin, destination, k=limit + 1, date=date, max_cost=baseline
+        )
+        for price, path in paths:
+            if len(path) < 2:
+                continue
+            via = " → ".join([origin] + [leg.destination for leg in path])
+            candidates.append((price, HiddenFlightOption(
+                route=f"{via} (別切り乗り継ぎ)",
+                price=_format_price(price),
+                save=_format_save(price, baseline),
+                tips="航空券を別々に購入するため、遅延時の乗り継ぎ保証はありません",
+                real_fights=[leg.offer for leg in path],
+            )))
+
+        candidates.sort(key=lambda item: item[0])
+        return [option for _, option in candidates[:limit]]
+
+
+def _on_date(leg: Leg, date: Optional[str]) -> bool:
+    """出発日が date と一致するか（どちらかが不明なら一致とみなす）"""
+    if not date or leg.departure is None:
+        return True
+    return leg.departure.date().isoformat() == date
@@ -0,0 +1,65 @@
+"""
+シングルフライト（同一リクエストの合流）
+同じキーで同時に走る処理を1回の実行にまとめ、全ての待機者に同じ結果を返す
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """実行中の1回分の呼び出しと、その待機者数"""
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    キー単位で実行中の呼び出しを共有する
+
+    - 例外は全ての待機者に同じものが送出される
+    - 待機者がキャンセルされても他の待機者には影響しない。
+      全員がキャンセルした時点で上流の処理もキャンセルする
+    - 処理が完了したキーはすぐに解放される（結果はキャッシュしない）
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        """実行中のキー数"""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """key が実行中ならその結果を待ち、そうでなければ fn を実行する"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            self.executions += 1
+            call.task.add_done_callback(lambda _: self._release(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done():
+                call.waiters -= 1
+                if call.waiters == 0:
+                    # 後続の呼び出しがキャンセル中のタスクに合流しないよう先に外す
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                    call.task.cancel()
+            raise
+
+    def _release(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # 待機者が全員キャンセル済みの場合、例外を取り出して警告を抑止する
+        if not call.task.cancelled():
+            call.task.exception()
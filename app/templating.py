@@ -0,0 +1,129 @@
+"""
+テンプレート環境
+scripts/build_assets.py でビルド時にコンパイルしたテンプレートがあればそれを読み込み、
+実行時の構文解析とコンパイルを省く。ビルド成果物がない、または元のテンプレートや
+Jinja2 のバージョンと一致しない場合は通常どおり実行時にコンパイルする。
+
+描画済みの HTML 断片は FragmentCache で描画入力のハッシュをキーに保持し、
+同じ結果・同じクエリの再描画を省く。
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, Optional
+import jinja2
+from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel
+from app.http_caching import static_digest, static_url
+from app.metrics import stage
+from app.serialization import dumps
+from app.services.cache import CacheBackend, create_cache_backend
+
+APP_DIR = os.path.dirname(__file__)
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+# ビルド成果物の置き場所（scripts/build_assets.py で生成してコミットし、Vercel に同梱する）
+BUILD_DIR = os.path.join(APP_DIR, "build")
+COMPILED_TEMPLATES_DIR = os.path.join(BUILD_DIR, "templates")
+MANIFEST_FILE = "manifest.json"
+
+
+def create_environment(loader: jinja2.BaseLoader) -> jinja2.Environment:
+    """Jinja2Templates(directory=...) と同じ設定の Environment を生成"""
+    env = jinja2.Environment(loader=loader, autoescape=True)
+    env.globals["static_url"] = static_url
+    return env
+
+
+def template_digests(directory: str = TEMPLATES_DIR) -> Dict[str, str]:
+    """テンプレート名 → 内容の SHA-256"""
+    digests = {}
+    for dirpath, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                digests[name] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def compile_templates(target: str = COMPILED_TEMPLATES_DIR) -> int:
+    """全テンプレートを Python モジュールにコンパイルし、マニフェストを書き出す"""
+    shutil.rmtree(target, ignore_errors=True)
+    env = create_environment(jinja2.FileSystemLoader(TEMPLATES_DIR))
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    digests = template_digests()
+    with open(os.path.join(target, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"jinja2": jinja2.__version__, "templates": digests}, f, indent=2, sort_keys=True)
+    return len(digests)
+
+
+def compiled_templates_are_fresh(target: str = COMPILED_TEMPLATES_DIR) -> bool:
+    """コンパイル済みテンプレートが現在のソースと一致するか"""
+    try:
+        with open(os.path.join(target, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (
+        manifest.get("jinja2") == jinja2.__version__
+        and manifest.get("templates") == template_digests()
+    )
+
+
+class TimedTemplates(Jinja2Templates):
+    """TemplateResponse の描画時間を "render" ステージとして記録する"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        with stage("render"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def create_templates() -> Jinja2Templates:
+    """コンパイル済みテンプレートを優先するテンプレート環境を生成"""
+    loader: jinja2.BaseLoader = jinja2.FileSystemLoader(TEMPLATES_DIR)
+    if compiled_templates_are_fresh():
+        loader = jinja2.ChoiceLoader([jinja2.ModuleLoader(COMPILED_TEMPLATES_DIR), loader])
+    return TimedTemplates(env=create_environment(loader))
+
+
+class FragmentCache:
+    """
+    描画済み HTML 断片のキャッシュ
+
+    キーはテンプレート名（または断片の種類）と描画入力のハッシュ。
+    テンプレートと静的ファイルの内容もキーに含めるため、デプロイでどちらかが変われば
+    別のキーになる（共有バックエンドに古い static_url の断片が残っていても返さない）。
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        # 既定: メモリ / 10分 / 2048件
+        if backend is None:
+            backend = create_cache_backend("FRAGMENT_CACHE", 600.0, 2048)
+        self.backend = backend
+        digests = sorted(template_digests().items())
+        self._templates_digest = hashlib.sha256(dumps([digests, static_digest()])).hexdigest()
+
+    def key(self, name: str, *parts: Any) -> str:
+        """断片のキー（BaseModel は JSON、それ以外は dumps でハッシュする）"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self._templates_digest.encode())
+        digest.update(name.encode())
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(part.model_dump_json().encode() if isinstance(part, BaseModel) else dumps(part))
+        return digest.hexdigest()
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> bytes:
+        """キャッシュ済みの断片を返す（なければ描画して保存する）"""
+        entry = self.backend.get(key)
+        if entry is not None:
+            return entry.value
+        with stage("render"):
+            body = render().encode("utf-8")
+        self.backend.set(key, body)
+        return body
+
+    def stats(self) -> dict:
+        """ヒット/ミス/追い出しのカウンター"""
+        return {"entries": len(self.backend), "ttl": self.backend.ttl, **self.backend.stats.to_dict()}
@@ -0,0 +1,94 @@
+"""
+空港検索のマイクロベンチマーク
+旧実装（線形走査）と AirportIndex のクエリあたりレイテンシを比較する
+
+使い方:
+    python3 scripts/bench_airport_search.py [--airports 70000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.airport_index import AirportIndex  # noqa: E402
+
+CITY_WORDS = ["東京", "大阪", "札幌", "那覇", "London", "Paris", "New York", "San", "Santa", "Port",
+              "Saint", "Lake", "Rio", "Berlin", "Seoul", "Taipei", "Sydney", "Cairo", "Lima"]
+NAME_WORDS = ["International", "Regional", "Municipal", "Airport", "Field", "Airfield", "国際空港",
+              "空港", "Air Base", "Heliport"]
+QUERIES = ["h", "hn", "hnd", "to", "東", "東京", "lon", "air", "international", "san", "xyzq", "port"]
+
+
+def generate_airports(n: int, seed: int = 42) -> list:
+    """ベンチマーク用の合成空港データ（IATA風3文字コード + 4文字 ICAO風コード）"""
+    rng = random.Random(seed)
+    codes = set()
+    airports = []
+    while len(airports) < n:
+        length = 3 if len(codes) < 17576 else 4
+        code = "".join(rng.choices(string.ascii_uppercase, k=length))
+        if code in codes:
+            continue
+        codes.add(code)
+        city = f"{rng.choice(CITY_WORDS)} {rng.choice(string.ascii_uppercase)}{rng.randint(1, 999)}"
+        name = f"{city} {rng.choice(NAME_WORDS)}"
+        airports.append({"code": code, "name": name, "city": city})
+    return airports
+
+
+def legacy_search(airports_data: list, q: str) -> list:
+    """変更前の /search-airports の検索ロジック"""
+    q = q.strip().lower()
+    exact_match = [a for a in airports_data if a["code"].lower() == q]
+    starts_with = [a for a in airports_data if a["code"].lower().startswith(q) and a not in exact_match]
+    others = [
+        a for a in airports_data
+        if (q in a["name"].lower() or q in a["city"].lower())
+        and a not in exact_match and a not in starts_with
+    ]
+    return (exact_match + starts_with + others)[:10]
+
+
+def bench(fn, queries, repeat: int) -> float:
+    """クエリあたりの平均レイテンシ（ms）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--airports", type=int, default=70000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    airports = generate_airports(args.airports)
+
+    start = time.perf_counter()
+    index = AirportIndex(airports)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"airports: {len(airports)}  index build: {build_ms:.1f} ms")
+
+    # ランキングが旧実装と一致することを確認
+    for q in QUERIES:
+        expected = [a["code"] for a in legacy_search(airports, q)]
+        actual = [a["code"] for a in index.search(q, limit=10)]
+        if expected != actual:
+            print(f"MISMATCH for {q!r}: legacy={expected} index={actual}")
+            sys.exit(1)
+
+    print(f"{'query':<16}{'legacy ms':>12}{'index ms':>12}{'speedup':>10}")
+    for q in QUERIES:
+        legacy_ms = bench(lambda x: legacy_search(airports, x), [q], max(1, args.repeat // 5))
+        index_ms = bench(lambda x: index.search(x, limit=10), [q], args.repeat * 100)
+        print(f"{q:<16}{legacy_ms:>12.3f}{index_ms:>12.4f}{legacy_ms / index_ms:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+空港補完（/search-airports）の転送量とサーバー CPU の計測（変更前との比較）
+ブラウザと同じく Cache-Control の max-age の間は手元のキャッシュを使い、
+ETag を覚えて If-None-Match で再検証するクライアントで、1文字ずつ入力する検索を
+ASGI アプリに直接送り、入力1回あたりの転送バイト数（ヘッダー + 本文）と
+サーバーの CPU 時間を表示する（1利用者の入力はキャッシュの有効期限内に収まるものとする）
+
+比較対象（before）は断片キャッシュ・条件付き応答・圧縮を入れる前のリビジョン
+（既定: app/http_caching.py を追加したコミットの親）を git archive で書き出して計測する。
+どちらも別プロセスで同じ条件で計測し、結果を並べて表示する。
+
+使い方:
+    python3 scripts/bench_autocomplete.py [--users 200] [--encoding "gzip, deflate, br"]
+    python3 scripts/bench_autocomplete.py --baseline-rev <commit>   # 比較対象を指定
+    python3 scripts/bench_autocomplete.py --single                  # このツリーのみ（JSON で出力）
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def load_words() -> list:
+    """利用者が入力する語（空港コード・都市名・空港名。1文字ずつ送られる）"""
+    from app.dependencies import AIRPORTS_FILE
+
+    with open(AIRPORTS_FILE, "r", encoding="utf-8") as f:
+        airports = json.load(f)
+    words = {a["code"].lower() for a in airports} | {a["city"] for a in airports} | {a["name"] for a in airports}
+    return sorted(words)
+
+
+async def request(app, path: str, headers: dict) -> tuple:
+    """ASGI アプリに GET を1件送り、(ステータス, ヘッダー, 本文の転送バイト列) を返す"""
+    raw_path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(), "root_path": "",
+        "query_string": query.encode(), "server": ("testserver", 80), "client": ("198.51.100.1", 50000),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], dict((k.decode("latin-1"), v.decode("latin-1")) for k, v in start["headers"]), body
+
+
+def wire_bytes(status: int, headers: dict, body: bytes) -> int:
+    """HTTP/1.1 で送られるおおよそのバイト数"""
+    return len(f"HTTP/1.1 {status} X\r\n") + sum(len(k) + len(v) + 4 for k, v in headers.items()) + 2 + len(body)
+
+
+async def measure(args) -> dict:
+    """このツリーのアプリを計測する"""
+    from app.main import app
+
+    rng = random.Random(42)
+    words = load_words()
+    accept = {"Accept-Encoding": args.encoding} if args.encoding else {}
+    # 起動直後の初回読み込みを計測から外す
+    await request(app, "/search-airports?q=t", accept)
+
+    totals = {"keystrokes": 0, "requests": 0, "bytes": 0, "body": 0, "not_modified": 0}
+    cpu = []
+    for _ in range(args.users):
+        # 利用者ごとのブラウザキャッシュ（URL → ETag）と、max-age の間は再検証しない URL
+        etags: dict = {}
+        fresh: set = set()
+        for word in rng.sample(words, args.words):
+            # 打ち直しで同じ語を2回入力することもある
+            for prefix in [word[:i] for i in range(1, len(word) + 1)] * rng.choice((1, 1, 2)):
+                path = "/search-airports?" + urlencode({"q": prefix})
+                totals["keystrokes"] += 1
+                if path in fresh:
+                    continue
+                headers = dict(accept)
+                if path in etags:
+                    headers["If-None-Match"] = etags[path]
+                start = time.process_time()
+                status, response_headers, body = await request(app, path, headers)
+                cpu.append(time.process_time() - start)
+                if "etag" in response_headers:
+                    etags[path] = response_headers["etag"]
+                cache_control = response_headers.get("cache-control", "")
+                if "max-age" in cache_control and "max-age=0" not in cache_control:
+                    fresh.add(path)
+                totals["requests"] += 1
+                totals["bytes"] += wire_bytes(status, response_headers, body)
+                totals["body"] += len(body)
+                totals["not_modified"] += status == 304
+
+    n, k = totals["requests"], totals["keystrokes"]
+    result = {
+        "keystrokes": k,
+        "requests": n,
+        "not_modified": totals["not_modified"],
+        "browser_cache": k - n,
+        "bytes_per_keystroke": totals["bytes"] / k,
+        "bytes_per_request": totals["bytes"] / n,
+        "body_per_request": totals["body"] / n,
+        "cpu_us_per_request": statistics.median(cpu) * 1e6,
+        "cpu_us_per_keystroke": sum(cpu) / k * 1e6,
+        "static": [],
+    }
+
+    # ページが参照する静的ファイル
+    _, _, page = await request(app, "/", {})
+    for path in sorted({ref for ref in page.decode().split('"') if ref.startswith("/static/")}):
+        status, headers, body = await request(app, path, accept)
+        result["static"].append({
+            "path": path,
+            "bytes": wire_bytes(status, headers, body),
+            "content_encoding": headers.get("content-encoding", "-"),
+            "cache_control": headers.get("cache-control", "-"),
+        })
+    return result
+
+
+def default_baseline_rev() -> str:
+    """断片キャッシュ・条件付き応答・圧縮を入れる前のリビジョン"""
+    added = subprocess.run(
+        ["git", "log", "--diff-filter=A", "--format=%H", "--", "app/http_caching.py"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    if not added:
+        raise SystemExit("app/http_caching.py の追加コミットが見つかりません。--baseline-rev を指定してください")
+    return added[-1] + "^"
+
+
+def export_revision(rev: str, target: str) -> None:
+    """リビジョンのツリーを target に書き出し、このスクリプトを置く"""
+    archive = os.path.join(target, "tree.tar")
+    with open(archive, "wb") as f:
+        subprocess.run(["git", "archive", rev], cwd=ROOT, stdout=f, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    os.remove(archive)
+    shutil.copy(os.path.abspath(__file__), os.path.join(target, "scripts", "bench_autocomplete.py"))
+
+
+def run_child(root: str, args) -> dict:
+    """別プロセスで計測して結果を受け取る"""
+    env = dict(os.environ, SERPAPI_API_KEY="", GROK_API_KEY="", OPENAI_API_KEY="", PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, os.path.join(root, "scripts", "bench_autocomplete.py"), "--single",
+         "--users", str(args.users), "--words", str(args.words), "--encoding", args.encoding],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_comparison(rev: str, before: dict, after: dict) -> None:
+    print(f"before = {rev}, after = working tree")
+    print(f"keystrokes: {after['keystrokes']} "
+          f"(after: {after['requests']} requests, {after['not_modified']} x 304, "
+          f"{after['browser_cache']} from browser cache)")
+    print(f"{'metric':<24} {'before':>10} {'after':>10}")
+    rows = [
+        ("bytes/keystroke", "bytes_per_keystroke", "B"),
+        ("bytes/request", "bytes_per_request", "B"),
+        ("body bytes/request", "body_per_request", "B"),
+        ("server CPU/request", "cpu_us_per_request", "us"),
+        ("server CPU/keystroke", "cpu_us_per_keystroke", "us"),
+    ]
+    for label, key, unit in rows:
+        print(f"{label:<24} {before[key]:>7.0f} {unit:<2} {after[key]:>7.0f} {unit:<2}")
+    for name, result in (("before", before), ("after", after)):
+        for static in result["static"]:
+            print(f"{name:<6} {static['path']}: {static['bytes']} B "
+                  f"(content-encoding={static['content_encoding']}, cache-control={static['cache_control']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--words", type=int, default=3, help="利用者1人あたりの入力語数")
+    parser.add_argument("--encoding", default="gzip, deflate, br", help="Accept-Encoding（空なら圧縮なし）")
+    parser.add_argument("--baseline-rev", help="比較対象のリビジョン（既定: app/http_caching.py 追加前）")
+    parser.add_argument("--single", action="store_true", help="このツリーのみ計測して JSON を出力する")
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(asyncio.run(measure(args))))
+        return
+
+    rev = args.baseline_rev or default_baseline_rev()
+    with tempfile.TemporaryDirectory() as workdir:
+        export_revision(rev, workdir)
+        before = run_child(workdir, args)
+    after = run_child(ROOT, args)
+    print_comparison(rev, before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+コールドスタートの計測
+新しい Python プロセスで app.main の import 時間と、各エンドポイントへの
+最初のリクエストのレイテンシを計測する（Vercel の初回起動に相当）
+
+CI では --json で結果を保存し、--max-import-ms / --max-first-request-ms で
+予算を超えたときに終了コード 1 を返す。
+
+使い方:
+    python3 scripts/build_assets.py    # ビルド成果物ありの状態を計測する場合
+    python3 scripts/bench_cold_start.py [--runs 5] [--json cold_start.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 子プロセスで実行するコード（lifespan は実行しない）
+CHILD = r"""
+import json, time
+start = time.perf_counter()
+from app.main import app
+timings = {"import_ms": (time.perf_counter() - start) * 1000}
+
+from starlette.testclient import TestClient
+client = TestClient(app)
+requests = [
+    ("home", "GET", "/", {}),
+    ("search_airports", "GET", "/search-airports", {"params": {"q": "東京"}}),
+    ("analyze_stream", "POST", "/analyze", {"data": {"departure": "HND", "arrival": "ITM", "stream": "1"}}),
+]
+for name, method, url, kwargs in requests:
+    start = time.perf_counter()
+    response = client.request(method, url, **kwargs)
+    timings[name + "_ms"] = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, (url, response.status_code)
+print(json.dumps(timings))
+"""
+
+
+def run_once(env: dict) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def child_env(workdir: str) -> dict:
+    env = dict(os.environ)
+    # 外部 API に依存しないよう、モックモードとメモリキャッシュで計測する
+    for key in ("SERPAPI_API_KEY", "GROK_API_KEY", "OPENAI_API_KEY"):
+        env[key] = ""
+    env["FARE_CACHE_BACKEND"] = "memory"
+    env["ANALYSIS_CACHE_BACKEND"] = "memory"
+    env["FARE_HISTORY_DIR"] = os.path.join(workdir, "fare_history")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="結果を JSON で保存するパス")
+    parser.add_argument("--max-import-ms", type=float, help="import 時間（中央値）の予算")
+    parser.add_argument("--max-first-request-ms", type=float, help="初回リクエスト（中央値・最遅のもの）の予算")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = child_env(workdir)
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    build_dir = os.path.join(ROOT, "app", "build")
+    summary = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "build_assets": os.path.isdir(build_dir),
+        "metrics": {},
+    }
+    print(f"runs={args.runs} build_assets={summary['build_assets']}")
+    print(f"{'metric':<24} {'median':>9} {'min':>9} {'max':>9}")
+    for name in runs[0]:
+        values = [run[name] for run in runs]
+        summary["metrics"][name] = {
+            "median": statistics.median(values), "min": min(values), "max": max(values),
+        }
+        print(f"{name:<24} {statistics.median(values):>7.1f}ms {min(values):>7.1f}ms {max(values):>7.1f}ms")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    failures = []
+    metrics = summary["metrics"]
+    if args.max_import_ms is not None and metrics["import_ms"]["median"] > args.max_import_ms:
+        failures.append(f"import {metrics['import_ms']['median']:.1f}ms > {args.max_import_ms:g}ms")
+    if args.max_first_request_ms is not None:
+        slowest = max(
+            (value["median"], name) for name, value in metrics.items()
+            if name not in ("import_ms", "process_ms")
+        )
+        if slowest[0] > args.max_first_request_ms:
+            failures.append(f"{slowest[1]} {slowest[0]:.1f}ms > {args.max_first_request_ms:g}ms")
+    if failures:
+        print("budget exceeded: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+運賃集約（FareAggregator）のベンチマーク
+レイテンシと失敗率の異なるプロセス内のスタブプロバイダーを使い、
+単一プロバイダーと比べた待ち時間、重複除去、遅いプロバイダーの除外を確認する
+
+各プロバイダーは共通の便のうち一部を、少しずつ違う価格で返す（同じ便が複数から届く）。
+
+使い方:
+    python3 scripts/bench_fare_aggregator.py [--requests 200] [--min-offers 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.fare_aggregator import FareAggregator  # noqa: E402
+from app.clients.fare_provider import FareProvider, offer_key  # noqa: E402
+from app.clients.resilience import Deadline  # noqa: E402
+from app.metrics import FARE_PROVIDER_CALLS  # noqa: E402
+from app.models.schemas import FlightOffer, RawFlightData  # noqa: E402
+
+OUTCOMES = ("used", "empty", "cancelled", "skipped")
+AIRLINES = ["ANA", "JAL", "Peach", "Jetstar Japan", "Skymark"]
+# 全プロバイダーに共通する便（航空会社, 便名, 出発, 到着, 基準価格）
+FLIGHTS = [
+    (AIRLINES[i % 5], f"{'NH JL MM GK BC'.split()[i % 5]} {100 + i * 7}",
+     f"2026-11-20 {6 + i // 2:02d}:{(i * 25) % 60:02d}", f"2026-11-20 {8 + i // 2:02d}:{(i * 25) % 60:02d}",
+     6000.0 + i * 450)
+    for i in range(24)
+]
+
+
+class StubProvider(FareProvider):
+    """対数正規分布のレイテンシで、共通の便の一部を返すスタブ"""
+
+    def __init__(self, name: str, median: float, sigma: float, coverage: float, failure_rate: float = 0.0, seed: int = 0):
+        self.name = name
+        self.median = median
+        self.sigma = sigma
+        self.coverage = coverage
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline: Optional[Deadline] = None):
+        self.calls += 1
+        await asyncio.sleep(self.median * self.rng.lognormvariate(0, self.sigma))
+        if self.rng.random() < self.failure_rate:
+            return RawFlightData(source=f"{self.name} (mock)", is_mock=True)
+        offers = [
+            FlightOffer(
+                airline=airline, flight_number=number, departure_time=dep, arrival_time=arr,
+                price=round(price * self.rng.uniform(0.95, 1.08), -1), currency="JPY",
+            )
+            for airline, number, dep, arr, price in FLIGHTS
+            if self.rng.random() < self.coverage
+        ]
+        return RawFlightData(source=self.name, offers=offers, fetched_at=time.time())
+
+
+def make_providers(outage: bool) -> List[StubProvider]:
+    return [
+        StubProvider("fast", median=0.25, sigma=0.3, coverage=0.5, seed=1),
+        StubProvider("medium", median=0.5, sigma=0.4, coverage=0.6, failure_rate=1.0 if outage else 0.05, seed=2),
+        StubProvider("slow", median=1.5, sigma=0.6, coverage=0.9, seed=3),
+    ]
+
+
+def pct(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))] * 1000
+
+
+async def run_scenario(name: str, provider: FareProvider, requests: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    counts: List[int] = []
+    mock = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal mock
+        async with semaphore:
+            start = time.perf_counter()
+            raw = await provider.get_flight_offers("HND", "CTS", "2026-11-20", Deadline(10.0))
+            latencies.append(time.perf_counter() - start)
+            counts.append(len(raw.offers))
+            mock += raw.is_mock
+            keys = [offer_key(o) for o in raw.offers]
+            assert len(keys) == len(set(keys)), "duplicate offers in merged result"
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    print(f"{name:<28} p50={pct(latencies, 50):>6.0f} ms p95={pct(latencies, 95):>6.0f} ms "
+          f"offers={statistics.mean(counts):>5.1f} mock={mock}")
+    return latencies
+
+
+async def run(args: argparse.Namespace) -> None:
+    for outage in (False, True):
+        label = "medium provider down" if outage else "all providers up"
+        print(f"--- {label} ---")
+        for single in make_providers(outage)[1:]:
+            await run_scenario(f"single: {single.name}", single, args.requests, args.concurrency)
+        providers = make_providers(outage)
+        aggregator = FareAggregator(providers, min_offers=args.min_offers, grace=args.grace)
+        before = {(p.name, o): FARE_PROVIDER_CALLS.value(p.name, o) for p in providers for o in OUTCOMES}
+        await run_scenario("aggregator", aggregator, args.requests, args.concurrency)
+        for provider in providers:
+            outcomes = " ".join(
+                f"{o}={FARE_PROVIDER_CALLS.value(provider.name, o) - before[provider.name, o]:.0f}" for o in OUTCOMES
+            )
+            print(f"  {provider.name:<8} score={aggregator.stats[provider.name].score() * 1000:>6.0f} ms "
+                  f"calls={provider.calls:<4} {outcomes}")
+
+    # 重複除去: 同じ便は最安のものだけが残る
+    a = StubProvider("a", 0.01, 0.0, 1.0, seed=7)
+    b = StubProvider("b", 0.01, 0.0, 1.0, seed=8)
+    merged = await FareAggregator([a, b], min_offers=100, grace=1.0).get_flight_offers("HND", "CTS")
+    print(f"--- dedup --- {len(FLIGHTS)} flights from 2 providers with full coverage -> {len(merged.offers)} offers")
+    if len(merged.offers) != len(FLIGHTS):
+        sys.exit("dedup failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--min-offers", type=int, default=10)
+    parser.add_argument("--grace", type=float, default=0.3, help="最初の結果から他を待つ秒数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
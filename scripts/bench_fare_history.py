@@ -0,0 +1,115 @@
+"""
+運賃履歴ストアのサイズとクエリレイテンシの計測
+合成データを段階的に追記し、総行数が増えても1ルートのクエリ時間が
+ルート内の行数だけで決まること（全体の行数に比例しないこと）を確認する
+
+使い方:
+    python3 scripts/bench_fare_history.py [--routes 200] [--rows-per-step 5000000] [--steps 4]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.fare_history import COLUMNS, FareHistory  # noqa: E402
+
+
+def route_names(n: int):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    for i in range(n):
+        yield (
+            "N" + letters[i // 26 % 26] + letters[i % 26],
+            "X" + letters[i // 26 % 26] + letters[i % 26],
+        )
+
+
+def synthetic_columns(rng: np.random.Generator, rows: int, now: int) -> dict:
+    base = rng.uniform(15000, 90000)
+    return {
+        "travel_date": rng.integers(now // 86400, now // 86400 + 180, rows),
+        "observed_at": rng.integers(now - 120 * 86400, now, rows),
+        "airline": rng.integers(0, 12, rows),
+        "dep_minute": rng.integers(0, 1440, rows),
+        "price": rng.gamma(8.0, base / 8.0, rows),
+    }
+
+
+def disk_bytes(root: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def measure(history: FareHistory, routes, repeat: int) -> dict:
+    timings = {"insight": [], "insight_warm": [], "percentiles": [], "trend": []}
+    for departure, arrival in routes[:repeat]:
+        # 新しいインスタンスでキャッシュ済みビュー・要約を使わずに計測する
+        fresh = FareHistory(history.root)
+        start = time.perf_counter()
+        fresh.insight(departure, arrival, 30000)
+        timings["insight"].append(time.perf_counter() - start)
+
+        # 2回目以降（行が増えるまでは要約を再利用する）
+        start = time.perf_counter()
+        fresh.insight(departure, arrival, 30000)
+        timings["insight_warm"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fresh.percentiles(departure, arrival, days=30)
+        timings["percentiles"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fresh.trend(departure, arrival)
+        timings["trend"].append(time.perf_counter() - start)
+    return {name: statistics.median(values) * 1000 for name, values in timings.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--rows-per-step", type=int, default=5_000_000)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20, help="ステップごとに計測するルート数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    routes = list(route_names(args.routes))
+    root = tempfile.mkdtemp(prefix="fare_history_bench_")
+    history = FareHistory(root)
+    now = int(time.time())
+    row_bytes = sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values())
+    per_route = max(1, args.rows_per_step // len(routes))
+
+    print(f"routes={len(routes)} row={row_bytes}B (columns: {', '.join(COLUMNS)})")
+    print(f"{'total rows':>12} {'rows/route':>11} {'disk':>10} {'B/row':>6} "
+          f"{'append s':>9} {'insight':>9} {'warm':>9} {'pctl 30d':>9} {'trend':>9}")
+    try:
+        total = 0
+        for _ in range(args.steps):
+            start = time.perf_counter()
+            for departure, arrival in routes:
+                history.append_columns(departure, arrival, synthetic_columns(rng, per_route, now))
+            elapsed = time.perf_counter() - start
+            total += per_route * len(routes)
+
+            size = disk_bytes(root)
+            ms = measure(history, routes, args.repeat)
+            print(f"{total:>12,} {total // len(routes):>11,} {size / 1e6:>8.1f}MB {size / total:>6.1f} "
+                  f"{elapsed:>9.2f} {ms['insight']:>7.2f}ms {ms['insight_warm']:>7.3f}ms "
+                  f"{ms['percentiles']:>7.2f}ms {ms['trend']:>7.2f}ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
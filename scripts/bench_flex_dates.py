@@ -0,0 +1,79 @@
+"""
+柔軟日程検索のウォールクロック計測
+±N 日の並行検索が、1回の検索とほぼ同じ時間で終わることを確認する
+
+使い方:
+    python3 scripts/bench_flex_dates.py [--days 3] [--latency 1.0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.services.cache import MemoryCacheBackend  # noqa: E402
+from app.services.fare_cache import FareCache  # noqa: E402
+from app.services.flight_analyzer import FlightAnalyzerService  # noqa: E402
+from app.services.rate_limit import TokenBucket  # noqa: E402
+
+
+class StubFlightDataClient(FlightDataClient):
+    """実 API と同じく use_mock=False として振る舞い、呼び出し回数を数える"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.use_mock = False
+        self.latency = latency
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+def make_service(latency: float) -> FlightAnalyzerService:
+    service = FlightAnalyzerService(
+        flight_data_client=StubFlightDataClient(latency),
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=100)),
+    )
+    service.serpapi_limiter = TokenBucket(rate=5.0, capacity=10.0)
+    return service
+
+
+async def run(args):
+    service = make_service(args.latency)
+    start = time.perf_counter()
+    await service.get_flight_offers("HND", "CTS", "2026-12-01")
+    single = time.perf_counter() - start
+
+    service = make_service(args.latency)
+    start = time.perf_counter()
+    _, calendar = await service.get_offers_with_calendar("HND", "CTS", "2026-12-01", args.days)
+    fanout = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await service.get_offers_with_calendar("HND", "CTS", "2026-12-01", args.days)
+    cached = time.perf_counter() - start
+
+    print(f"single lookup:             {single * 1000:8.0f} ms")
+    print(f"±{args.days} days ({len(calendar)} lookups): {fanout * 1000:8.0f} ms "
+          f"(sequential would be ~{single * len(calendar) * 1000:.0f} ms)")
+    print(f"±{args.days} days, cached:        {cached * 1000:8.1f} ms "
+          f"upstream calls total={service.flight_data_client.calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+接続再利用の検証スクリプト
+ローカルのスタブサーバーに対して、共有クライアント経由のリクエストが
+同じ TCP 接続を使い回すこと（従来の呼び出しごとのクライアントとの差）を確認する
+
+使い方:
+    python3 scripts/bench_http_pool.py [--requests 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+from app.clients.http_pool import UpstreamHttpConfig  # noqa: E402
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.clients.llm_client import LLMClient  # noqa: E402
+
+SERPAPI_BODY = json.dumps({
+    "best_flights": [{
+        "price": 6500,
+        "flights": [{
+            "airline": "Peach", "flight_number": "MM123",
+            "departure_airport": {"time": "2026-03-01 08:30"},
+            "arrival_airport": {"time": "2026-03-01 10:00"},
+        }],
+    }],
+}).encode()
+GROK_BODY = json.dumps({
+    "choices": [{"message": {"content": json.dumps({"hidden_options": [], "avoid_tips": "stub"})}}],
+}).encode()
+
+
+class StubServer:
+    """HTTP/1.1 keep-alive 対応の最小スタブ。受け付けた TCP 接続数を数える"""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, v in (line.split(":", 1) for line in header_lines if ":" in line)
+                }
+                length = int(headers.get("content-length", "0"))
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                body = GROK_BODY if request_line.startswith("POST") else SERPAPI_BODY
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run(n: int):
+    os.environ.setdefault("SERPAPI_API_KEY", "stub")
+    os.environ.setdefault("GROK_API_KEY", "xai-stub-key-for-local-testing")
+
+    stub = StubServer()
+    base = await stub.start()
+
+    # 共有クライアント（lifespan と同じ構成）
+    serpapi_http = UpstreamHttpConfig.from_env("SERPAPI", 20.0).create_client()
+    grok_http = UpstreamHttpConfig.from_env("GROK", 30.0).create_client()
+    flight_client = FlightDataClient(http_client=serpapi_http)
+    flight_client.base_url = f"{base}/search"
+    llm_client = LLMClient(http_client=grok_http)
+    llm_client.base_url = f"{base}/v1/chat/completions"
+
+    start = time.perf_counter()
+    for _ in range(n):
+        raw = await flight_client.get_flight_offers("HND", "CTS", "2026-03-01")
+        await llm_client.analyze_flight_route("HND", "CTS", "2026-03-01", raw_data=raw)
+    pooled_ms = (time.perf_counter() - start) * 1000
+    pooled_connections = stub.connections
+    await serpapi_http.aclose()
+    await grok_http.aclose()
+
+    # 従来方式: 呼び出しごとに新しいクライアントを生成
+    stub.connections = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        async with httpx.AsyncClient(timeout=20.0) as client:
+            await client.get(f"{base}/search")
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await client.post(f"{base}/v1/chat/completions", json={})
+    per_call_ms = (time.perf_counter() - start) * 1000
+    per_call_connections = stub.connections
+
+    await stub.stop()
+
+    print(f"requests per mode: {n * 2}")
+    print(f"pooled:   {pooled_connections:>4} TCP connections  {pooled_ms:8.1f} ms")
+    print(f"per-call: {per_call_connections:>4} TCP connections  {per_call_ms:8.1f} ms")
+    if pooled_connections > 2:
+        print("FAIL: pooled clients did not reuse connections")
+        sys.exit(1)
+    print("OK: pooled clients reused one connection per upstream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+近隣空港マトリクス検索のウォールクロック計測
+2×2 / 3×3 の組み合わせ検索が1回の検索とほぼ同じ時間で終わり、
+2回目以降や重なる区間は運賃キャッシュから返ることを確認する
+
+使い方:
+    python3 scripts/bench_metro_matrix.py [--size 2] [--latency 1.0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.services.cache import MemoryCacheBackend  # noqa: E402
+from app.services.fare_cache import FareCache  # noqa: E402
+from app.services.flight_analyzer import FlightAnalyzerService  # noqa: E402
+from app.services.rate_limit import TokenBucket  # noqa: E402
+
+# 都市圏ごとの空港（先頭が入力した空港）
+DEPARTURES = ["HND", "NRT", "IBR"]
+ARRIVALS = ["KIX", "ITM", "UKB"]
+
+
+class StubFlightDataClient(FlightDataClient):
+    """実 API と同じく use_mock=False として振る舞い、呼び出し回数を数える"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.use_mock = False
+        self.latency = latency
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+def make_service(latency: float) -> FlightAnalyzerService:
+    service = FlightAnalyzerService(
+        flight_data_client=StubFlightDataClient(latency),
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=100)),
+    )
+    service.serpapi_limiter = TokenBucket(rate=5.0, capacity=10.0)
+    return service
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def run(args):
+    departures, arrivals = DEPARTURES[:args.size], ARRIVALS[:args.size]
+    metro_codes = (departures, arrivals)
+    date = "2026-12-01"
+
+    service = make_service(args.latency)
+    _, single = await timed(service.get_flight_offers("HND", "KIX", date))
+
+    # 入力した区間を検索済みの状態から、マトリクスを広げる
+    calls = service.flight_data_client.calls
+    (_, _, matrix), overlap = await timed(
+        service.get_offers_with_matrix("HND", "KIX", date, 0, metro_codes)
+    )
+    overlap_calls = service.flight_data_client.calls - calls
+
+    service = make_service(args.latency)
+    (_, _, matrix), cold = await timed(service.get_offers_with_matrix("HND", "KIX", date, 0, metro_codes))
+    cold_calls = service.flight_data_client.calls
+
+    _, warm = await timed(service.get_offers_with_matrix("HND", "KIX", date, 0, metro_codes))
+    warm_calls = service.flight_data_client.calls - cold_calls
+
+    cells = len(matrix)
+    print(f"single lookup:                {single * 1000:8.0f} ms")
+    print(f"{args.size}x{args.size} matrix, cold ({cells} pairs): {cold * 1000:8.0f} ms "
+          f"upstream calls={cold_calls} (sequential would be ~{single * cells * 1000:.0f} ms)")
+    print(f"{args.size}x{args.size} matrix, input leg cached: {overlap * 1000:8.0f} ms "
+          f"upstream calls={overlap_calls}")
+    print(f"{args.size}x{args.size} matrix, warm:          {warm * 1000:8.1f} ms "
+          f"upstream calls={warm_calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, choices=(2, 3), default=2)
+    parser.add_argument("--latency", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+プロンプト構築のベンチマーク
+従来の文字列連結によるユーザープロンプトと、PromptBuilder（表形式・重複除去・
+トークン予算）を、スタブと同じ形の SerpApi 応答から作ったオファーで比較する
+
+トークン数は app.clients.prompt_builder.estimate_tokens による概算。
+実際のトークン数は Grok の usage から /metrics の hrs_llm_tokens に記録される。
+
+使い方:
+    python3 scripts/bench_prompt.py [--offers 10 30 100] [--flex-days 3] [--budget 1200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date as date_type, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.clients.prompt_builder import PromptBuilder, estimate_tokens  # noqa: E402
+from app.models.schemas import DatePrice, HiddenFlightOption, RawFlightData  # noqa: E402
+from scripts.stub_upstreams import UpstreamProfile, serpapi_payload  # noqa: E402
+
+
+def make_offers(n: int, day: str) -> RawFlightData:
+    """スタブの SerpApi 応答を解析してオファーを作る（約2割は重複）"""
+    parser = FlightDataClient.__new__(FlightDataClient)
+    profile = UpstreamProfile(median_ms=0, items=10, padding_bytes=0)
+    offers = []
+    page = 0
+    while len(offers) < n:
+        # スタブの応答はルート・日付で決まるため、シードだけ変えて別のオファーにする
+        payload = serpapi_payload("HND", "CTS", f"{day}#{page}", profile)
+        offers.extend(parser._parse_serpapi_response(payload).offers)
+        page += 1
+    unique = offers[: n - n // 5]
+    return RawFlightData(source="bench", offers=unique + unique[: n - len(unique)])
+
+
+def legacy_prompt(departure, arrival, date, raw_data, price_calendar, candidates) -> str:
+    """変更前の LLMClient._build_user_prompt と同じ出力"""
+    user_prompt = f"出発地: {departure}, 目的地: {arrival}"
+    if date:
+        user_prompt += f", 日程: {date}"
+    rows = sorted({
+        (o.price, o.currency, o.airline, o.flight_number, o.departure_time, o.arrival_time)
+        for o in raw_data.offers
+    })
+    if rows:
+        user_prompt += "\n\n実データ：\n"
+        for price, currency, airline, flight_number, dep_time, arr_time in rows:
+            user_prompt += f"- {airline} ({flight_number}): {dep_time}-{arr_time}, {price} {currency}\n"
+    if price_calendar:
+        user_prompt += "\n日付別の最安値：\n"
+        for day in price_calendar:
+            price = f"{day.min_price} {day.currency}" if day.min_price is not None else "空席なし"
+            user_prompt += f"- {day.date}: {price}\n"
+    if candidates:
+        user_prompt += "\nローカル検索で見つかった候補（検証・補足してください）：\n"
+        for candidate in candidates:
+            user_prompt += f"- {candidate.route}: {candidate.price} ({candidate.save} 節約)\n"
+    return user_prompt
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, nargs="+", default=[10, 30, 100])
+    parser.add_argument("--flex-days", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=1200, help="PromptBuilder のトークン予算")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--show", action="store_true", help="最後のケースのプロンプトを表示")
+    args = parser.parse_args()
+
+    day = (date_type.today() + timedelta(days=14)).isoformat()
+    center = date_type.fromisoformat(day)
+    calendar = [
+        DatePrice(date=(center + timedelta(days=d)).isoformat(), min_price=9000 + abs(d) * 700, offer_count=10)
+        for d in range(-args.flex_days, args.flex_days + 1)
+    ]
+    candidates = [
+        HiddenFlightOption(route="HND → ITM → CTS（別切り）", price="¥12,300", save="18%"),
+        HiddenFlightOption(route="HND → CTS → MMB（Hidden City）", price="¥11,800", save="21%"),
+    ]
+    builder = PromptBuilder(token_budget=args.budget)
+
+    print(f"{'offers':>6} {'legacy chars':>12} {'legacy tok':>10} {'new chars':>9} {'new tok':>8} "
+          f"{'rows':>8} {'saved':>6} {'legacy µs':>9} {'new µs':>7}")
+    for n in args.offers:
+        raw_data = make_offers(n, day)
+        inputs = ("HND", "CTS", day, raw_data, calendar, candidates)
+        legacy = legacy_prompt(*inputs)
+        built = builder.build(*inputs)
+        legacy_tokens = estimate_tokens(legacy)
+        print(
+            f"{n:>6} {len(legacy):>12} {legacy_tokens:>10} {len(built.text):>9} {built.estimated_tokens:>8} "
+            f"{built.offers_included:>3}/{built.offers_total:<4} "
+            f"{(1 - built.estimated_tokens / legacy_tokens) * 100:>5.0f}% "
+            f"{timed(lambda: legacy_prompt(*inputs), args.repeat):>9.1f} "
+            f"{timed(lambda: builder.build(*inputs), args.repeat):>7.1f}"
+        )
+    if args.show:
+        print("\n--- legacy ---\n" + legacy + "\n--- builder ---\n" + built.text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+ローカル経路エンジンのベンチマーク
+数千〜数万区間の合成グラフで、グラフ構築と候補探索（k 最安経路 + Hidden City）の
+レイテンシを計測する
+
+使い方:
+    python3 scripts/bench_route_engine.py [--legs 2000 10000 20000] [--airports 150]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models.schemas import FlightOffer, FlightSegment  # noqa: E402
+from app.services.route_engine import RouteGraph  # noqa: E402
+
+DAY = datetime(2026, 12, 1)
+
+
+def make_offer(rng: random.Random, path: list, start: datetime, n: int) -> FlightOffer:
+    segments = []
+    t = start
+    for a, b in zip(path, path[1:]):
+        arrive = t + timedelta(minutes=rng.randint(50, 300))
+        segments.append(FlightSegment(
+            departure_airport=a, arrival_airport=b,
+            departure_time=t.strftime("%Y-%m-%d %H:%M"), arrival_time=arrive.strftime("%Y-%m-%d %H:%M"),
+            airline="XX", flight_number=f"XX{n}",
+        ))
+        t = arrive + timedelta(minutes=rng.randint(45, 180))
+    return FlightOffer(
+        airline="XX", flight_number=f"XX{n}",
+        departure_time=segments[0].departure_time, arrival_time=segments[-1].arrival_time,
+        price=float(rng.randint(40, 400) * 100 * (len(path) - 1)) * rng.uniform(0.5, 1.0),
+        currency="JPY", segments=segments,
+    )
+
+
+def generate_offers(n_legs: int, n_airports: int, seed: int = 7) -> list:
+    """1〜2区間のオファーをランダムに生成（約3割が経由便）"""
+    rng = random.Random(seed)
+    airports = [f"A{i:03d}" for i in range(n_airports)]
+    offers = []
+    for n in range(n_legs):
+        stops = 1 if rng.random() < 0.3 else 0
+        path = rng.sample(airports, 2 + stops)
+        start = DAY + timedelta(minutes=rng.randint(0, 20 * 60))
+        offers.append(make_offer(rng, path, start, n))
+    return offers, airports
+
+
+def sanity_check():
+    """既知の小さなグラフで Hidden City と別切り乗り継ぎが見つかることを確認"""
+    def offer(path, times, price, n):
+        segs = [FlightSegment(departure_airport=a, arrival_airport=b,
+                              departure_time=f"2026-12-01 {t0}", arrival_time=f"2026-12-01 {t1}",
+                              airline="NH", flight_number=n)
+                for (a, b), (t0, t1) in zip(zip(path, path[1:]), times)]
+        return FlightOffer(airline="NH", flight_number=n, departure_time=segs[0].departure_time,
+                           arrival_time=segs[-1].arrival_time, price=price, currency="JPY", segments=segs)
+
+    graph = RouteGraph()
+    graph.add_offers([
+        offer(["HND", "CTS"], [("08:00", "09:30")], 30000, "NH1"),
+        offer(["HND", "CTS", "WKJ"], [("08:00", "09:30"), ("11:00", "12:00")], 18000, "NH2"),
+        offer(["HND", "SDJ"], [("07:00", "08:00")], 8000, "NH3"),
+        offer(["SDJ", "CTS"], [("10:00", "11:10")], 9000, "NH4"),
+    ])
+    options = graph.find_candidates("HND", "CTS", "2026-12-01")
+    routes = [o.route for o in options]
+    assert len(options) == 2 and "別切り" in routes[0] and "Hidden City" in routes[1], routes
+    print("sanity: " + " | ".join(f"{o.route} {o.price} ({o.save})" for o in options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--legs", type=int, nargs="+", default=[2000, 10000, 20000])
+    parser.add_argument("--airports", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    sanity_check()
+    print(f"{'legs':>8}{'build ms':>12}{'query p50 ms':>15}{'query p95 ms':>15}{'avg options':>13}")
+    for n_legs in args.legs:
+        offers, airports = generate_offers(n_legs, args.airports)
+        graph = RouteGraph(max_legs=n_legs)
+        start = time.perf_counter()
+        graph.add_offers(offers)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(1)
+        latencies, found = [], 0
+        for _ in range(args.queries):
+            origin, destination = rng.sample(airports, 2)
+            start = time.perf_counter()
+            found += len(graph.find_candidates(origin, destination, "2026-12-01"))
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"{n_legs:>8}{build_ms:>12.1f}{statistics.median(latencies):>15.3f}"
+              f"{latencies[int(len(latencies) * 0.95)]:>15.3f}{found / args.queries:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
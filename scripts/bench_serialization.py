@@ -0,0 +1,124 @@
+"""
+シリアライズのベンチマーク
+100件のオファーを含む SerpApi 応答（スタブと同じ形）について、
+デコード + モデル構築、運賃キャッシュの復元、JSON レスポンスのエンコード、
+分析キャッシュの復元の CPU 時間を、変更前（json + 検証つきコンストラクタ）と現在の実装で比較する
+
+使い方:
+    python3 scripts/bench_serialization.py [--offers 100] [--padding-bytes 20000] [--repeat 300]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.models.schemas import FlightAnalysisResponse, FlightOffer, FlightSegment, RawFlightData  # noqa: E402
+from app.serialization import FastJSONResponse, dumps, loads, orjson  # noqa: E402
+from app.services.fare_cache import OFFER_FIELDS, SEGMENT_FIELDS, decode_raw_data, encode_raw_data  # noqa: E402
+from scripts.stub_upstreams import UpstreamProfile, serpapi_payload  # noqa: E402
+
+
+def legacy_parse(data: dict, limit: int) -> RawFlightData:
+    """変更前の FlightDataClient._parse_serpapi_response と同じ処理"""
+    offers = []
+    raw_flights = data.get("best_flights", []) + data.get("other_flights", [])
+    for flight in raw_flights[:limit]:
+        segments = flight.get("flights", [])
+        if not segments:
+            continue
+        first_seg = segments[0]
+        last_seg = segments[-1]
+        offers.append(FlightOffer(
+            airline=first_seg.get("airline", "Unknown"),
+            flight_number=first_seg.get("flight_number", "N/A"),
+            departure_time=first_seg.get("departure_airport", {}).get("time", ""),
+            arrival_time=last_seg.get("arrival_airport", {}).get("time", ""),
+            price=float(flight.get("price", 0)),
+            currency="JPY",
+            booking_link=data.get("search_metadata", {}).get("google_flights_url"),
+            segments=[
+                FlightSegment(
+                    departure_airport=seg.get("departure_airport", {}).get("id", ""),
+                    arrival_airport=seg.get("arrival_airport", {}).get("id", ""),
+                    departure_time=seg.get("departure_airport", {}).get("time", ""),
+                    arrival_time=seg.get("arrival_airport", {}).get("time", ""),
+                    airline=seg.get("airline", ""),
+                    flight_number=seg.get("flight_number", "")
+                )
+                for seg in segments
+            ]
+        ))
+    return RawFlightData(source="SerpApi (Google Flights)", offers=offers, fetched_at=time.time())
+
+
+def legacy_decode(blob: bytes) -> RawFlightData:
+    """変更前の fare_cache.decode_raw_data と同じ処理"""
+    _, source, rows = json.loads(blob)
+    return RawFlightData(
+        source=source,
+        offers=[
+            FlightOffer(
+                **dict(zip(OFFER_FIELDS, row)),
+                segments=[FlightSegment(**dict(zip(SEGMENT_FIELDS, seg))) for seg in row[-1]]
+            )
+            for row in rows
+        ],
+    )
+
+
+def timed(fn, repeat: int) -> float:
+    """中央値（マイクロ秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=100, help="応答に含めるオファー数")
+    parser.add_argument("--padding-bytes", type=int, default=20000, help="price_insights などの付随データ（バイト）")
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    profile = UpstreamProfile(median_ms=0, items=args.offers, padding_bytes=args.padding_bytes)
+    body = json.dumps(serpapi_payload("HND", "CTS", "2026-11-01", profile), ensure_ascii=False).encode("utf-8")
+    client = FlightDataClient.__new__(FlightDataClient)
+
+    legacy = legacy_parse(json.loads(body), args.offers)
+    current = client._parse_serpapi_response(loads(body), args.offers)
+    # 検証を省いても同じモデルになることを確認
+    assert legacy.model_dump(exclude={"fetched_at"}) == current.model_dump(exclude={"fetched_at"})
+    blob = encode_raw_data(current)
+    assert decode_raw_data(blob).model_dump() == legacy_decode(blob).model_dump()
+    response = FlightAnalysisResponse(route="HND → CTS", avoid_tips="", raw_data=current).model_dump()
+    fast_response = FastJSONResponse(content=None)
+    analysis = dumps({"hidden_options": [{"route": "HND → ITM → CTS", "price": "¥12,300", "save": "18%",
+                                          "tips": "別切り" * 40}] * 5, "avoid_tips": "シークレットモード" * 20})
+
+    print(f"SerpApi body: {len(body) / 1024:.1f} KiB, {len(current.offers)} offers, "
+          f"orjson={'yes' if orjson is not None else 'no (json fallback)'}")
+    cases = [
+        ("upstream decode+build", lambda: legacy_parse(json.loads(body), args.offers),
+         lambda: client._parse_serpapi_response(loads(body), args.offers)),
+        ("fare cache decode", lambda: legacy_decode(blob), lambda: decode_raw_data(blob)),
+        ("response encode", lambda: json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+         lambda: fast_response.render(response)),
+        ("analysis cache decode", lambda: json.loads(analysis), lambda: loads(analysis)),
+    ]
+    print(f"{'case':<24} {'before µs':>10} {'after µs':>10} {'speedup':>8}")
+    for name, before, after in cases:
+        t_before = timed(before, args.repeat)
+        t_after = timed(after, args.repeat)
+        print(f"{name:<24} {t_before:>10.1f} {t_after:>10.1f} {t_before / t_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+リクエスト合流（シングルフライト）の検証スクリプト
+同一ルートへの N 件の同時 analyze_route が、段階ごとに上流呼び出し1回で済むことを確認する
+
+使い方:
+    python3 scripts/bench_single_flight.py [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.clients.llm_client import LLMClient  # noqa: E402
+from app.services.fare_cache import FareCache  # noqa: E402
+from app.services.cache import MemoryCacheBackend  # noqa: E402
+from app.services.flight_analyzer import FlightAnalyzerService  # noqa: E402
+
+
+class SlowFlightDataClient(FlightDataClient):
+    """上流呼び出し回数を数える SerpApi スタブ"""
+
+    def __init__(self, latency: float, fail: bool = False):
+        super().__init__()
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("upstream failure")
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+class SlowLLMClient(LLMClient):
+    """上流呼び出し回数を数える Grok スタブ"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    async def analyze_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._mock_analysis(f"{departure} → {arrival}")
+
+
+def make_service(fail: bool = False):
+    flight = SlowFlightDataClient(latency=0.2, fail=fail)
+    llm = SlowLLMClient(latency=0.5)
+    service = FlightAnalyzerService(
+        llm_client=llm,
+        flight_data_client=flight,
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=100)),
+    )
+    return service, flight, llm
+
+
+async def run(n: int):
+    failures = []
+
+    # 1. 同時リクエストが1回の上流呼び出しにまとまる
+    service, flight, llm = make_service()
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        service.analyze_route("HND", "CTS", "2026-03-01") for _ in range(n)
+    ])
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{n} concurrent requests: fare calls={flight.calls} llm calls={llm.calls} "
+          f"wall={elapsed:.0f} ms results={len(results)}")
+    if (flight.calls, llm.calls) != (1, 1):
+        failures.append("expected exactly one upstream call per stage")
+
+    # 2. 上流の例外は全ての待機者に伝わる
+    service, flight, _ = make_service(fail=True)
+    outcomes = await asyncio.gather(*[
+        service.analyze_route("HND", "OKA", "2026-03-01") for _ in range(n)
+    ], return_exceptions=True)
+    errors = sum(isinstance(o, RuntimeError) for o in outcomes)
+    print(f"upstream error: fare calls={flight.calls} waiters with error={errors}/{n}")
+    if flight.calls != 1 or errors != n:
+        failures.append("errors were not propagated to every waiter")
+
+    # 3. 一部の待機者のキャンセルは他に影響せず、全員のキャンセルで上流も止まる
+    service, flight, llm = make_service()
+    tasks = [asyncio.create_task(service.analyze_route("HND", "FUK", None)) for _ in range(n)]
+    await asyncio.sleep(0.05)
+    for t in tasks[: n // 2]:
+        t.cancel()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    cancelled = sum(isinstance(o, asyncio.CancelledError) for o in outcomes)
+    print(f"partial cancel: cancelled={cancelled} completed={n - cancelled} fare calls={flight.calls}")
+    if cancelled != n // 2 or flight.calls != 1:
+        failures.append("partial cancellation affected other waiters")
+
+    tasks = [asyncio.create_task(service.analyze_route("HND", "KIX", None)) for _ in range(n)]
+    await asyncio.sleep(0.05)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"full cancel: in-flight fare keys={service.fare_flights.in_flight()}")
+    if service.fare_flights.in_flight():
+        failures.append("upstream call was not cancelled after every waiter left")
+
+    if failures:
+        for f in failures:
+            print(f"FAIL: {f}")
+        sys.exit(1)
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+/analyze の最初の有意な表示までの時間（TTFB）計測
+上流（SerpApi / Grok）をレイテンシ付きのスタブに差し替えた実アプリを uvicorn で起動し、
+従来のブロッキング応答とストリーミングモードを比較する
+
+使い方:
+    python3 scripts/bench_ttfb.py [--fare-latency 0.8] [--llm-latency 4.0] [--runs 3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from app.main import app  # noqa: E402
+from app.clients.flight_data_client import FlightDataClient  # noqa: E402
+from app.clients.llm_client import LLMClient  # noqa: E402
+from app.services.flight_analyzer import FlightAnalyzerService  # noqa: E402
+
+
+class StubFlightDataClient(FlightDataClient):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        await asyncio.sleep(self.latency)
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+class StubLLMClient(LLMClient):
+    """全体で latency 秒かかり、ストリーミング時はオプションを等間隔で出す"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    async def analyze_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        await asyncio.sleep(self.latency)
+        return self._mock_analysis(f"{departure} → {arrival}")
+
+    async def stream_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        result = self._mock_analysis(f"{departure} → {arrival}")
+        # 推論の思考時間（最初のトークンまで）+ 出力時間
+        await asyncio.sleep(self.latency * 0.4)
+        step = self.latency * 0.6 / len(result["hidden_options"])
+        for option in result["hidden_options"]:
+            await asyncio.sleep(step)
+            yield "option", option
+        yield "result", result
+
+
+async def run(args):
+    app.state.flight_service = FlightAnalyzerService(
+        llm_client=StubLLMClient(args.llm_latency),
+        flight_data_client=StubFlightDataClient(args.fare_latency),
+    )
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    blocking, stream_paint, stream_first_option, stream_done = [], [], [], []
+    async with httpx.AsyncClient(base_url=base, timeout=60.0) as client:
+        for run_id in range(args.runs):
+            # 日付を変えて運賃キャッシュのヒットを避ける
+            date = f"2026-04-{run_id + 1:02d}"
+            form = {"departure": "HND", "arrival": "CTS", "date": date}
+
+            start = time.perf_counter()
+            await client.post("/analyze", data=form)
+            blocking.append(time.perf_counter() - start)
+
+            date = f"2026-05-{run_id + 1:02d}"
+            form = {"departure": "HND", "arrival": "CTS", "date": date, "stream": "1"}
+            start = time.perf_counter()
+            await client.post("/analyze", data=form)
+            stream_paint.append(time.perf_counter() - start)
+            first = None
+            async with client.stream(
+                "GET", "/analyze/stream", params={"departure": "HND", "arrival": "CTS", "date": date}
+            ) as response:
+                async for line in response.aiter_lines():
+                    if first is None and line == "event: option":
+                        first = time.perf_counter() - start
+            stream_first_option.append(first)
+            stream_done.append(time.perf_counter() - start)
+
+    server.should_exit = True
+    await serve
+
+    def ms(values):
+        return f"{statistics.median(values) * 1000:8.0f} ms"
+
+    print(f"upstream latency: fare={args.fare_latency}s llm={args.llm_latency}s runs={args.runs}")
+    print(f"blocking  /analyze  first paint (offers + analysis): {ms(blocking)}")
+    print(f"streaming /analyze  first paint (offers):            {ms(stream_paint)}")
+    print(f"streaming first AI option over SSE:                  {ms(stream_first_option)}")
+    print(f"streaming analysis complete:                         {ms(stream_done)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fare-latency", type=float, default=0.8)
+    parser.add_argument("--llm-latency", type=float, default=4.0)
+    parser.add_argument("--runs", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+デプロイ前のビルドステップ
+コールドスタートで行っていた処理を事前に済ませ、app/build/ に書き出す
+
+- 空港検索インデックス → app/build/airports.bin（marshal 形式）
+- Jinja2 テンプレート   → app/build/templates/（Python モジュール + manifest.json）
+
+成果物には元データのハッシュを記録しており、元データが更新されていれば
+実行時は成果物を使わずに従来どおり構築する。
+
+Vercel の Python ランタイムにはビルドステップがないため、成果物はリポジトリに含める。
+空港データやテンプレートを変更したら再実行してコミットすること（--check は
+成果物が古ければ終了コード 1 を返すので、CI やコミット前のチェックに使う）。
+
+使い方:
+    python3 scripts/build_assets.py [--check]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.dependencies import AIRPORTS_BLOB, AIRPORTS_FILE  # noqa: E402
+from app.services.airport_index import AirportIndex  # noqa: E402
+from app.templating import (  # noqa: E402
+    BUILD_DIR, COMPILED_TEMPLATES_DIR, compile_templates, compiled_templates_are_fresh
+)
+
+
+def check() -> int:
+    """成果物が現在の元データ・テンプレートと一致するか確認する"""
+    stale = []
+    if not AirportIndex.blob_is_fresh(AIRPORTS_BLOB, AIRPORTS_FILE):
+        stale.append(os.path.relpath(AIRPORTS_BLOB))
+    if not compiled_templates_are_fresh():
+        stale.append(os.path.relpath(COMPILED_TEMPLATES_DIR) + "/")
+    for path in stale:
+        print(f"stale: {path} (run python3 scripts/build_assets.py and commit app/build/)")
+    if not stale:
+        print("app/build/ is up to date")
+    return 1 if stale else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="成果物が古ければ終了コード 1 を返す（書き出さない）")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(check())
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+
+    start = time.perf_counter()
+    index = AirportIndex.from_file(AIRPORTS_FILE)
+    index.dump_blob(AIRPORTS_BLOB, AIRPORTS_FILE)
+    print(f"airports:  {len(index)} entries -> {os.path.relpath(AIRPORTS_BLOB)} "
+          f"({os.path.getsize(AIRPORTS_BLOB):,} bytes, {(time.perf_counter() - start) * 1000:.1f} ms)")
+
+    start = time.perf_counter()
+    count = compile_templates()
+    print(f"templates: {count} files -> {os.path.relpath(COMPILED_TEMPLATES_DIR)}/ "
+          f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
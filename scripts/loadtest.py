@@ -0,0 +1,475 @@
+"""
+ローカル負荷試験
+SerpApi / Grok のスタブサーバー（scripts/stub_upstreams.py）と実アプリ（uvicorn）を
+シナリオごとに別プロセスで起動し、並行クライアントで負荷をかけて
+p50/p95/p99 レイテンシ・スループット・上流の呼び出し回数を計測する。
+rate を指定したシナリオは応答を待たずに一定の到着率で送り続ける（オープンループ）。
+アドミッション制御で断られた応答（Retry-After つき）は shed として数え、
+受け付けられたリクエストだけのレイテンシも別に集計する。
+
+結果は JSON で保存し、--compare で以前の結果（別コミット）との差分を表示できる。
+
+使い方:
+    python3 scripts/loadtest.py [--scenario analyze-cold] [--requests 100] [--concurrency 16]
+    python3 scripts/loadtest.py --scenario analyze-overload --scenario analyze-overload-open
+    python3 scripts/loadtest.py --output after.json --compare before.json
+    python3 scripts/loadtest.py --list
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date as date_type, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+from scripts.stub_upstreams import (  # noqa: E402
+    StubConfig, UpstreamProfile, add_profile_arguments, apply_profile_arguments,
+)
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+AIRPORTS_FILE = os.path.join(ROOT, "app", "data", "airports.json")
+
+# (method, path, httpx のキーワード引数)
+RequestSpec = Tuple[str, str, dict]
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    requests: int
+    concurrency: int
+    build_request: Callable[[int], RequestSpec]
+    stub: Callable[[], StubConfig] = StubConfig
+    app_env: Dict[str, str] = field(default_factory=dict)
+    # 到着率（件/秒）。0 なら concurrency 本のワーカーで応答を待ちながら送る
+    rate: float = 0.0
+
+
+def _load_codes() -> List[str]:
+    with open(AIRPORTS_FILE, "r", encoding="utf-8") as f:
+        return [airport["code"] for airport in json.load(f)]
+
+
+CODES = _load_codes()
+SEARCH_QUERIES = ("東京", "大阪", "HN", "NR", "札幌", "KIX", "福岡", "那覇", "O", "C", "名古屋", "空港")
+HOT_ROUTES = (("HND", "CTS"), ("HND", "FUK"), ("NRT", "OKA"), ("KIX", "HND"))
+# 送信元 IP（X-Forwarded-For）。アプリはクライアントごとにレート制限する
+CLIENT_IPS = tuple(f"198.51.100.{n}" for n in range(1, 101))
+NOISY_CLIENT_IP = "203.0.113.7"
+
+
+def _route(i: int) -> Tuple[str, str]:
+    departure = CODES[i % len(CODES)]
+    arrival = CODES[(i * 7 + 3) % len(CODES)]
+    if arrival == departure:
+        arrival = CODES[(i + 1) % len(CODES)]
+    return departure, arrival
+
+
+def _date(i: int) -> str:
+    return (date_type.today() + timedelta(days=14 + i % 150)).isoformat()
+
+
+def search_request(i: int) -> RequestSpec:
+    return "GET", "/search-airports", {"params": {"q": SEARCH_QUERIES[i % len(SEARCH_QUERIES)]}}
+
+
+def analyze_cold_request(i: int) -> RequestSpec:
+    """ルートと日付を変えて、キャッシュに当たらない検索を作る"""
+    departure, arrival = _route(i)
+    return "POST", "/analyze", {"data": {"departure": departure, "arrival": arrival, "date": _date(i)}}
+
+
+def analyze_hot_request(i: int) -> RequestSpec:
+    """少数の人気ルートに集中する検索（キャッシュとシングルフライトが効く）"""
+    departure, arrival = HOT_ROUTES[i % len(HOT_ROUTES)]
+    return "POST", "/analyze", {"data": {"departure": departure, "arrival": arrival, "date": _date(0)}}
+
+
+def analyze_stream_request(i: int) -> RequestSpec:
+    """ストリーミングモードの最初の表示（実データのみ）"""
+    departure, arrival = _route(i)
+    return "POST", "/analyze", {
+        "data": {"departure": departure, "arrival": arrival, "date": _date(i), "stream": "1"}
+    }
+
+
+def analyze_overload_request(i: int) -> RequestSpec:
+    """多数のクライアントからの検索に、1つのクライアントの連打（2割）が混ざる"""
+    method, path, kwargs = analyze_cold_request(i)
+    client_ip = NOISY_CLIENT_IP if i % 5 == 0 else CLIENT_IPS[i % len(CLIENT_IPS)]
+    return method, path, dict(kwargs, headers={"X-Forwarded-For": client_ip})
+
+
+def flaky_stub() -> StubConfig:
+    return StubConfig(
+        serpapi=UpstreamProfile(median_ms=800, sigma=1.0, error_rate=0.1, items=12, padding_bytes=20000),
+        grok=UpstreamProfile(median_ms=4000, sigma=0.8, error_rate=0.1, items=3),
+    )
+
+
+def slow_llm_stub() -> StubConfig:
+    """Grok が締め切り（REQUEST_BUDGET_SECONDS）より遅い"""
+    return StubConfig(grok=UpstreamProfile(median_ms=12000, sigma=0.2, items=3))
+
+
+def overload_stub() -> StubConfig:
+    """1件あたり約 2 秒。SerpApi のクォータ（5 件/秒）と処理枠 10 件で約 5 件/秒が上限"""
+    return StubConfig(
+        serpapi=UpstreamProfile(median_ms=300, items=12, padding_bytes=20000),
+        grok=UpstreamProfile(median_ms=1500, sigma=0.3, items=3),
+    )
+
+
+# 処理能力（約 5 件/秒）の 5 倍の到着率
+OVERLOAD_RATE = 25.0
+ADMISSION_ENV = {
+    "ADMISSION_MAX_IN_FLIGHT": "10",
+    "ADMISSION_MAX_QUEUE": "10",
+    "ADMISSION_QUEUE_TIMEOUT": "1",
+}
+
+# ヘッジとサーキットブレーカーを有効にした設定
+RESILIENCE_ENV = {
+    "SERPAPI_HEDGE_PERCENTILE": "90",
+    "GROK_HEDGE_PERCENTILE": "90",
+    "SERPAPI_BREAKER_FAILURES": "5",
+    "GROK_BREAKER_FAILURES": "5",
+}
+
+
+SCENARIOS: Dict[str, Scenario] = {s.name: s for s in (
+    Scenario("search-airports", "空港オートコンプリート（上流なし）", 2000, 32, search_request),
+    Scenario("analyze-cold", "毎回異なるルート・日付の /analyze", 120, 16, analyze_cold_request),
+    Scenario("analyze-hot", "人気ルートに集中する /analyze", 200, 32, analyze_hot_request),
+    Scenario("analyze-stream", "ストリーミングモードの最初の表示", 120, 16, analyze_stream_request),
+    Scenario("analyze-flaky", "上流のエラー率 10%・裾の重いレイテンシ", 120, 16, analyze_cold_request, stub=flaky_stub),
+    Scenario("analyze-hedged", "analyze-flaky にヘッジとサーキットブレーカーを適用", 120, 16,
+             analyze_cold_request, stub=flaky_stub, app_env=RESILIENCE_ENV),
+    Scenario("analyze-deadline", "Grok が締め切り（8 秒）より遅い場合の縮退応答", 40, 8,
+             analyze_cold_request, stub=slow_llm_stub, app_env={"REQUEST_BUDGET_SECONDS": "8"}),
+    Scenario("analyze-overload", "処理能力の 5 倍の到着率（アドミッション制御あり）", 400, 0,
+             analyze_overload_request, stub=overload_stub, app_env=ADMISSION_ENV, rate=OVERLOAD_RATE),
+    Scenario("analyze-overload-open", "analyze-overload と同じ負荷をアドミッション制御なしで受ける", 400, 0,
+             analyze_overload_request, stub=overload_stub,
+             app_env={"ADMISSION_MAX_IN_FLIGHT": "0", "ANALYZE_CLIENT_RATE_PER_SEC": "0"},
+             rate=OVERLOAD_RATE),
+)}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """最近順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-p / 100 * len(sorted_values) // 1)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(config: StubConfig) -> Tuple[subprocess.Popen, str]:
+    config_json = json.dumps({
+        "serpapi": asdict(config.serpapi), "grok": asdict(config.grok), "seed": config.seed,
+    })
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "scripts", "stub_upstreams.py"),
+         "--port", "0", "--config-json", config_json],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = proc.stdout.readline()
+    if not line:
+        proc.kill()
+        raise RuntimeError("stub server failed to start")
+    return proc, json.loads(line)["base_url"]
+
+
+def start_app(stub_url: str, workdir: str, extra_env: Dict[str, str], log_path: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "SERPAPI_API_KEY": "loadtest",
+        "GROK_API_KEY": "xai-loadtest-key-0000000000000000",
+        "OPENAI_API_KEY": "",
+        "SERPAPI_BASE_URL": f"{stub_url}/search",
+        "GROK_BASE_URL": f"{stub_url}/v1/chat/completions",
+        "FARE_CACHE_BACKEND": "memory",
+        "ANALYSIS_CACHE_BACKEND": "memory",
+        "FARE_HISTORY_DIR": os.path.join(workdir, "fare_history"),
+        # 負荷生成側がプロキシとして X-Forwarded-For で送信元を振り分ける
+        "ADMISSION_TRUST_PROXY": "true",
+    })
+    env.update(extra_env)
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError("app exited during startup")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("app did not become ready")
+
+
+async def generate_load(base_url: str, scenario: Scenario, requests: int, concurrency: int, rate: float = 0.0) -> dict:
+    """
+    requests 件を送り、レイテンシと結果を集計する
+
+    rate > 0 なら rate 件/秒の一定間隔で送り出す（応答の遅れが送信を遅らせない）。
+    そうでなければ concurrency 本のワーカーで応答を待ちながら送る。
+    """
+    latencies: List[float] = []
+    admitted: List[float] = []
+    statuses: Dict[str, int] = {}
+    app_errors = 0
+    shed = 0
+    next_index = 0
+
+    async def send(client: httpx.AsyncClient, i: int) -> None:
+        nonlocal app_errors, shed
+        method, path, kwargs = scenario.build_request(i)
+        # クライアントごとのレート制限に掛からないよう、送信元を散らす
+        kwargs.setdefault("headers", {"X-Forwarded-For": CLIENT_IPS[i % len(CLIENT_IPS)]})
+        start = time.perf_counter()
+        rejected = False
+        try:
+            response = await client.request(method, path, **kwargs)
+            key = str(response.status_code)
+            # アドミッション制御で断られた応答は Retry-After を持つ
+            rejected = "retry-after" in response.headers
+            # /analyze はエラー時もパーシャルを 200 で返す
+            if 'class="error"' in response.text:
+                app_errors += 1
+        except httpx.HTTPError as e:
+            key = type(e).__name__
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        if rejected:
+            shed += 1
+        else:
+            admitted.append(elapsed)
+        statuses[key] = statuses.get(key, 0) + 1
+
+    connections = max(concurrency, 1) if not rate else requests
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < requests:
+                i = next_index
+                next_index += 1
+                await send(client, i)
+
+        start = time.perf_counter()
+        if rate:
+            tasks = []
+            for i in range(requests):
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(send(client, i)))
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    def summarize(samples: List[float]) -> Dict[str, float]:
+        ordered = sorted(samples)
+        return {
+            name: round(value * 1000, 2) for name, value in (
+                ("p50", percentile(ordered, 50)),
+                ("p95", percentile(ordered, 95)),
+                ("p99", percentile(ordered, 99)),
+                ("max", ordered[-1] if ordered else 0.0),
+                ("mean", sum(ordered) / len(ordered) if ordered else 0.0),
+            )
+        }
+
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "rate": rate,
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "admitted_latency_ms": summarize(admitted),
+        "shed": shed,
+        "status": statuses,
+        "app_errors": app_errors,
+    }
+
+
+# /metrics から結果に含める系列（締め切り・縮退・ヘッジ・ブレーカー）
+RESILIENCE_METRICS = (
+    "hrs_deadline_exceeded_total", "hrs_degraded_responses_total",
+    "hrs_upstream_hedges_total", "hrs_circuit_breaker_state", "hrs_admission_decisions_total",
+)
+
+
+def resilience_metrics(text: str) -> Dict[str, float]:
+    """Prometheus テキスト形式から RESILIENCE_METRICS の系列を取り出す"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith(RESILIENCE_METRICS):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+async def run_scenario(scenario: Scenario, args: argparse.Namespace) -> dict:
+    stub_config = apply_profile_arguments(scenario.stub(), args)
+    requests = args.requests or scenario.requests
+    concurrency = args.concurrency or scenario.concurrency
+    rate = scenario.rate if args.rate is None else args.rate
+    extra_env = dict(scenario.app_env)
+    extra_env.update(item.split("=", 1) for item in args.env)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, "app.log")
+        stub_proc, stub_url = start_stub(stub_config)
+        app_proc = None
+        try:
+            app_proc, base_url = start_app(stub_url, workdir, extra_env, log_path)
+            await wait_ready(base_url, app_proc)
+            result = await generate_load(base_url, scenario, requests, concurrency, rate)
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                result["upstream"] = (await client.get(f"{stub_url}/__stats")).json()
+                metrics = (await client.get(f"{base_url}/metrics")).text
+                result["resilience"] = resilience_metrics(metrics)
+        except Exception:
+            if os.path.exists(log_path):
+                with open(log_path) as f:
+                    sys.stderr.write(f.read()[-4000:])
+            raise
+        finally:
+            for proc in (app_proc, stub_proc):
+                if proc is not None:
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+
+    result["description"] = scenario.description
+    result["stub"] = {"serpapi": asdict(stub_config.serpapi), "grok": asdict(stub_config.grok)}
+    result["app_env"] = extra_env
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name: str, result: dict) -> None:
+    latency = result["latency_ms"]
+    upstream = result["upstream"]
+    print(
+        f"{name:<16} {result['requests']:>6} {result['rps']:>8.1f} "
+        f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} "
+        f"{upstream['serpapi']['calls']:>8} {upstream['grok']['calls']:>6} "
+        f"{upstream['serpapi']['errors'] + upstream['grok']['errors']:>7} "
+        f"{sum(v for k, v in result['status'].items() if k != '200') + result['app_errors']:>6}"
+    )
+    if result.get("shed") or result.get("rate"):
+        admitted = result["admitted_latency_ms"]
+        print(f"  offered {result['rate']:g} req/s, shed {result['shed']}, admitted "
+              f"p50={admitted['p50']:.1f} p95={admitted['p95']:.1f} p99={admitted['p99']:.1f} ms")
+    for series, value in result.get("resilience", {}).items():
+        print(f"  {series} {value:g}")
+
+
+def print_comparison(current: dict, baseline: dict) -> None:
+    print(f"\ncompared with {baseline.get('revision') or 'baseline'}:")
+    print(f"{'scenario':<16} {'metric':<8} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        rows = [("rps", before["rps"], result["rps"])]
+        rows += [(p, before["latency_ms"][p], result["latency_ms"][p]) for p in ("p50", "p95", "p99")]
+        for key in ("serpapi", "grok"):
+            rows.append((key, before["upstream"][key]["calls"], result["upstream"][key]["calls"]))
+        for metric, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{name:<16} {metric:<8} {old:>10.1f} {new:>10.1f} {change:>8}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    names = args.scenario or list(SCENARIOS)
+    summary = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "scenarios": {},
+    }
+    print(f"{'scenario':<16} {'reqs':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'serpapi':>8} {'grok':>6} {'up err':>7} {'errors':>6}")
+    for name in names:
+        result = await run_scenario(SCENARIOS[name], args)
+        summary["scenarios"][name] = result
+        print_result(name, result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(summary, json.load(f))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="実行するシナリオ（複数指定可）")
+    parser.add_argument("--list", action="store_true", help="シナリオの一覧を表示")
+    parser.add_argument("--requests", type=int, help="シナリオの既定リクエスト数を上書き")
+    parser.add_argument("--concurrency", type=int, help="シナリオの既定並行数を上書き")
+    parser.add_argument("--rate", type=float, help="到着率（件/秒）を上書き（0 で並行数ベース）")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="アプリに渡す環境変数")
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--compare", metavar="JSON", help="比較対象の結果ファイル")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS.values():
+            load = f"@{scenario.rate:g}/s" if scenario.rate else f"x{scenario.concurrency}"
+            print(f"{scenario.name:<21} {scenario.requests:>5} reqs {load:<6} {scenario.description}")
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+人気ルートの事前取得（cron 用）
+アプリが書き出した人気度のスナップショット（POPULARITY_DIR）を合算し、
+上位ルートの運賃と LLM 分析を期限切れ前に取得し直す
+
+アプリと同じキャッシュを温めるには、両方で FARE_CACHE_BACKEND=sqlite /
+ANALYSIS_CACHE_BACKEND=sqlite と同じ *_CACHE_PATH を使うこと
+（メモリキャッシュではこのプロセスの中だけで終わる）。
+uvicorn で常駐させる場合は PREFETCH_ENABLED=true でアプリ内から同じ処理を実行できる。
+
+使い方:
+    python3 scripts/prefetch.py [--top 20] [--max-fare-calls 10] [--max-llm-calls 3]
+    python3 scripts/prefetch.py --route HND-CTS --route NRT-OKA:2026-12-01
+    python3 scripts/prefetch.py --loop    # PREFETCH_INTERVAL 秒ごとに繰り返す
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.http_pool import HttpClients  # noqa: E402
+from app.dependencies import create_flight_service  # noqa: E402
+from app.services.cache import MemoryCacheBackend  # noqa: E402
+from app.services.popularity import RouteKey  # noqa: E402
+from app.services.prefetch import PrefetchConfig, PrefetchReport, RouteRefresher  # noqa: E402
+
+
+def parse_route(value: str) -> RouteKey:
+    """'HND-CTS' または 'HND-CTS:2026-12-01'"""
+    route, _, day = value.partition(":")
+    departure, sep, arrival = route.partition("-")
+    if not sep or not departure or not arrival:
+        raise argparse.ArgumentTypeError(f"invalid route: {value} (expected DEP-ARR[:YYYY-MM-DD])")
+    return departure.strip().upper(), arrival.strip().upper(), day.strip()
+
+
+def print_report(report: PrefetchReport) -> None:
+    for route, outcome in report.details:
+        print(f"  {route:<36} {outcome}")
+    print(
+        f"routes={report.routes} fares={report.fares_refreshed} analyses={report.analyses_refreshed} "
+        f"fresh={report.fresh} skipped_budget={report.skipped_budget} errors={report.errors} "
+        f"elapsed={report.elapsed:.1f}s"
+    )
+
+
+async def run(args: argparse.Namespace, extra: Tuple[RouteKey, ...]) -> int:
+    config = PrefetchConfig.from_env()
+    for name in ("top_n", "max_fare_calls", "max_llm_calls", "min_count", "refresh_after"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(config, name, value)
+
+    http_clients = HttpClients()
+    service = create_flight_service(http_clients)
+    try:
+        if isinstance(service.fare_cache.backend, MemoryCacheBackend):
+            print("warning: FARE_CACHE_BACKEND=memory; refreshed fares are not shared with the app")
+        loaded = service.popularity.load_snapshots(max_age=args.max_age)
+        print(f"popularity snapshots: {loaded} ({service.popularity.directory})")
+        refresher = RouteRefresher(service, config)
+        while True:
+            report = await refresher.run_once(extra)
+            print_report(report)
+            if not args.loop:
+                return 1 if report.errors and not (report.fares_refreshed or report.analyses_refreshed) else 0
+            await asyncio.sleep(config.interval)
+            service.popularity.sketch.clear()
+            service.popularity.load_snapshots(max_age=args.max_age)
+    finally:
+        await http_clients.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--route", action="append", type=parse_route, default=[],
+                        help="人気度に関係なく更新するルート（DEP-ARR[:YYYY-MM-DD]、複数指定可）")
+    parser.add_argument("--top", dest="top_n", type=int, help="人気上位の何件を対象にするか")
+    parser.add_argument("--min-count", type=float, help="対象にする推定検索数の下限")
+    parser.add_argument("--refresh-after", type=float, help="TTL のこの割合を過ぎたら取得し直す（0〜1）")
+    parser.add_argument("--max-fare-calls", type=int, help="1回の巡回で SerpApi を呼ぶ上限")
+    parser.add_argument("--max-llm-calls", type=int, help="1回の巡回で Grok を呼ぶ上限")
+    parser.add_argument("--max-age", type=float, default=86400.0, help="これより古いスナップショットは無視（秒）")
+    parser.add_argument("--loop", action="store_true", help="PREFETCH_INTERVAL 秒ごとに繰り返す")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args, tuple(args.route))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+SerpApi / Grok のローカル代替サーバー
+実ネットワーク越しに応答する HTTP/1.1 スタブで、レイテンシ分布・エラー率・
+ペイロードサイズを指定できる。負荷試験（scripts/loadtest.py）から起動するほか、
+単体で起動して手動の動作確認にも使える。
+
+- GET  /search                 SerpApi (Google Flights) 形式の JSON
+- POST /v1/chat/completions    Grok (OpenAI 互換) 形式。"stream": true なら SSE
+- GET  /__stats                上流ごとの呼び出し回数・注入したエラー数・送信バイト数
+- POST /__reset                統計のリセット
+
+レイテンシは対数正規分布（中央値 median_ms、形状 sigma）に従う。
+
+使い方:
+    python3 scripts/stub_upstreams.py [--port 9100] [--serpapi-latency-ms 800] [--grok-latency-ms 4000]
+    SERPAPI_BASE_URL=http://127.0.0.1:9100/search GROK_BASE_URL=http://127.0.0.1:9100/v1/chat/completions \\
+        SERPAPI_API_KEY=stub GROK_API_KEY=xai-stub-key-for-local-testing python3 scripts/run.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# 経由便の乗り継ぎ地の候補
+HUBS = ("HND", "ITM", "FUK", "CTS", "NGO", "OKA", "ICN", "TPE")
+AIRLINES = (("Peach", "MM"), ("Jetstar Japan", "GK"), ("Skymark", "BC"), ("ANA", "NH"), ("JAL", "JL"))
+
+
+@dataclass
+class UpstreamProfile:
+    """1つの上流サービスの振る舞い"""
+    median_ms: float
+    sigma: float = 0.4
+    error_rate: float = 0.0
+    # SerpApi: 返すフライト件数 / Grok: 返す hidden_options の件数
+    items: int = 10
+    # 実 API の付加情報を模したパディング（バイト）
+    padding_bytes: int = 0
+
+    def sample_delay(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms / 1000 * math.exp(rng.gauss(0.0, self.sigma))
+
+
+@dataclass
+class UpstreamStats:
+    calls: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+
+@dataclass
+class StubConfig:
+    serpapi: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(median_ms=800, items=12, padding_bytes=20000))
+    grok: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(median_ms=4000, items=3))
+    seed: int = 0
+
+
+def _route_rng(*parts: str) -> random.Random:
+    """同じ検索条件には同じ運賃を返す（キャッシュ比較のため決定的にする）"""
+    digest = hashlib.sha256(":".join(parts).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def serpapi_payload(departure: str, arrival: str, date: str, profile: UpstreamProfile) -> dict:
+    rng = _route_rng(departure, arrival, date)
+    try:
+        day = datetime.fromisoformat(date)
+    except ValueError:
+        day = datetime(2026, 3, 1)
+    flights = []
+    for i in range(profile.items):
+        airline, prefix = rng.choice(AIRLINES)
+        start = day + timedelta(minutes=rng.randrange(6 * 60, 21 * 60, 5))
+        hubs = [hub for hub in HUBS if hub not in (departure, arrival)]
+        # 4件に1件は到着地を経由して先へ飛ぶ便（Hidden City の候補）、残りの一部は経由便
+        if i % 4 == 3 and hubs:
+            route = [(departure, arrival), (arrival, rng.choice(hubs))]
+        elif i % 3 == 2 and hubs:
+            stop = rng.choice(hubs)
+            route = [(departure, stop), (stop, arrival)]
+        else:
+            route = [(departure, arrival)]
+        segments = []
+        t = start
+        for origin, destination in route:
+            arrive = t + timedelta(minutes=rng.randrange(60, 180, 5))
+            segments.append({
+                "departure_airport": {"id": origin, "time": t.strftime("%Y-%m-%d %H:%M")},
+                "arrival_airport": {"id": destination, "time": arrive.strftime("%Y-%m-%d %H:%M")},
+                "airline": airline,
+                "flight_number": f"{prefix} {rng.randrange(100, 999)}",
+                "duration": int((arrive - t).total_seconds() // 60),
+            })
+            t = arrive + timedelta(minutes=rng.randrange(50, 150, 5))
+        flights.append({
+            "flights": segments,
+            "price": rng.randrange(5000, 40000, 100),
+            "type": "One way",
+        })
+    return {
+        "search_metadata": {"status": "Success", "google_flights_url": "https://www.google.com/travel/flights"},
+        "best_flights": flights[:3],
+        "other_flights": flights[3:],
+        "price_insights": {"typical_price_range": [8000, 20000], "padding": "x" * profile.padding_bytes},
+    }
+
+
+def grok_content(profile: UpstreamProfile) -> str:
+    options = [
+        {
+            "route": f"スタブ経路 {i + 1}",
+            "price": f"¥{5000 + i * 700:,}",
+            "save": f"{10 + i * 5}%",
+            "tips": "負荷試験用のスタブ応答です",
+            "real_fights": [],
+        }
+        for i in range(profile.items)
+    ]
+    return json.dumps(
+        {"hidden_options": options, "avoid_tips": "スタブ応答" + "。" * (profile.padding_bytes // 3)},
+        ensure_ascii=False,
+    )
+
+
+def grok_usage(request: dict, content: str) -> dict:
+    """OpenAI 互換の usage（トークン数は文字数からの概算）"""
+    prompt = sum(len(m.get("content", "")) for m in request.get("messages", []))
+    return {
+        "prompt_tokens": prompt // 2 + 8,
+        "completion_tokens": len(content) // 2,
+        "total_tokens": prompt // 2 + 8 + len(content) // 2,
+    }
+
+
+class StubUpstreams:
+    """SerpApi と Grok を1つのポートで模倣する HTTP/1.1 keep-alive サーバー"""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats: Dict[str, UpstreamStats] = {"serpapi": UpstreamStats(), "grok": UpstreamStats()}
+        self.connections = 0
+        self.server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def snapshot(self) -> dict:
+        return {
+            "connections": self.connections,
+            **{name: asdict(stats) for name, stats in self.stats.items()},
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+                headers = {
+                    k.strip().lower(): v.strip()
+                    for k, v in (line.split(":", 1) for line in header_lines if ":" in line)
+                }
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+                await self._dispatch(method, target, body, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        url = urlsplit(target)
+        if url.path == "/__stats":
+            await self._send(writer, 200, json.dumps(self.snapshot()).encode())
+        elif url.path == "/__reset":
+            self.stats = {"serpapi": UpstreamStats(), "grok": UpstreamStats()}
+            self.connections = 0
+            await self._send(writer, 200, b"{}")
+        elif url.path == "/search":
+            await self._upstream(writer, "serpapi", self.config.serpapi, lambda: self._serpapi(url.query))
+        elif url.path == "/v1/chat/completions":
+            request = json.loads(body or b"{}")
+            if request.get("stream"):
+                await self._upstream(writer, "grok", self.config.grok, None, request)
+            else:
+                await self._upstream(writer, "grok", self.config.grok, lambda: self._grok(request))
+        else:
+            await self._send(writer, 404, b'{"error":"not found"}')
+
+    async def _upstream(self, writer, name: str, profile: UpstreamProfile, build, request: Optional[dict] = None) -> None:
+        stats = self.stats[name]
+        stats.calls += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            delay = profile.sample_delay(self.rng)
+            if self.rng.random() < profile.error_rate:
+                await asyncio.sleep(delay * self.rng.random())
+                stats.errors += 1
+                stats.bytes_sent += await self._send(writer, self.rng.choice((429, 500, 503)), b'{"error":"injected"}')
+            elif build is None:
+                stats.bytes_sent += await self._stream_grok(writer, profile, delay, request or {})
+            else:
+                await asyncio.sleep(delay)
+                stats.bytes_sent += await self._send(writer, 200, build())
+        finally:
+            stats.in_flight -= 1
+
+    def _serpapi(self, query: str) -> bytes:
+        params = {k: v[0] for k, v in parse_qs(query).items()}
+        payload = serpapi_payload(
+            params.get("departure_id", ""), params.get("arrival_id", ""),
+            params.get("outbound_date", ""), self.config.serpapi,
+        )
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _grok(self, request: dict) -> bytes:
+        content = grok_content(self.config.grok)
+        return json.dumps(
+            {
+                "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": grok_usage(request, content),
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    async def _stream_grok(
+        self, writer: asyncio.StreamWriter, profile: UpstreamProfile, delay: float, request: dict
+    ) -> int:
+        """推論（全体の4割）の後、残りの時間をかけて内容を分割して送る"""
+        content = grok_content(profile)
+        chunks = [content[i:i + 40] for i in range(0, len(content), 40)]
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        sent = 0
+        await asyncio.sleep(delay * 0.4)
+        step = delay * 0.6 / max(1, len(chunks))
+        for piece in chunks:
+            event = {"choices": [{"delta": {"content": piece}}]}
+            sent += self._write_chunk(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+            await asyncio.sleep(step)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event = {"choices": [], "usage": grok_usage(request, content)}
+            sent += self._write_chunk(writer, f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        sent += self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return sent
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> int:
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        return len(data)
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, body: bytes) -> int:
+        writer.write(
+            f"HTTP/1.1 {status} STUB\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        return len(body)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """上流プロファイルのコマンドライン引数（loadtest.py と共通）"""
+    defaults = StubConfig()
+    for name, profile in (("serpapi", defaults.serpapi), ("grok", defaults.grok)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, help=f"{name} のレイテンシ中央値（既定 {profile.median_ms:g}）")
+        parser.add_argument(f"--{name}-sigma", type=float, help=f"{name} の対数正規分布の形状（既定 {profile.sigma:g}）")
+        parser.add_argument(f"--{name}-error-rate", type=float, help=f"{name} のエラー率 0〜1（既定 {profile.error_rate:g}）")
+        parser.add_argument(f"--{name}-items", type=int, help=f"{name} の応答件数（既定 {profile.items}）")
+        parser.add_argument(f"--{name}-padding-bytes", type=int, help=f"{name} の応答に足すバイト数（既定 {profile.padding_bytes}）")
+
+
+def apply_profile_arguments(config: StubConfig, args: argparse.Namespace) -> StubConfig:
+    """指定された引数だけを config に上書きする"""
+    for name in ("serpapi", "grok"):
+        profile = getattr(config, name)
+        for attr, arg in (("median_ms", "latency_ms"), ("sigma", "sigma"), ("error_rate", "error_rate"),
+                          ("items", "items"), ("padding_bytes", "padding_bytes")):
+            value = getattr(args, f"{name}_{arg}", None)
+            if value is not None:
+                setattr(profile, attr, value)
+    return config
+
+
+def config_from_json(text: str) -> StubConfig:
+    data = json.loads(text)
+    return StubConfig(
+        serpapi=UpstreamProfile(**data["serpapi"]),
+        grok=UpstreamProfile(**data["grok"]),
+        seed=data.get("seed", 0),
+    )
+
+
+async def serve(config: StubConfig, host: str, port: int) -> None:
+    stub = StubUpstreams(config)
+    base = await stub.start(host, port)
+    # 親プロセスがポートを読み取れるよう、最初の1行に JSON で出力する
+    print(json.dumps({"base_url": base}), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+def parse_args(argv=None) -> Tuple[StubConfig, argparse.Namespace]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--config-json", help="StubConfig を JSON で指定（loadtest.py が使用）")
+    parser.add_argument("--seed", type=int, default=0)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    config = config_from_json(args.config_json) if args.config_json else StubConfig(seed=args.seed)
+    return apply_profile_arguments(config, args), args
+
+
+def main() -> None:
+    config, args = parse_args()
+    try:
+        asyncio.run(serve(config, args.host, args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+アドミッション制御のクライアント識別
+"""
+import pytest
+from starlette.requests import Request
+
+from app.services.admission import AdmissionController, AdmissionRejected, trust_proxy_from_env
+
+
+def make_request(forwarded_for: str, host: str = "203.0.113.7") -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/analyze",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode("latin-1"))],
+        "client": (host, 50000),
+    })
+
+
+def test_spoofed_forwarded_for_gets_no_new_bucket_when_trust_is_off():
+    admission = AdmissionController(client_rate=0.001, client_burst=2.0)
+
+    for i in range(2):
+        admission.check_rate(admission.client_key(make_request(f"198.51.100.{i}")))
+    assert list(admission._buckets) == ["203.0.113.7"]
+
+    # 毎回別の X-Forwarded-For を送っても同じ接続元のバケットから消費される
+    with pytest.raises(AdmissionRejected):
+        admission.check_rate(admission.client_key(make_request("198.51.100.99")))
+    assert list(admission._buckets) == ["203.0.113.7"]
+
+
+def test_forwarded_for_is_used_when_trust_is_on():
+    admission = AdmissionController(trust_proxy=True)
+    assert admission.client_key(make_request("198.51.100.1, 10.0.0.1")) == "198.51.100.1"
+
+
+def test_trust_proxy_defaults_to_vercel_only(monkeypatch):
+    monkeypatch.delenv("ADMISSION_TRUST_PROXY", raising=False)
+    monkeypatch.delenv("VERCEL", raising=False)
+    assert trust_proxy_from_env() is False
+    monkeypatch.setenv("VERCEL", "1")
+    assert trust_proxy_from_env() is True
+    monkeypatch.setenv("ADMISSION_TRUST_PROXY", "false")
+    assert trust_proxy_from_env() is False
@@ -0,0 +1,30 @@
+"""
+SQLite キャッシュのロック待ち（イベントループを止めないよう timeout で打ち切る）
+"""
+import sqlite3
+import time
+
+from app.services.cache import SQLiteCacheBackend
+
+
+def test_locked_database_is_a_fast_miss(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCacheBackend(path, ttl=600, max_entries=10, timeout=0.05)
+    cache.set("cached", b"value")
+
+    # 別のプロセスが書き込みロックを持ったままにする
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.perf_counter()
+        cache.set("new", b"value")
+        entry = cache.get("cached")
+        elapsed = time.perf_counter() - start
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    assert elapsed < 1.0
+    # WAL なので読み出しはロック中でもできる（LRU の順序の更新だけ省く）
+    assert entry is not None and entry.value == b"value"
+    assert cache.get("new") is None
@@ -0,0 +1,76 @@
+"""
+運賃集約の成績（自分で打ち切った呼び出しでプロバイダーを不利にしない）
+"""
+import asyncio
+from typing import Optional
+
+from app.clients.fare_aggregator import FareAggregator
+from app.clients.fare_provider import FareProvider
+from app.clients.resilience import Deadline
+from app.models.schemas import FlightOffer, RawFlightData
+
+
+class StubProvider(FareProvider):
+    """delay 秒待ってから、重ならない便を count 件返すスタブ"""
+
+    def __init__(self, name: str, delay: float, count: int = 10):
+        self.name = name
+        self.delay = delay
+        self.count = count
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline: Optional[Deadline] = None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        offers = [
+            FlightOffer(
+                airline=self.name, flight_number=f"{self.name} {i}",
+                departure_time="2026-12-01 08:00", arrival_time="2026-12-01 10:00",
+                price=10000.0 + i, currency="JPY",
+            )
+            for i in range(self.count)
+        ]
+        return RawFlightData(source=self.name, offers=offers)
+
+
+def run_requests(aggregator: FareAggregator, n: int, budget: Optional[float] = None) -> None:
+    async def run():
+        for _ in range(n):
+            deadline = Deadline(budget) if budget is not None else None
+            await aggregator.get_flight_offers("HND", "KIX", "2026-12-01", deadline)
+
+    asyncio.run(run())
+
+
+def test_slow_provider_cut_by_min_offers_is_not_excluded():
+    fast, slow = StubProvider("fast", 0.01), StubProvider("slow", 0.2)
+    aggregator = FareAggregator([fast, slow], min_offers=10, probe_every=0)
+
+    run_requests(aggregator, 8)
+
+    # 毎回 fast だけで min_offers がそろい slow は打ち切られるが、遅さとしては数えない
+    assert slow.calls == 8
+    assert aggregator.stats["slow"].used_rate == 1.0
+    assert slow in aggregator.ranked()
+
+
+def test_slow_provider_cut_by_grace_is_not_excluded():
+    fast, slow = StubProvider("fast", 0.01, count=2), StubProvider("slow", 0.2)
+    aggregator = FareAggregator([fast, slow], min_offers=10, grace=0.02, probe_every=0)
+
+    run_requests(aggregator, 8)
+
+    assert slow.calls == 8
+    assert aggregator.stats["slow"].used_rate == 1.0
+    assert slow in aggregator.ranked()
+
+
+def test_provider_missing_the_deadline_is_ranked_down():
+    fast, slow = StubProvider("fast", 0.01, count=2), StubProvider("slow", 0.2)
+    aggregator = FareAggregator([fast, slow], min_offers=10, grace=1.0, probe_every=0)
+
+    # grace より先に締め切りが来る（slow は間に合わなかった）
+    run_requests(aggregator, 4, budget=0.05)
+
+    assert aggregator.stats["slow"].used_rate < 1.0
+    assert slow not in aggregator.ranked()
@@ -0,0 +1,25 @@
+"""
+運賃キャッシュと人気度のキー（日程未指定は実際に取得する日付に揃える）
+"""
+from app.clients.flight_data_client import default_outbound_date
+from app.models.schemas import RawFlightData
+from app.services.cache import MemoryCacheBackend
+from app.services.fare_cache import FareCache
+from app.services.popularity import PopularityTracker
+
+
+def test_unspecified_date_shares_entry_with_resolved_date():
+    cache = FareCache(MemoryCacheBackend(ttl=600, max_entries=10))
+    cache.set("hnd", "kix", None, RawFlightData(offers=[], source="serpapi"))
+
+    day = default_outbound_date()
+    assert FareCache.make_key("HND", "KIX", None) == FareCache.make_key("HND", "KIX", day)
+    assert cache.get("HND", "KIX", day) is not None
+
+
+def test_popularity_counts_unspecified_and_resolved_date_as_one_route():
+    tracker = PopularityTracker(directory=None)
+    tracker.record("HND", "KIX")
+    tracker.record("HND", "KIX", default_outbound_date())
+
+    assert tracker.top(5) == [(("HND", "KIX", default_outbound_date()), 2.0)]
@@ -0,0 +1,53 @@
+"""
+運賃履歴（insight の窓と、行数上限での書き直し）
+"""
+import time
+
+import numpy as np
+
+from app.services.fare_history import COLUMNS, FareHistory
+
+
+def columns(prices, observed_at) -> dict:
+    n = len(prices)
+    return {
+        "travel_date": np.zeros(n),
+        "observed_at": np.asarray(observed_at),
+        "airline": np.zeros(n),
+        "dep_minute": np.zeros(n),
+        "price": np.asarray(prices, dtype=float),
+    }
+
+
+def test_insight_summarizes_only_the_newest_window(tmp_path):
+    history = FareHistory(str(tmp_path), window_rows=100)
+    now = int(time.time())
+    # 古い行は高く、新しい 100 行は 10000〜10990
+    history.append_columns("HND", "KIX", columns([90000] * 400, [now - 60 * 86400] * 400))
+    history.append_columns("HND", "KIX", columns(range(10000, 11000, 10), [now] * 100))
+
+    insight = history.insight("HND", "KIX", 10495)
+
+    assert insight.sample_size == 100
+    assert insight.median_price == 10495
+    assert insight.cheaper_than_percent == 50
+    assert insight.min_price_30d == 10000
+
+    # 行が増えたら要約を計算し直す
+    history.append_columns("HND", "KIX", columns([5000] * 100, [now] * 100))
+    assert history.insight("HND", "KIX", 10495).min_price_30d == 5000
+
+
+def test_route_over_max_rows_keeps_newest_half(tmp_path):
+    history = FareHistory(str(tmp_path), max_rows=100)
+    now = int(time.time())
+    history.append_columns("HND", "KIX", columns(range(60), [now] * 60))
+    assert history.count("HND", "KIX") == 60
+
+    history.append_columns("HND", "KIX", columns(range(60, 120), [now] * 60))
+
+    cols = history.columns("HND", "KIX")
+    assert len(cols) == 50
+    assert cols.price.tolist() == list(range(70, 120))
+    for name, dtype in COLUMNS.items():
+        assert (tmp_path / "HND-KIX" / f"{name}.{dtype[1:]}").stat().st_size == 50 * np.dtype(dtype).itemsize
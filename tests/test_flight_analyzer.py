@@ -0,0 +1,49 @@
+"""
+LLM 分析結果の検証（不正な出力はキャッシュしない）
+"""
+import asyncio
+
+from app.clients.llm_client import LLMClient
+from app.services.analysis_cache import AnalysisCache
+from app.services.cache import MemoryCacheBackend
+from app.services.fare_cache import FareCache
+from app.services.flight_analyzer import FlightAnalyzerService
+
+
+class MalformedLLMClient(LLMClient):
+    """1件だけ必須項目の欠けたオプションを返す Grok スタブ"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def analyze_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        self.calls += 1
+        return {
+            "hidden_options": [
+                {"route": "HND → ICN → KIX", "price": "¥20,000", "save": "10%", "tips": "t"},
+                {"route": "HND → KIX", "save": "0%"},
+            ],
+            "avoid_tips": "tips",
+        }
+
+
+def test_malformed_option_is_dropped_and_not_cached():
+    llm = MalformedLLMClient()
+    service = FlightAnalyzerService(
+        llm_client=llm,
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=10)),
+        analysis_cache=AnalysisCache(MemoryCacheBackend(ttl=3600, max_entries=10)),
+    )
+
+    async def run():
+        return [await service.analyze_route("HND", "KIX", "2026-12-01") for _ in range(2)]
+
+    first, second = asyncio.run(run())
+
+    routes = [option.route for option in first.hidden_options]
+    assert "HND → ICN → KIX" in routes and "HND → KIX" not in routes
+    assert second.avoid_tips == "tips"
+    # 不正な出力はキャッシュされず、次の検索で分析し直す
+    assert llm.calls == 2
+    assert len(service.analysis_cache.backend) == 0
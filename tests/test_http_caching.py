@@ -0,0 +1,31 @@
+"""
+条件付き応答と圧縮（304 のメトリクス、断片キャッシュのキー）
+"""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import HTTP_RESPONSES
+from app.services.cache import MemoryCacheBackend
+from app.templating import FragmentCache
+
+
+def test_not_modified_keeps_route_label():
+    client = TestClient(app)
+    headers = {"Accept-Encoding": "br, gzip"}
+    first = client.get("/", headers=headers)
+    assert first.status_code == 200
+
+    label = ("GET", "/", "304")
+    before = HTTP_RESPONSES.value(*label)
+    second = client.get("/", headers={**headers, "If-None-Match": first.headers["etag"]})
+
+    assert second.status_code == 304
+    assert second.headers["etag"] == first.headers["etag"]
+    assert HTTP_RESPONSES.value(*label) == before + 1
+
+
+def test_fragment_key_depends_on_static_assets(monkeypatch):
+    key = FragmentCache(MemoryCacheBackend(ttl=60, max_entries=10)).key("index.html")
+    monkeypatch.setattr("app.templating.static_digest", lambda: "changed")
+
+    assert FragmentCache(MemoryCacheBackend(ttl=60, max_entries=10)).key("index.html") != key
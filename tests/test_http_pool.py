@@ -0,0 +1,104 @@
+"""
+共有 HTTP クライアントの接続再利用
+"""
+import asyncio
+import json
+
+import httpx
+
+from app.clients.flight_data_client import FlightDataClient
+from app.clients.http_pool import UpstreamHttpConfig
+from app.clients.llm_client import LLMClient
+
+SERPAPI_BODY = json.dumps({"best_flights": []}).encode()
+GROK_BODY = json.dumps({
+    "choices": [{"message": {"content": json.dumps({"hidden_options": [], "avoid_tips": "stub"})}}],
+}).encode()
+
+
+class StubServer:
+    """HTTP/1.1 keep-alive 対応の最小スタブ。受け付けた TCP 接続数を数える"""
+
+    def __init__(self):
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                length = 0
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                body = GROK_BODY if request_line.startswith("POST") else SERPAPI_BODY
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def test_shared_clients_reuse_one_connection_per_upstream(monkeypatch):
+    monkeypatch.setenv("SERPAPI_API_KEY", "stub")
+    monkeypatch.setenv("GROK_API_KEY", "xai-stub-key-for-local-testing")
+    rounds = 5
+
+    async def run():
+        stub = StubServer()
+        base = await stub.start()
+
+        # 共有クライアント（lifespan と同じ構成）
+        serpapi_http = UpstreamHttpConfig.from_env("SERPAPI", 20.0).create_client()
+        grok_http = UpstreamHttpConfig.from_env("GROK", 30.0).create_client()
+        flight_client = FlightDataClient(http_client=serpapi_http)
+        flight_client.base_url = f"{base}/search"
+        llm_client = LLMClient(http_client=grok_http)
+        llm_client.base_url = f"{base}/v1/chat/completions"
+        for _ in range(rounds):
+            raw = await flight_client.get_flight_offers("HND", "CTS", "2026-03-01")
+            assert not raw.is_mock
+            await llm_client.analyze_flight_route("HND", "CTS", "2026-03-01", raw_data=raw)
+        await serpapi_http.aclose()
+        await grok_http.aclose()
+        pooled = stub.connections
+
+        # 従来方式: 呼び出しごとに新しいクライアントを生成
+        stub.connections = 0
+        for _ in range(rounds):
+            async with httpx.AsyncClient() as client:
+                await client.get(f"{base}/search")
+            async with httpx.AsyncClient() as client:
+                await client.post(f"{base}/v1/chat/completions", json={})
+        per_call = stub.connections
+
+        await stub.stop()
+        return pooled, per_call
+
+    assert asyncio.run(run()) == (2, 2 * rounds)
+
+
+def test_http2_does_not_fall_back(capsys):
+    # h2 は requirements.txt の httpx[http2] で入る
+    client = UpstreamHttpConfig(timeout=5.0, http2=True).create_client()
+    asyncio.run(client.aclose())
+
+    assert "falling back" not in capsys.readouterr().out
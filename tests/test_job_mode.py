@@ -0,0 +1,36 @@
+"""
+ジョブモード（サーバーレス環境では有効にしない）
+"""
+from fastapi.testclient import TestClient
+
+from app import dependencies
+from app.main import app
+
+
+def test_job_mode_runs_on_a_long_running_server(monkeypatch):
+    monkeypatch.setenv("ANALYZE_JOB_MODE", "true")
+    monkeypatch.delenv("VERCEL", raising=False)
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+
+    assert dependencies.job_mode_enabled()
+
+
+def test_job_mode_is_refused_on_serverless(monkeypatch, capsys):
+    monkeypatch.setenv("ANALYZE_JOB_MODE", "true")
+    monkeypatch.setenv("VERCEL", "1")
+    monkeypatch.setattr(dependencies, "_job_mode_refused", False)
+
+    assert not dependencies.job_mode_enabled()
+    assert not dependencies.job_mode_enabled()
+    assert capsys.readouterr().out.count("not supported on serverless") == 1
+
+
+def test_job_polling_does_not_start_workers_on_serverless(monkeypatch):
+    monkeypatch.setenv("ANALYZE_JOB_MODE", "true")
+    monkeypatch.setenv("VERCEL", "1")
+    monkeypatch.setattr(app.state, "job_workers", None, raising=False)
+    client = TestClient(app)
+
+    assert client.get("/api/jobs/unknown").status_code == 404
+    assert client.get("/analyze/jobs/unknown").status_code == 404
+    assert app.state.job_workers is None
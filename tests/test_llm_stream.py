@@ -0,0 +1,82 @@
+"""
+Grok のストリーミング分析とサーキットブレーカー
+"""
+import asyncio
+import json
+
+import httpx
+
+from app.clients.llm_client import LLMClient
+from app.clients.resilience import CircuitBreaker
+
+
+def make_client(monkeypatch, handler) -> LLMClient:
+    monkeypatch.setenv("GROK_API_KEY", "xai-test-key-0123456789abcdef")
+    return LLMClient(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    """reset_timeout を過ぎた open（次の allow で half_open の試行を1件通す）にする"""
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0.0
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def sse(*contents: str, done: bool = True) -> bytes:
+    lines = [
+        'data: {"choices": [{"delta": {"content": %s}}]}\n\n' % json.dumps(content)
+        for content in contents
+    ]
+    return ("".join(lines) + ("data: [DONE]\n\n" if done else "")).encode()
+
+
+OPTION = '{"hidden_options": [{"route": "HND → ICN → KIX", "price": "¥20,000", "save": "10%", "tips": "t"}'
+
+
+def test_cancelled_stream_returns_half_open_trial(monkeypatch):
+    async def slow_body():
+        yield sse(OPTION + ",", done=False)
+        await asyncio.sleep(10)
+
+    client = make_client(monkeypatch, lambda request: httpx.Response(200, content=slow_body()))
+    breaker = client.guard.breaker
+    open_breaker(breaker)
+
+    async def run():
+        received = asyncio.Event()
+
+        async def consume():
+            async for kind, _ in client.stream_flight_route("HND", "KIX"):
+                received.set()
+
+        task = asyncio.create_task(consume())
+        await received.wait()
+        # 上流の続きを待っている間にクライアントが切断する
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    # 試行が返却され、次の呼び出しが half_open の試行として通る
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_invalid_stream_json_does_not_trip_breaker(monkeypatch):
+    # 閉じ括弧のないまま終わった応答
+    client = make_client(monkeypatch, lambda request: httpx.Response(200, content=sse(OPTION)))
+    breaker = client.guard.breaker
+    open_breaker(breaker)
+
+    async def run():
+        return [item async for item in client.stream_flight_route("HND", "KIX")]
+
+    events = asyncio.run(run())
+
+    kind, result = events[-1]
+    assert kind == "result" and result.get("is_partial")
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,65 @@
+"""
+事前取得した運賃・分析に、日程未指定の検索がヒットすること
+"""
+import asyncio
+
+from app.clients.flight_data_client import FlightDataClient
+from app.clients.llm_client import LLMClient
+from app.services.analysis_cache import AnalysisCache
+from app.services.cache import MemoryCacheBackend
+from app.services.fare_cache import FareCache
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.prefetch import PrefetchConfig, RouteRefresher
+
+
+class CountingFlightDataClient(FlightDataClient):
+    """実 API と同じく use_mock=False として振る舞い、呼び出し回数を数える"""
+
+    def __init__(self):
+        super().__init__()
+        self.use_mock = False
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        self.calls += 1
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+class CountingLLMClient(LLMClient):
+    """キャッシュされる（モックでない）分析を返し、呼び出し回数を数える"""
+
+    def __init__(self):
+        super().__init__()
+        self.use_mock = False
+        self.calls = 0
+
+    async def analyze_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        self.calls += 1
+        return {"hidden_options": [], "avoid_tips": "prefetched"}
+
+
+def test_undated_request_hits_prefetched_analysis():
+    flight, llm = CountingFlightDataClient(), CountingLLMClient()
+    service = FlightAnalyzerService(
+        llm_client=llm,
+        flight_data_client=flight,
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=100)),
+        analysis_cache=AnalysisCache(MemoryCacheBackend(ttl=3600, max_entries=100)),
+    )
+    service.popularity.directory = None
+    service.popularity.record("HND", "KIX")
+    refresher = RouteRefresher(service, PrefetchConfig(min_count=1.0))
+
+    async def run():
+        report = await refresher.run_once()
+        assert (report.fares_refreshed, report.analyses_refreshed) == (1, 1)
+        fare_calls, llm_calls = flight.calls, llm.calls
+        result = await service.analyze_route("HND", "KIX")
+        return flight.calls - fare_calls, llm.calls - llm_calls, result
+
+    fare_calls, llm_calls, result = asyncio.run(run())
+
+    assert (fare_calls, llm_calls) == (0, 0)
+    assert result.avoid_tips == "prefetched"
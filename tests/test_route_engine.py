@@ -0,0 +1,47 @@
+"""
+ローカル経路エンジン（区間の更新と日付の絞り込み）
+"""
+from app.clients.flight_data_client import default_outbound_date
+from app.models.schemas import FlightOffer, FlightSegment
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.route_engine import RouteGraph
+
+
+def make_offer(path: list, day: str, price: float, flight_number: str = "XX1") -> FlightOffer:
+    segments = [
+        FlightSegment(
+            departure_airport=a, arrival_airport=b,
+            departure_time=f"{day} {8 + 3 * i:02d}:00", arrival_time=f"{day} {10 + 3 * i:02d}:00",
+            airline="XX", flight_number=flight_number,
+        )
+        for i, (a, b) in enumerate(zip(path, path[1:]))
+    ]
+    return FlightOffer(
+        airline="XX", flight_number=flight_number,
+        departure_time=segments[0].departure_time, arrival_time=segments[-1].arrival_time,
+        price=price, currency="JPY", segments=segments,
+    )
+
+
+def test_refreshed_fare_replaces_known_leg():
+    graph = RouteGraph()
+    graph.add_offers([make_offer(["HND", "KIX"], "2026-12-01", 20000)])
+    graph.add_offers([make_offer(["HND", "KIX"], "2026-12-01", 15000)])
+
+    assert len(graph) == 1
+    assert graph.cheapest_direct("HND", "KIX") == 15000
+
+
+def test_undated_search_uses_only_the_resolved_day():
+    service = FlightAnalyzerService()
+    day = default_outbound_date()
+    service.route_graph.add_offers([
+        make_offer(["HND", "KIX"], day, 20000, "XX1"),
+        # 別の日の Hidden City 区間は候補に混ぜない
+        make_offer(["HND", "KIX", "FUK"], "2020-01-01", 9000, "XX2"),
+        make_offer(["HND", "KIX", "CTS"], day, 12000, "XX3"),
+    ])
+
+    options = service.find_local_options("HND", "KIX")
+
+    assert [option.real_fights[0].flight_number for option in options] == ["XX3"]
@@ -0,0 +1,142 @@
+"""
+シングルフライト（同一リクエストの合流）
+"""
+import asyncio
+
+from app.clients.flight_data_client import FlightDataClient
+from app.clients.llm_client import LLMClient
+from app.services.cache import MemoryCacheBackend
+from app.services.fare_cache import FareCache
+from app.services.flight_analyzer import FlightAnalyzerService
+from app.services.single_flight import SingleFlight
+
+
+class Upstream:
+    """呼び出し回数を数え、release が set されるまで待つ上流"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError("upstream failure")
+        return "result"
+
+
+async def start_waiters(flights: SingleFlight, upstream: Upstream, n: int) -> list:
+    tasks = [asyncio.create_task(flights.do("key", upstream)) for _ in range(n)]
+    # 全員が合流するまで進める
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_callers_share_one_upstream_call():
+    async def run():
+        flights, upstream = SingleFlight(), Upstream()
+        tasks = await start_waiters(flights, upstream, 20)
+        upstream.release.set()
+        return await asyncio.gather(*tasks), upstream, flights
+
+    results, upstream, flights = asyncio.run(run())
+
+    assert results == ["result"] * 20
+    assert upstream.calls == 1
+    assert (flights.executions, flights.coalesced, flights.in_flight()) == (1, 19, 0)
+
+
+def test_error_propagates_to_every_waiter():
+    async def run():
+        flights, upstream = SingleFlight(), Upstream(fail=True)
+        tasks = await start_waiters(flights, upstream, 20)
+        upstream.release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True), upstream, flights
+
+    outcomes, upstream, flights = asyncio.run(run())
+
+    assert upstream.calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert flights.in_flight() == 0
+
+
+def test_cancelling_one_waiter_keeps_the_shared_call():
+    async def run():
+        flights, upstream = SingleFlight(), Upstream()
+        tasks = await start_waiters(flights, upstream, 10)
+        for task in tasks[:5]:
+            task.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True), upstream
+
+    outcomes, upstream = asyncio.run(run())
+
+    assert all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes[:5])
+    assert outcomes[5:] == ["result"] * 5
+    assert upstream.calls == 1 and not upstream.cancelled
+
+
+def test_cancelling_every_waiter_cancels_the_shared_call():
+    async def run():
+        flights, upstream = SingleFlight(), Upstream()
+        tasks = await start_waiters(flights, upstream, 10)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        return upstream, flights
+
+    upstream, flights = asyncio.run(run())
+
+    assert upstream.cancelled
+    assert flights.in_flight() == 0
+
+
+class CountingFlightDataClient(FlightDataClient):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def get_flight_offers(self, departure, arrival, date=None, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        data = self._get_mock_data(departure, arrival, date)
+        data.is_mock = False
+        return data
+
+
+class CountingLLMClient(LLMClient):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def analyze_flight_route(self, departure, arrival, date=None, raw_data=None, **context):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {"hidden_options": [], "avoid_tips": "shared"}
+
+
+def test_concurrent_analyze_route_calls_each_upstream_once():
+    n = 20
+    flight, llm = CountingFlightDataClient(), CountingLLMClient()
+    service = FlightAnalyzerService(
+        llm_client=llm,
+        flight_data_client=flight,
+        fare_cache=FareCache(MemoryCacheBackend(ttl=600, max_entries=100)),
+    )
+
+    async def run():
+        return await asyncio.gather(*[service.analyze_route("HND", "CTS", "2026-12-01") for _ in range(n)])
+
+    results = asyncio.run(run())
+
+    assert len(results) == n
+    assert (flight.calls, llm.calls) == (1, 1)